@@ -0,0 +1,185 @@
+"""End-to-end performance benchmarks for the VFD subsystem.
+
+Runs VFDController and the live_state broadcaster against the in-repo Frenic
+simulator, so no drives are needed:
+
+    poetry run python -m benchmarks.vfd_benchmark --devices 8 --baudrate 9600
+"""
+from typing import List
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import time
+
+import numpy as np
+from sanic.log import logger
+
+from levitree_rwis_api.vfd.FrenicSimulator import FrenicSimulator
+from levitree_rwis_api.vfd.StateBroadcaster import StateBroadcaster
+from levitree_rwis_api.vfd.VFDController import VFDController
+
+FREQUENCY_STEPS = itertools.count()
+
+
+def summarize(samples: List[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+async def bench_sweep(controller: VFDController, sweeps: int) -> dict:
+    vfd_ids = list(controller.vfds)
+    durations = []
+    for _ in range(sweeps):
+        start = time.perf_counter()
+        for vfd_id in vfd_ids:
+            await controller.poll_vfd(vfd_id)
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+async def bench_command_rate(controller: VFDController, duration: float) -> dict:
+    vfd_id = next(iter(controller.vfds))
+    commands = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        await controller.set_frequency(vfd_id, 20 + commands % 20)
+        commands += 1
+    return {"commands": commands, "commands_per_s": round(commands / (time.perf_counter() - start), 1)}
+
+
+async def bench_slider_burst(controller: VFDController, simulator: FrenicSimulator, bursts: int, burst_size: int) -> dict:
+    """Concurrent frequency writes to one drive, as sent by an HMI slider."""
+    vfd_id = next(iter(controller.vfds))
+    requests = simulator.requests
+    settle_times = []
+    for _ in range(bursts):
+        start = time.perf_counter()
+        await asyncio.gather(*[controller.set_frequency(vfd_id, 10 + next(FREQUENCY_STEPS) % 5000 * 0.01) for _ in range(burst_size)])
+        settle_times.append(time.perf_counter() - start)
+    return {**summarize(settle_times), "requests": bursts * burst_size, "bus_transactions": simulator.requests - requests}
+
+
+async def bench_write_latency(controller: VFDController, duration: float, interval: float) -> dict:
+    vfd_ids = list(controller.vfds)
+    polling = [asyncio.create_task(controller.modbus_polling_loop(bus)) for bus in controller.buses]
+    latencies = []
+    try:
+        await asyncio.sleep(0.5)
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            vfd_id = vfd_ids[len(latencies) % len(vfd_ids)]
+            sent = time.perf_counter()
+            await controller.set_frequency(vfd_id, 20 + len(latencies) % 20)
+            latencies.append(time.perf_counter() - sent)
+            await asyncio.sleep(interval)
+    finally:
+        for task in polling:
+            task.cancel()
+        await asyncio.gather(*polling, return_exceptions=True)
+    return summarize(latencies)
+
+
+async def bench_broadcast(controller: VFDController, subscribers: int, frames: int) -> dict:
+    broadcaster = StateBroadcaster(controller, min_interval=0)
+    runner = asyncio.create_task(broadcaster.run())
+    received = 0
+    received_at = 0.0
+    published_at = 0.0
+    all_received = asyncio.Event()
+
+    async def subscriber(delta: bool):
+        nonlocal received, received_at
+        subscription = broadcaster.subscribe(delta=delta)
+        while True:
+            frame = await subscription.next_frame()
+            # Stand-in for ws.send, the encoded frame is shared by every subscriber
+            frame.encode()
+            received += 1
+            if received == subscribers:
+                received_at = time.perf_counter()
+                all_received.set()
+
+    async def watch_publish(generation: int):
+        nonlocal published_at
+        await controller.wait_for_generation(generation)
+        published_at = time.perf_counter()
+
+    tasks = [asyncio.create_task(subscriber(index % 2 == 1)) for index in range(subscribers)]
+    # Let every subscriber take its initial snapshot first
+    await asyncio.sleep(0.05)
+    vfd_ids = list(controller.vfds)
+    costs = []
+    try:
+        for frame in range(frames):
+            vfd = controller.vfds[vfd_ids[frame % len(vfd_ids)]]
+            received = 0
+            all_received.clear()
+            watcher = asyncio.create_task(watch_publish(controller.generation))
+            # Always a new value, writes repeating the confirmed one are skipped and would not change state
+            await controller.set_frequency(vfd.id, 10 + next(FREQUENCY_STEPS) % 5000 * 0.01)
+            await asyncio.gather(watcher, all_received.wait())
+            costs.append(received_at - published_at)
+    finally:
+        for task in tasks + [runner]:
+            task.cancel()
+        await asyncio.gather(*tasks, runner, return_exceptions=True)
+    result = summarize(costs)
+    result["subscribers"] = subscribers
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="VFD subsystem benchmarks against the Frenic simulator")
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--baudrate", type=int, default=9600)
+    parser.add_argument("--latency", type=float, default=0.005, help="simulated drive turnaround (s)")
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--sweeps", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=5.0, help="duration of timed benchmarks (s)")
+    parser.add_argument("--write-interval", type=float, default=0.05, help="delay between writes under polling load (s)")
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--bursts", type=int, default=20)
+    parser.add_argument("--burst-size", type=int, default=20, help="concurrent frequency writes per slider burst")
+    parser.add_argument("--pty", action="store_true", help="connect over a pseudo terminal instead of TCP loopback")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    simulator = FrenicSimulator(args.devices, baudrate=args.baudrate, latency=args.latency, drop_rate=args.drop_rate)
+    url = await (simulator.serve_pty() if args.pty else simulator.serve_tcp())
+    controller = VFDController(url)
+    for slave_id in simulator.devices:
+        controller.register_vfd(slave_id, f"Simulated {slave_id}", f"SIM{slave_id}")
+    controller.initialize_modbus()
+
+    results = {
+        "config": {"devices": args.devices, "baudrate": args.baudrate, "latency": args.latency, "url": url},
+        "sweep": await bench_sweep(controller, args.sweeps),
+        "command_rate": await bench_command_rate(controller, args.duration),
+        "slider_burst": await bench_slider_burst(controller, simulator, args.bursts, args.burst_size),
+        "write_latency_under_polling": await bench_write_latency(controller, args.duration, args.write_interval),
+        "broadcast": [await bench_broadcast(controller, count, args.frames) for count in args.subscribers],
+    }
+    await simulator.close()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, result in results.items():
+        for entry in result if isinstance(result, list) else [result]:
+            print(f"{name:<28} " + "  ".join(f"{key}={value}" for key, value in entry.items()))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
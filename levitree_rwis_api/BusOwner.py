@@ -0,0 +1,145 @@
+from typing import Callable, Dict
+from sanic.log import logger, LOGGING_CONFIG_DEFAULTS
+
+import asyncio
+import logging.config
+import signal
+import yaml
+
+from levitree_rwis_api.CommandChannel import CommandServer
+from levitree_rwis_api.Metrics import REGISTRY, monitor_event_loop
+from levitree_rwis_api.SensorSuite import SensorSuite
+from levitree_rwis_api.StatePlane import StatePlane
+from levitree_rwis_api.autopilot import AutopilotTypes
+from levitree_rwis_api.autopilot.AutopilotBlueprint import configure_autopilot
+from levitree_rwis_api.autopilot.AutopilotController import AutopilotController
+from levitree_rwis_api.sensors.SensorBlueprint import configure_sensor_suite
+from levitree_rwis_api.vfd import VFDTypes
+from levitree_rwis_api.vfd.VFDBlueprint import configure_modbus_gateway, configure_vfd_controller
+from levitree_rwis_api.vfd.VFDController import VFDController
+
+BUS_OWNER_LOOP_LAG = REGISTRY.histogram("bus_owner_event_loop_lag_seconds", "Delay of event loop wakeups past their scheduled time in the bus owner process").labels()
+
+# Longest a poll fail count change, which does not move the state generation, waits to be mirrored (s)
+MIRROR_INTERVAL = 0.25
+
+
+def command_handlers(vfd_controller: VFDController, sensor_suite: SensorSuite, autopilot_controller: AutopilotController) -> Dict[str, Callable]:
+    """Commands workers may send, arguments arrive as decoded JSON."""
+    return {
+        "vfd.get_vfds": lambda: {id: vfd.model_dump(exclude={"state"}) for id, vfd in vfd_controller.get_vfds().items()},
+        "vfd.get_bus_status": vfd_controller.get_bus_status,
+        "vfd.get_vfd_history": vfd_controller.get_vfd_history,
+        "vfd.get_events": lambda vfd_id=None, start=None, end=None, kinds=None, limit=100:
+            vfd_controller.get_events(vfd_id, start, end, [VFDTypes.EventKind(kind) for kind in kinds or []], limit),
+        "vfd.read_vfd_registers": vfd_controller.read_vfd_registers,
+        "vfd.read_batch": lambda reads, max_age=None: vfd_controller.read_batch([VFDTypes.RegisterRange(**read) for read in reads], max_age=max_age),
+        "vfd.set_frequency": vfd_controller.set_frequency,
+        "vfd.set_drive_mode": lambda vfd_id, drive_mode: vfd_controller.set_drive_mode(vfd_id, VFDTypes.DriveMode(drive_mode)),
+        "vfd.clear_alarm": vfd_controller.clear_alarm,
+        "vfd.refresh_parameters": vfd_controller.refresh_parameters,
+        "vfd.emergency_stop": vfd_controller.emergency_stop,
+        "vfd.set_group_frequency": vfd_controller.set_group_frequency,
+        "vfd.set_group_drive_mode": lambda vfd_ids, drive_mode: vfd_controller.set_group_drive_mode(vfd_ids, VFDTypes.DriveMode(drive_mode)),
+        "sensors.get_sensors": sensor_suite.get_sensors,
+        "sensors.get_samples": sensor_suite.get_samples,
+        "autopilot.get_loops": autopilot_controller.get_loops,
+        "autopilot.get_loop": autopilot_controller.get_loop,
+        "autopilot.enable": autopilot_controller.enable,
+        "autopilot.disable": autopilot_controller.disable,
+        "autopilot.tune": lambda id, params: autopilot_controller.tune(id, AutopilotTypes.TuneLoopParams(**params)),
+        "metrics.render": lambda: REGISTRY.render(skip_empty=True),
+    }
+
+
+async def mirror_state(plane: StatePlane, vfd_controller: VFDController, sensor_suite: SensorSuite):
+    """Copies every changed VFD state and sensor reading into the state plane."""
+    vfds = vfd_controller.get_vfds()
+    vfd_ids = list(vfds)
+    sensor_ids = list(sensor_suite.get_sensors())
+    plane.format(vfd_controller.epoch, vfd_ids, sensor_ids, vfd_controller.event_log.next_id)
+    mirrored_vfds: Dict[str, tuple] = {}
+    mirrored_sensors: Dict[str, dict] = {}
+    while True:
+        vfd_generation = vfd_controller.generation
+        sensor_generation = sensor_suite.generation
+        for index, vfd_id in enumerate(vfd_ids):
+            version = (vfd_controller.state_generations[vfd_id], vfds[vfd_id].poll_fail_count)
+            if mirrored_vfds.get(vfd_id) != version:
+                plane.write_vfd(index, vfd_id, version[0], vfd_controller.states[vfd_id], version[1])
+                mirrored_vfds[vfd_id] = version
+        for index, sensor_id in enumerate(sensor_ids):
+            # Every published reading is a new dict
+            reading = sensor_suite.states[sensor_id]
+            if mirrored_sensors.get(sensor_id) is not reading:
+                plane.write_sensor(index, sensor_id, sensor_generation, reading)
+                mirrored_sensors[sensor_id] = reading
+        # Generations last, so readers never see a generation before its slots
+        plane.set_generations(vfd_generation, vfd_controller.vfd_list_generation, sensor_generation)
+
+        waits = [asyncio.create_task(vfd_controller.wait_for_generation(vfd_generation)),
+                 asyncio.create_task(sensor_suite.wait_for_generation(sensor_generation))]
+        try:
+            await asyncio.wait(waits, timeout=MIRROR_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for wait in waits:
+                wait.cancel()
+
+
+async def mirror_events(plane: StatePlane, vfd_controller: VFDController):
+    """Copies every recorded VFD event into the state plane's event ring."""
+    events = vfd_controller.subscribe_events()
+    try:
+        while True:
+            plane.write_event(await events.get())
+    finally:
+        vfd_controller.unsubscribe_events(events)
+
+
+async def serve(config_path: str, state_plane: str, command_socket: str):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    with open(config_path) as cfgFile:
+        cfg = yaml.load(cfgFile, Loader=yaml.FullLoader)
+        vfd_controller = configure_vfd_controller(cfg)
+        sensor_suite = configure_sensor_suite(cfg)
+        gateway = configure_modbus_gateway(cfg, vfd_controller)
+    sensor_suite.start()
+    vfd_controller.event_log.start()
+    autopilot_controller = await configure_autopilot(cfg, vfd_controller, sensor_suite)
+
+    plane = StatePlane.attach(state_plane)
+    server = CommandServer(command_socket, command_handlers(vfd_controller, sensor_suite, autopilot_controller))
+    # The socket has to exist before the plane is marked ready, workers connect once it is
+    await server.start()
+    if gateway is not None:
+        await gateway.start()
+    tasks = [asyncio.create_task(vfd_controller.modbus_polling_loop(bus_name), name=f"modbus_consumer_{bus_name}") for bus_name in vfd_controller.buses]
+    tasks.append(asyncio.create_task(mirror_state(plane, vfd_controller, sensor_suite), name="state_plane_mirror"))
+    tasks.append(asyncio.create_task(mirror_events(plane, vfd_controller), name="event_ring_mirror"))
+    tasks.append(asyncio.create_task(monitor_event_loop(histogram=BUS_OWNER_LOOP_LAG), name="event_loop_monitor"))
+    logger.info(f"Bus owner serving {len(vfd_controller.vfds)} VFDs on {len(vfd_controller.buses)} buses and {len(sensor_suite.channels)} sensors")
+
+    await stop.wait()
+
+    logger.info("Bus owner shutting down")
+    await autopilot_controller.disable_all()
+    await server.close()
+    if gateway is not None:
+        await gateway.close()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    sensor_suite.stop()
+    vfd_controller.event_log.stop()
+    plane.close()
+
+
+def run_bus_owner(config_path: str, state_plane: str, command_socket: str):
+    """Entry point of the bus owner process, started by the Sanic worker manager."""
+    logging.config.dictConfig(LOGGING_CONFIG_DEFAULTS)
+    logger.setLevel("DEBUG")
+    asyncio.run(serve(config_path, state_plane, command_socket))
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import yaml
+
+from sanic import Blueprint
+from sanic.log import logger
+
+from levitree_rwis_api import BusOwner
+from levitree_rwis_api.BusOwnerClient import BusOwnerClient
+from levitree_rwis_api.StatePlane import StatePlane
+from levitree_rwis_api.vfd import StateBroadcaster
+
+# Passed from the main process to the workers it spawns
+STATE_PLANE_ENV = "LEVITREE_STATE_PLANE"
+COMMAND_SOCKET_ENV = "LEVITREE_COMMAND_SOCKET"
+
+BusOwnerBlueprint = Blueprint("BusOwnerBlueprint")
+
+@BusOwnerBlueprint.listener('main_process_start')
+def create_state_plane(app):
+    config_path = os.environ.get("CONFIG_PATH", "./config.yaml")
+    with open(config_path) as cfgFile:
+        cfg = yaml.load(cfgFile, Loader=yaml.FullLoader)
+        if not cfg.get("bus_owner_process", False):
+            return
+        vfd_slots = sum(1 for modbus_device in cfg.get("modbus_devices") or [] if modbus_device["type"] == "VFD")
+        sensor_slots = len(cfg.get("adcs") or []) + len(cfg.get("distance_sensors") or [])
+    name = f"levitree_{os.getpid()}"
+    app.ctx.state_plane = StatePlane.create(name, vfd_slots, sensor_slots)
+    os.environ[STATE_PLANE_ENV] = name
+    os.environ[COMMAND_SOCKET_ENV] = os.path.join(tempfile.gettempdir(), f"{name}.sock")
+    logger.info(f"Created state plane {name} for {vfd_slots} VFDs and {sensor_slots} sensors")
+
+@BusOwnerBlueprint.listener('main_process_ready')
+def start_bus_owner(app):
+    if not hasattr(app.ctx, 'state_plane'):
+        return
+    app.manager.manage("BusOwner", BusOwner.run_bus_owner, {
+        "config_path": os.environ.get("CONFIG_PATH", "./config.yaml"),
+        "state_plane": os.environ[STATE_PLANE_ENV],
+        "command_socket": os.environ[COMMAND_SOCKET_ENV],
+    })
+
+@BusOwnerBlueprint.listener('main_process_stop')
+def remove_state_plane(app):
+    if not hasattr(app.ctx, 'state_plane'):
+        return
+    app.ctx.state_plane.close()
+    app.ctx.state_plane.unlink()
+
+@BusOwnerBlueprint.listener('before_server_start')
+async def connect_bus_owner(app):
+    state_plane = os.environ.get(STATE_PLANE_ENV)
+    if state_plane is None:
+        # Single process, or bus_owner_process is off: the other blueprints set up the subsystems in this worker
+        return
+    app.ctx.bus_owner = await BusOwnerClient.connect(state_plane, os.environ[COMMAND_SOCKET_ENV])
+    app.ctx.vfd_controller, app.ctx.sensor_suite, app.ctx.autopilot_controller = await app.ctx.bus_owner.create_controllers()
+    app.add_task(app.ctx.vfd_controller.watcher.run(), name="vfd_generation_watcher")
+    app.add_task(app.ctx.vfd_controller.event_watcher.run(), name="vfd_event_watcher")
+    app.add_task(app.ctx.sensor_suite.watcher.run(), name="sensor_generation_watcher")
+    app.ctx.vfd_broadcaster = StateBroadcaster.StateBroadcaster(app.ctx.vfd_controller)
+    app.add_task(app.ctx.vfd_broadcaster.run(), name="vfd_broadcaster")
+    app.ctx.sensor_broadcaster = StateBroadcaster.StateBroadcaster(app.ctx.sensor_suite, min_interval=0.1, stream="sensors")
+    app.add_task(app.ctx.sensor_broadcaster.run(), name="sensor_broadcaster")
+
+@BusOwnerBlueprint.listener('after_server_stop')
+async def disconnect_bus_owner(app):
+    if hasattr(app.ctx, 'bus_owner'):
+        await app.ctx.bus_owner.close()
@@ -0,0 +1,300 @@
+from json import dumps
+from typing import Dict, List, Optional, Set, Tuple
+
+import asyncio
+import time
+
+from levitree_rwis_api.CommandChannel import CommandClient
+from levitree_rwis_api.StatePlane import StatePlane
+from levitree_rwis_api.autopilot import AutopilotTypes
+from levitree_rwis_api.sensors import SensorTypes
+from levitree_rwis_api.vfd import VFDTypes
+from levitree_rwis_api.vfd.EventLog import EVENTS_DROPPED
+
+# How often workers look for new generations in the state plane (s)
+WATCH_INTERVAL = 0.02
+
+
+class GenerationWatcher:
+    """Turns a generation in the state plane into an awaitable, checking it every `WATCH_INTERVAL`.
+
+    One watcher per worker and stream polls the plane, however many
+    websocket and long-polling clients wait on it.
+    """
+
+    def __init__(self, read_generation):
+        self.read_generation = read_generation
+        self.generation = read_generation()
+        self.__generation_event = asyncio.Event()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            generation = self.read_generation()
+            if generation != self.generation:
+                self.generation = generation
+                self.__generation_event.set()
+                self.__generation_event = asyncio.Event()
+
+    async def wait_for_generation(self, generation: int):
+        while self.generation <= generation:
+            await self.__generation_event.wait()
+
+    async def wait(self, changed, timeout: float) -> bool:
+        """Waits until `changed()` returns True, returning False if it did not within `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while not changed():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self.__generation_event.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+
+class EventWatcher:
+    """Hands events from the state plane's event ring to subscribers, checking for new ones every `WATCH_INTERVAL`."""
+
+    def __init__(self, plane: StatePlane, subscriber_queue_size: int = 1000):
+        self.plane = plane
+        self.subscriber_queue_size = subscriber_queue_size
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.next_id = plane.event_sequence
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            sequence = self.plane.event_sequence
+            # Events older than the ring were overwritten, read_event skips those reused while reading
+            for id in range(max(self.next_id, sequence - self.plane.event_slots), sequence):
+                event = self.plane.read_event(id)
+                if event is None:
+                    continue
+                for queue in self.subscribers:
+                    try:
+                        queue.put_nowait(event)
+                    except asyncio.QueueFull:
+                        EVENTS_DROPPED.inc()
+            self.next_id = sequence
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(self.subscriber_queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+
+class RemoteVFDController:
+    """The VFDController interface used by VFDBlueprint, in a worker process.
+
+    State is read from the state plane, commands are sent to the bus owner.
+    """
+
+    def __init__(self, plane: StatePlane, commands: CommandClient, vfds: Dict[str, dict], vfd_ids: List[str]):
+        self.plane = plane
+        self.commands = commands
+        self.vfds = {vfd_id: VFDTypes.VFD(**vfds[vfd_id]) for vfd_id in vfd_ids}
+        self.slots = {vfd_id: index for index, vfd_id in enumerate(vfd_ids)}
+        self.watcher = GenerationWatcher(lambda: plane.vfd_generation)
+        self.event_watcher = EventWatcher(plane)
+        self.__state_json: Dict[str, Tuple[int, bytes]] = {}
+        self.__snapshot_json: Optional[Tuple[int, bytes]] = None
+        self.__vfd_list_json: Optional[Tuple[int, bytes]] = None
+
+    @property
+    def epoch(self) -> str:
+        return self.plane.epoch
+
+    @property
+    def generation(self) -> int:
+        return self.plane.vfd_generation
+
+    def has_vfd(self, id: str) -> bool:
+        return (id in self.vfds)
+
+    def get_vfds(self) -> Dict[str, VFDTypes.VFD]:
+        for vfd_id, vfd in self.vfds.items():
+            _, state, vfd.poll_fail_count = self.plane.read_vfd(self.slots[vfd_id])
+            vfd.state = VFDTypes.VFDState(**state)
+        return self.vfds
+
+    def get_vfd_state(self, vfd_id: str) -> dict:
+        return self.plane.read_vfd(self.slots[vfd_id])[1]
+
+    def get_state_snapshot(self) -> Dict[str, dict]:
+        return {vfd_id: self.plane.read_vfd(index)[1] for vfd_id, index in self.slots.items()}
+
+    def get_state_json(self, vfd_id: str) -> Tuple[int, bytes]:
+        generation, state, _ = self.plane.read_vfd(self.slots[vfd_id])
+        cached = self.__state_json.get(vfd_id)
+        if cached is None or cached[0] != generation:
+            cached = self.__state_json[vfd_id] = (generation, dumps(state).encode())
+        return cached
+
+    def get_snapshot_json(self) -> Tuple[int, bytes]:
+        # The generation is read first, the states behind it are at least as new
+        generation = self.plane.vfd_generation
+        if self.__snapshot_json is None or self.__snapshot_json[0] != generation:
+            self.__snapshot_json = (generation, dumps(self.get_state_snapshot()).encode())
+        return self.__snapshot_json
+
+    def get_vfd_list_json(self) -> Tuple[int, bytes]:
+        generation = self.plane.vfd_list_generation
+        if self.__vfd_list_json is None or self.__vfd_list_json[0] != generation:
+            self.__vfd_list_json = (generation, dumps([vfd.model_dump(exclude={"state"}) for vfd in self.get_vfds().values()]).encode())
+        return self.__vfd_list_json
+
+    async def wait_for_generation(self, generation: int):
+        await self.watcher.wait_for_generation(generation)
+
+    async def wait_for_state(self, vfd_id: Optional[str], since: int, timeout: float) -> bool:
+        if vfd_id is None:
+            return await self.watcher.wait(lambda: self.plane.vfd_generation > since, timeout)
+        return await self.watcher.wait(lambda: self.plane.read_vfd(self.slots[vfd_id])[0] > since, timeout)
+
+    async def get_bus_status(self) -> List[VFDTypes.BusStatus]:
+        return [VFDTypes.BusStatus(**bus) for bus in await self.commands.call("vfd.get_bus_status")]
+
+    async def get_vfd_history(self, vfd_id: str, start: float, end: float, buckets: int, metrics: List[str]) -> dict:
+        return await self.commands.call("vfd.get_vfd_history", vfd_id, start, end, buckets, metrics)
+
+    async def get_events(self, vfd_id: Optional[str] = None, start: Optional[float] = None, end: Optional[float] = None,
+                         kinds: Optional[List[VFDTypes.EventKind]] = None, limit: int = 100) -> List[VFDTypes.VFDEvent]:
+        events = await self.commands.call("vfd.get_events", vfd_id, start, end, kinds, limit)
+        return [VFDTypes.VFDEvent(**event) for event in events]
+
+    def subscribe_events(self) -> asyncio.Queue:
+        return self.event_watcher.subscribe()
+
+    def unsubscribe_events(self, queue: asyncio.Queue):
+        self.event_watcher.unsubscribe(queue)
+
+    async def read_vfd_registers(self, vfd_id: str, start_code: str, num: int, max_age: float = None) -> List[int]:
+        return await self.commands.call("vfd.read_vfd_registers", vfd_id, start_code, num, max_age=max_age)
+
+    async def read_batch(self, reads: List[VFDTypes.RegisterRange], max_age: float = None) -> List[VFDTypes.RegisterRangeResult]:
+        results = await self.commands.call("vfd.read_batch", reads, max_age=max_age)
+        return [VFDTypes.RegisterRangeResult(**result) for result in results]
+
+    async def set_frequency(self, vfd_id: str, frequency: float) -> float:
+        return await self.commands.call("vfd.set_frequency", vfd_id, frequency)
+
+    async def set_drive_mode(self, vfd_id: str, drive_mode: VFDTypes.DriveMode) -> VFDTypes.DriveMode:
+        return VFDTypes.DriveMode(await self.commands.call("vfd.set_drive_mode", vfd_id, drive_mode))
+
+    async def clear_alarm(self, vfd_id: str):
+        await self.commands.call("vfd.clear_alarm", vfd_id)
+
+    async def refresh_parameters(self, vfd_id: str):
+        await self.commands.call("vfd.refresh_parameters", vfd_id)
+
+    async def emergency_stop(self):
+        await self.commands.call("vfd.emergency_stop")
+
+    async def set_group_frequency(self, vfd_ids: List[str], frequency: float) -> Dict[str, VFDTypes.GroupCommandResult]:
+        results = await self.commands.call("vfd.set_group_frequency", vfd_ids, frequency)
+        return {vfd_id: VFDTypes.GroupCommandResult(**result) for vfd_id, result in results.items()}
+
+    async def set_group_drive_mode(self, vfd_ids: List[str], drive_mode: VFDTypes.DriveMode) -> Dict[str, VFDTypes.GroupCommandResult]:
+        results = await self.commands.call("vfd.set_group_drive_mode", vfd_ids, drive_mode)
+        return {vfd_id: VFDTypes.GroupCommandResult(**result) for vfd_id, result in results.items()}
+
+
+class RemoteSensorSuite:
+    """The SensorSuite interface used by SensorBlueprint, in a worker process."""
+
+    def __init__(self, plane: StatePlane, commands: CommandClient, sensors: Dict[str, dict], sensor_ids: List[str]):
+        self.plane = plane
+        self.commands = commands
+        self.sensors = {sensor_id: SensorTypes.Sensor(**sensors[sensor_id]) for sensor_id in sensor_ids}
+        self.slots = {sensor_id: index for index, sensor_id in enumerate(sensor_ids)}
+        self.watcher = GenerationWatcher(lambda: plane.sensor_generation)
+
+    @property
+    def generation(self) -> int:
+        return self.plane.sensor_generation
+
+    def has_sensor(self, id: str) -> bool:
+        return (id in self.sensors)
+
+    def get_sensors(self) -> Dict[str, SensorTypes.Sensor]:
+        return self.sensors
+
+    def get_reading(self, id: str) -> SensorTypes.SensorReading:
+        return SensorTypes.SensorReading(**self.plane.read_sensor(self.slots[id])[1])
+
+    def get_value(self, id: str) -> Optional[float]:
+        return self.plane.read_sensor(self.slots[id])[1]["value"]
+
+    async def get_samples(self, id: str, seconds: float, points: int) -> SensorTypes.SensorSamples:
+        return SensorTypes.SensorSamples(**await self.commands.call("sensors.get_samples", id, seconds, points))
+
+    def get_state_snapshot(self) -> Dict[str, dict]:
+        return {sensor_id: self.plane.read_sensor(index)[1] for sensor_id, index in self.slots.items()}
+
+    async def wait_for_generation(self, generation: int):
+        await self.watcher.wait_for_generation(generation)
+
+
+class RemoteAutopilotController:
+    """The AutopilotController interface used by AutopilotBlueprint, in a worker process."""
+
+    def __init__(self, commands: CommandClient, loop_ids: List[str]):
+        self.commands = commands
+        self.loop_ids = set(loop_ids)
+
+    def has_loop(self, id: str) -> bool:
+        return (id in self.loop_ids)
+
+    async def get_loops(self) -> Dict[str, AutopilotTypes.AutopilotLoop]:
+        loops = await self.commands.call("autopilot.get_loops")
+        return {id: AutopilotTypes.AutopilotLoop(**loop) for id, loop in loops.items()}
+
+    async def get_loop(self, id: str) -> AutopilotTypes.AutopilotLoop:
+        return AutopilotTypes.AutopilotLoop(**await self.commands.call("autopilot.get_loop", id))
+
+    async def enable(self, id: str):
+        await self.commands.call("autopilot.enable", id)
+
+    async def disable(self, id: str):
+        await self.commands.call("autopilot.disable", id)
+
+    async def tune(self, id: str, params: AutopilotTypes.TuneLoopParams) -> AutopilotTypes.LoopTuning:
+        return AutopilotTypes.LoopTuning(**await self.commands.call("autopilot.tune", id, params.model_dump(exclude_none=True)))
+
+
+class BusOwnerClient:
+    """A worker's connection to the bus owner process: the state plane and the command channel."""
+
+    def __init__(self, plane: StatePlane, commands: CommandClient):
+        self.plane = plane
+        self.commands = commands
+
+    @classmethod
+    async def connect(cls, state_plane: str, command_socket: str, timeout: float = 60) -> "BusOwnerClient":
+        """Attaches to the state plane once the bus owner has set it up."""
+        plane = StatePlane.attach(state_plane)
+        deadline = time.monotonic() + timeout
+        while not plane.ready:
+            if time.monotonic() > deadline:
+                plane.close()
+                raise TimeoutError(f"Bus owner did not set up the state plane within {timeout}s")
+            await asyncio.sleep(0.05)
+        return cls(plane, CommandClient(command_socket))
+
+    async def create_controllers(self) -> Tuple[RemoteVFDController, RemoteSensorSuite, RemoteAutopilotController]:
+        vfd_ids, sensor_ids = self.plane.slot_ids()
+        vfds = await self.commands.call("vfd.get_vfds")
+        sensors = await self.commands.call("sensors.get_sensors")
+        loops = await self.commands.call("autopilot.get_loops")
+        return (RemoteVFDController(self.plane, self.commands, vfds, vfd_ids),
+                RemoteSensorSuite(self.plane, self.commands, sensors, sensor_ids),
+                RemoteAutopilotController(self.commands, list(loops)))
+
+    async def close(self):
+        await self.commands.close()
+        self.plane.close()
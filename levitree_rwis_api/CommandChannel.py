@@ -0,0 +1,158 @@
+from json import dumps, loads
+from typing import Any, Callable, Dict, Optional
+from sanic.log import logger
+
+import asyncio
+import inspect
+import itertools
+import os
+
+from pydantic import BaseModel
+
+# Largest request or response line, history queries can run to a few megabytes
+LINE_LIMIT = 64 * 1024 * 1024
+
+# Exceptions re-raised with their own type on the calling side, anything else becomes a RuntimeError
+REMOTE_EXCEPTIONS = {exception.__name__: exception for exception in (ValueError, KeyError, TimeoutError, ConnectionError)}
+
+
+def encode(value: Any):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"{type(value).__name__} can not be sent over the command channel")
+
+
+class CommandServer:
+    """Serves commands from worker processes as JSON lines on a unix socket.
+
+    Each line is a request `{"id", "method", "args", "kwargs"}` and is
+    answered with `{"id", "result"}` or `{"id", "error", "type"}`. Requests
+    on one connection run concurrently, so a command waiting for the bus
+    never holds up a quick query behind it.
+    """
+
+    def __init__(self, path: str, handlers: Dict[str, Callable]):
+        self.path = path
+        self.handlers = handlers
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.connections: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self.__serve, self.path, limit=LINE_LIMIT)
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            # Closing the connections ends their handlers
+            connections = list(self.connections.items())
+            for writer, _ in connections:
+                writer.close()
+            await asyncio.gather(*[task for _, task in connections], return_exceptions=True)
+            await self.server.wait_closed()
+            self.server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def __serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tasks = set()
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self.__handle(loads(line), writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def __handle(self, request: dict, writer: asyncio.StreamWriter):
+        try:
+            handler = self.handlers[request["method"]]
+        except KeyError:
+            response = {"id": request.get("id"), "error": f"Unknown command {request.get('method')}", "type": "ValueError"}
+        else:
+            try:
+                result = handler(*request.get("args", []), **request.get("kwargs", {}))
+                if inspect.isawaitable(result):
+                    result = await result
+                response = {"id": request["id"], "result": result}
+            except Exception as e:
+                logger.debug(f"Command {request['method']} failed: {e!r}")
+                response = {"id": request["id"], "error": str(e), "type": type(e).__name__}
+        if writer.is_closing():
+            return
+        writer.write(dumps(response, default=encode).encode() + b"\n")
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+class CommandClient:
+    """Sends commands to a `CommandServer`, multiplexing concurrent calls over one connection.
+
+    The connection is opened on the first call and reopened on the next call
+    after it drops, calls in flight when it drops fail with ConnectionError.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ids = itertools.count()
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.reader_task: Optional[asyncio.Task] = None
+        self.__connect_lock = asyncio.Lock()
+
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        writer = await self.__connect()
+        id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[id] = future
+        try:
+            writer.write(dumps({"id": id, "method": method, "args": args, "kwargs": kwargs}, default=encode).encode() + b"\n")
+            await writer.drain()
+            response = await future
+        finally:
+            self.pending.pop(id, None)
+        if "error" in response:
+            exception = REMOTE_EXCEPTIONS.get(response["type"])
+            if exception is None:
+                raise RuntimeError(f"{response['type']}: {response['error']}")
+            raise exception(response["error"])
+        return response["result"]
+
+    async def close(self):
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+            self.reader_task = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    async def __connect(self) -> asyncio.StreamWriter:
+        async with self.__connect_lock:
+            if self.writer is None or self.writer.is_closing():
+                reader, self.writer = await asyncio.open_unix_connection(self.path, limit=LINE_LIMIT)
+                self.reader_task = asyncio.create_task(self.__read(reader, self.writer))
+            return self.writer
+
+    async def __read(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                response = loads(line)
+                future = self.pending.get(response["id"])
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Command channel to the bus owner closed"))
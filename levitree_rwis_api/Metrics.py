@@ -0,0 +1,173 @@
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+import asyncio
+import time
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function: Callable[[], float] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Evaluates `function` at scrape time instead of tracking a value."""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        # One slot per bound plus the +Inf overflow, filled in place on every observation
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def escape_label_value(value: str) -> str:
+    """Escapes a label value as the Prometheus text format requires."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def escape_help(help: str) -> str:
+    return help.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+class MetricFamily:
+    """A named metric and its children, one per combination of label values.
+
+    Children are created on first use and live forever, so hot paths should
+    resolve them once with `labels` and keep the reference.
+    """
+
+    def __init__(self, name: str, help: str, type: str, labelnames: Sequence[str], factory: Callable):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            child = self.children[key] = self.factory()
+        return child
+
+    def _label_string(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def empty(self) -> bool:
+        """Whether nothing was recorded yet, gauges count as soon as they have a child."""
+        if self.type == "histogram":
+            return all(child.count == 0 for child in self.children.values())
+        if self.type == "counter":
+            return all(child.value == 0 for child in self.children.values())
+        return not self.children
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {escape_help(self.help)}", f"# TYPE {self.name} {self.type}"]
+        for key, child in self.children.items():
+            if self.type == "histogram":
+                cumulative = 0
+                for bound, count in zip(list(child.bounds) + ["+Inf"], child.counts):
+                    cumulative += count
+                    bucket_labels = self._label_string(key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{self._label_string(key)} {child.sum}")
+                lines.append(f"{self.name}_count{self._label_string(key)} {child.count}")
+            elif self.type == "gauge":
+                lines.append(f"{self.name}{self._label_string(key)} {child.get()}")
+            else:
+                lines.append(f"{self.name}{self._label_string(key)} {child.value}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.families: Dict[str, MetricFamily] = {}
+
+    def _family(self, name: str, help: str, type: str, labelnames: Sequence[str], factory: Callable) -> MetricFamily:
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = MetricFamily(name, help, type, labelnames, factory)
+        return family
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> MetricFamily:
+        return self._family(name, help, "counter", labelnames, Counter)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> MetricFamily:
+        return self._family(name, help, "gauge", labelnames, Gauge)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> MetricFamily:
+        return self._family(name, help, "histogram", labelnames, lambda: Histogram(buckets))
+
+    def render(self, skip_empty: bool = False) -> str:
+        """Renders all families, leaving out those that recorded nothing if `skip_empty` is set."""
+        lines = []
+        for family in self.families.values():
+            if skip_empty and family.empty():
+                continue
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+def merge_rendered(*texts: str) -> str:
+    """Concatenates rendered registries, keeping only the first family of each name.
+
+    A scrape must not repeat a family, so one that several processes render
+    is taken from the first text that has it.
+    """
+    lines, seen = [], set()
+    for text in texts:
+        keep = True
+        for line in text.splitlines():
+            if line.startswith("# HELP "):
+                name = line.split(" ", 3)[2]
+                keep = name not in seen
+                seen.add(name)
+            if keep and line:
+                lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+EVENT_LOOP_LAG = REGISTRY.histogram("event_loop_lag_seconds", "Delay of event loop wakeups past their scheduled time").labels()
+
+
+async def monitor_event_loop(interval: float = 0.25, histogram: Histogram = EVENT_LOOP_LAG):
+    while True:
+        expected = time.monotonic() + interval
+        await asyncio.sleep(interval)
+        histogram.observe(max(time.monotonic() - expected, 0.0))
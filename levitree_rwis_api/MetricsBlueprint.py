@@ -0,0 +1,23 @@
+from sanic import Blueprint, Request
+from sanic.response import text
+from sanic_ext import openapi
+
+from .Metrics import REGISTRY, merge_rendered, monitor_event_loop
+
+MetricsBlueprint = Blueprint("MetricsBlueprint")
+
+@MetricsBlueprint.get("/metrics")
+@openapi.definition(
+    summary="Prometheus metrics",
+    description="Bus, polling, websocket and event loop metrics in the Prometheus text exposition format",
+)
+async def get_metrics(request: Request):
+    if hasattr(request.app.ctx, 'bus_owner'):
+        # Bus, polling and autopilot metrics live in the bus owner process
+        owner_metrics = await request.app.ctx.bus_owner.commands.call("metrics.render")
+        return text(merge_rendered(REGISTRY.render(skip_empty=True), owner_metrics), content_type="text/plain; version=0.0.4; charset=utf-8")
+    return text(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@MetricsBlueprint.listener("before_server_start")
+async def start_event_loop_monitor(app, loop):
+    app.add_task(monitor_event_loop(), name="event_loop_monitor")
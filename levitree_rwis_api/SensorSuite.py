@@ -0,0 +1,282 @@
+from typing import Dict, Optional, Tuple
+from sanic.log import logger
+
+from numpy.lib.stride_tricks import sliding_window_view
+import asyncio
+import math
+import threading
+import time
+
+import numpy as np
+
+from .sensors import SensorTypes
+from .sensors.SensorDrivers import SensorDriver
+
+
+def median_filter(context: np.ndarray, block: np.ndarray, window: int) -> np.ndarray:
+    """Running median of `block`, continuing from the samples in `context`."""
+    if window <= 1 or len(block) == 0:
+        return block
+    context = context[-(window - 1):]
+    if len(context) < window - 1:
+        # Until enough history exists, pad with the oldest known sample
+        pad = context[0] if len(context) else block[0]
+        context = np.concatenate((np.full(window - 1 - len(context), pad, dtype=block.dtype), context))
+    return np.median(sliding_window_view(np.concatenate((context, block)), window), axis=1).astype(block.dtype)
+
+
+def ema_filter(block: np.ndarray, alpha: float, previous: Optional[float]) -> np.ndarray:
+    """Exponential moving average of `block`, continuing from the filtered value `previous`.
+
+    Evaluated in closed form over chunks short enough that the growing
+    weights stay well inside float64 range.
+    """
+    if not alpha or alpha >= 1 or len(block) == 0:
+        return block
+    out = np.empty(len(block), dtype=np.float64)
+    decay = 1.0 - alpha
+    chunk = 32
+    for start in range(0, len(block), chunk):
+        x = block[start:start + chunk].astype(np.float64)
+        if previous is None:
+            previous = x[0]
+        powers = decay ** np.arange(1, len(x) + 1)
+        # y[i] = decay^(i+1) * previous + alpha * sum_k decay^(i-k) * x[k]
+        y = powers * previous + alpha * powers / decay * np.cumsum(x / (powers / decay))
+        out[start:start + len(x)] = y
+        previous = y[-1]
+    return out.astype(block.dtype)
+
+
+class SampleBuffer:
+    """Fixed size ring of timestamps, raw and filtered samples of one sensor.
+
+    Written in batches by the sampling thread and read from the event loop,
+    guarded by a lock that is only held for array copies.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.raw = np.zeros(capacity, dtype=np.float32)
+        self.filtered = np.zeros(capacity, dtype=np.float32)
+        self.head = 0
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def extend(self, timestamps: np.ndarray, raw: np.ndarray, filtered: np.ndarray):
+        n = len(timestamps)
+        if n > self.capacity:
+            timestamps, raw, filtered = timestamps[-self.capacity:], raw[-self.capacity:], filtered[-self.capacity:]
+            n = self.capacity
+        with self.lock:
+            first = min(n, self.capacity - self.head)
+            for target, source in ((self.timestamps, timestamps), (self.raw, raw), (self.filtered, filtered)):
+                target[self.head:self.head + first] = source[:first]
+                target[:n - first] = source[first:]
+            self.head = (self.head + n) % self.capacity
+            self.size = min(self.size + n, self.capacity)
+
+    def tail_raw(self, count: int) -> np.ndarray:
+        with self.lock:
+            count = min(count, self.size)
+            indices = (self.head - count + np.arange(count)) % self.capacity
+            return self.raw[indices]
+
+    def since(self, start: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        with self.lock:
+            indices = (self.head - self.size + np.arange(self.size)) % self.capacity
+            timestamps = self.timestamps[indices]
+            first = np.searchsorted(timestamps, start)
+            indices = indices[first:]
+            return timestamps[first:], self.raw[indices], self.filtered[indices]
+
+
+class SensorChannel:
+    def __init__(self, sensor: SensorTypes.Sensor, driver: SensorDriver, oversample: int, median_window: int,
+                 ema_alpha: Optional[float], scale: float, offset: float, capacity: int):
+        self.sensor = sensor
+        self.driver = driver
+        self.oversample = oversample
+        self.median_window = median_window
+        self.ema_alpha = ema_alpha
+        self.scale = scale
+        self.offset = offset
+        self.buffer = SampleBuffer(capacity)
+        self.reading = SensorTypes.SensorReading()
+        self.thread: Optional[threading.Thread] = None
+
+
+class SensorSuite:
+    """Samples ADC and distance sensors at fixed rates.
+
+    Every sensor is sampled by its own worker thread on absolute deadlines, so
+    blocking I2C transfers and echo timing never run on the event loop. Raw
+    samples are oversampled, collected for `flush_interval` seconds and then
+    median and EMA filtered as one array before they are published, which
+    keeps the event loop to a few wakeups per second per sensor.
+    """
+
+    SMOOTHING = 0.1
+
+    def __init__(self, buffer_seconds: float = 600, flush_interval: float = 0.05):
+        self.buffer_seconds = buffer_seconds
+        self.flush_interval = flush_interval
+        self.channels: Dict[str, SensorChannel] = {}
+        self.states: Dict[str, dict] = {}
+        self.generation = 0
+        self.__generation_event = asyncio.Event()
+        self.__stop = threading.Event()
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def register_sensor(self, id: str, display_name: str, kind: SensorTypes.SensorKind, driver_name: str, driver: SensorDriver,
+                        rate: float, oversample: int = 1, median_window: int = 1, ema_alpha: float = None,
+                        scale: float = 1.0, offset: float = 0.0, unit: str = None):
+        if rate <= 0 or oversample < 1 or median_window < 1:
+            raise ValueError(f"Sensor {id} needs a positive rate, oversample and median_window")
+        if ema_alpha is not None and not 0 < ema_alpha <= 1:
+            raise ValueError(f"Sensor {id} needs an ema_alpha between 0 and 1")
+
+        sensor = SensorTypes.Sensor(id=id, display_name=display_name, kind=kind, driver=driver_name,
+                                    unit=driver.unit if unit is None else unit, rate=rate)
+        capacity = max(int(self.buffer_seconds * rate), 1)
+        self.channels[id] = SensorChannel(sensor, driver, oversample, median_window, ema_alpha, scale, offset, capacity)
+        self.states[id] = self.channels[id].reading.model_dump()
+
+        logger.info(f"Registering {kind.value} sensor {display_name} using the {driver_name} driver at {rate} Hz")
+
+    def has_sensor(self, id: str) -> bool:
+        return (id in self.channels)
+
+    def get_sensors(self) -> Dict[str, SensorTypes.Sensor]:
+        return {id: channel.sensor for id, channel in self.channels.items()}
+
+    def get_reading(self, id: str) -> SensorTypes.SensorReading:
+        return self.channels[id].reading
+
+    def get_value(self, id: str) -> Optional[float]:
+        return self.channels[id].reading.value
+
+    async def get_samples(self, id: str, seconds: float, points: int) -> SensorTypes.SensorSamples:
+        timestamps, raw, filtered = self.channels[id].buffer.since(time.time() - seconds)
+        if len(timestamps) > points:
+            # Keep the newest sample, thin out evenly towards the past
+            stride = math.ceil(len(timestamps) / points)
+            keep = slice((len(timestamps) - 1) % stride, None, stride)
+            timestamps, raw, filtered = timestamps[keep], raw[keep], filtered[keep]
+        return SensorTypes.SensorSamples(timestamps=timestamps.tolist(), raw=raw.astype(np.float64).tolist(),
+                                         filtered=filtered.astype(np.float64).tolist())
+
+    def get_state_snapshot(self) -> Dict[str, dict]:
+        return dict(self.states)
+
+    async def wait_for_generation(self, generation: int):
+        while self.generation <= generation:
+            await self.__generation_event.wait()
+
+    def start(self):
+        self.__loop = asyncio.get_running_loop()
+        self.__stop.clear()
+        for channel in self.channels.values():
+            channel.thread = threading.Thread(target=self.__sample, args=(channel,), name=f"sensor_{channel.sensor.id}", daemon=True)
+            channel.thread.start()
+
+    def stop(self):
+        """Stops and joins the sampling threads, blocking until in-flight reads finish."""
+        self.__stop.set()
+        for channel in self.channels.values():
+            if channel.thread is not None:
+                channel.thread.join()
+                channel.thread = None
+
+    def __publish(self, id: str, reading: SensorTypes.SensorReading):
+        # Runs on the event loop, scheduled by a sampling thread
+        self.channels[id].reading = reading
+        self.states[id] = reading.model_dump()
+        self.generation += 1
+        self.__generation_event.set()
+        self.__generation_event = asyncio.Event()
+
+    def __sample(self, channel: SensorChannel):
+        sensor = channel.sensor
+        try:
+            channel.driver.open()
+        except Exception as e:
+            logger.error(f"Could not open sensor {sensor.display_name}: {e!r}")
+            return
+
+        period = 1 / sensor.rate
+        batch_size = math.ceil(self.flush_interval * sensor.rate) + 1
+        timestamps = np.empty(batch_size, dtype=np.float64)
+        samples = np.empty((batch_size, channel.oversample), dtype=np.float64)
+        count = 0
+        errors = 0
+        published_errors = 0
+        # Occasional missed samples are normal for ultrasonic sensors, only report ones lasting about a second
+        consecutive_errors = 0
+        report_after = max(int(sensor.rate), 1)
+        interval = 0.0
+        jitter = 0.0
+        last_start = None
+        previous_filtered = None
+        reading = SensorTypes.SensorReading()
+        deadline = time.monotonic()
+        last_flush = deadline
+
+        try:
+            while True:
+                delay = deadline - time.monotonic()
+                if delay > 0 and self.__stop.wait(delay):
+                    break
+                if self.__stop.is_set():
+                    break
+                started = time.monotonic()
+
+                try:
+                    for i in range(channel.oversample):
+                        samples[count, i] = channel.driver.read()
+                    timestamps[count] = time.time()
+                    count += 1
+                    if consecutive_errors >= report_after:
+                        logger.info(f"Sensor {sensor.display_name} recovered")
+                    consecutive_errors = 0
+                except Exception as e:
+                    errors += 1
+                    consecutive_errors += 1
+                    if consecutive_errors == report_after:
+                        logger.error(f"Could not sample sensor {sensor.display_name}: {e!r}")
+
+                if last_start is not None:
+                    measured = started - last_start
+                    interval = measured if not interval else interval + self.SMOOTHING * (measured - interval)
+                    jitter = jitter + self.SMOOTHING * (max(started - deadline, 0.0) - jitter)
+                last_start = started
+                deadline += period
+                if deadline <= started:
+                    # Skip the slots that were missed instead of bursting to catch up
+                    deadline = started + period
+
+                if count == batch_size or started - last_flush >= self.flush_interval:
+                    last_flush = started
+                    if count == 0 and errors == published_errors:
+                        continue
+                    if count:
+                        raw = (samples[:count].mean(axis=1) * channel.scale + channel.offset).astype(np.float32)
+                        filtered = median_filter(channel.buffer.tail_raw(channel.median_window - 1), raw, channel.median_window)
+                        filtered = ema_filter(filtered, channel.ema_alpha, previous_filtered)
+                        channel.buffer.extend(timestamps[:count], raw, filtered)
+                        previous_filtered = float(filtered[-1])
+                        reading.value = previous_filtered
+                        reading.raw = float(raw[-1])
+                        reading.timestamp = float(timestamps[count - 1])
+                        count = 0
+                    reading.sample_rate = 1 / interval if interval else 0.0
+                    reading.jitter = jitter
+                    reading.errors = published_errors = errors
+                    # Hand the event loop its own copy, this one keeps being updated here
+                    self.__loop.call_soon_threadsafe(self.__publish, sensor.id, reading.model_copy())
+        finally:
+            try:
+                channel.driver.close()
+            except Exception as e:
+                logger.error(f"Could not close sensor {sensor.display_name}: {e!r}")
@@ -0,0 +1,250 @@
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+import math
+import struct
+import zlib
+
+from levitree_rwis_api.vfd import VFDTypes
+
+# magic, epoch, VFD slots, sensor slots, event slots, VFD generation, VFD list generation, sensor generation, event sequence
+HEADER = struct.Struct("<8s8sIII4xQQQQ")
+HEADER_SIZE = 64
+MAGIC = b"LVTSTAT3"
+GENERATIONS_OFFSET = struct.calcsize("<8s8sIII4x")
+GENERATIONS = struct.Struct("<QQQ")
+EVENT_SEQUENCE_OFFSET = GENERATIONS_OFFSET + GENERATIONS.size
+
+SEQUENCE = struct.Struct("<Q")
+# CRC-32 of a slot's payload, stored after it
+CHECKSUM = struct.Struct("<I")
+# id, generation, cur/tgt frequency, output voltage/current, input power, max frequency, cur/tgt drive mode, alarm code, poll fail count
+VFD_SLOT = struct.Struct("<32sQddddddBBHI")
+# id, generation, value, raw, timestamp, sample rate, jitter, errors
+SENSOR_SLOT = struct.Struct("<32sQdddddQ")
+# Slots are padded to whole cache lines so the owner writing one never stalls readers of its neighbours
+SLOT_SIZE = 128
+# event id, VFD id, timestamp, kind, alarm code, drive mode, message
+EVENT_SLOT = struct.Struct("<Q32sd16sHB5x96s")
+EVENT_SLOT_SIZE = 192
+# Events the ring holds, workers check it far more often than a fleet records this many
+EVENT_SLOTS = 256
+# Drive mode of events without one
+NO_DRIVE_MODE = 255
+
+# Reads retry this often while the owner is rewriting a slot
+MAX_READ_ATTEMPTS = 100000
+
+
+class StatePlane:
+    """Fixed-layout drive and sensor state in shared memory.
+
+    The bus owner process is the single writer; any number of worker
+    processes read without locks or IPC round trips. Each slot is guarded by
+    a seqlock: the writer makes the slot's sequence number odd, rewrites the
+    slot and makes it even again, and readers retry until they read the same
+    even sequence number before and after copying the slot.
+
+    Writes to shared memory from Python come without memory barriers, so on
+    weakly ordered CPUs such as ARM a reader can see the sequence number
+    stable while part of the payload is stale. Each slot therefore also
+    carries a CRC-32 of its payload, and readers retry a copy that does not
+    match it. A torn read is then caught unless its CRC collides, which is
+    far less likely than the race itself.
+
+    The header holds the generations of the VFD states, the VFD list and the
+    sensor readings. The owner bumps them after the slots are written. On
+    x86 a reader that sees a new generation also sees the slots behind it,
+    on ARM a slot can briefly still hold the state before it.
+
+    Alarm and transition events go into a ring of event slots, slot `id %
+    event_slots` holding event `id`. The header's event sequence is the id
+    of the next event, readers catch up to it and skip events that were
+    overwritten before they got to them.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory):
+        self.shm = shm
+        self.buf = shm.buf
+        # Slot counts are fixed when the segment is created
+        _, _, self.vfd_slots, self.sensor_slots, self.event_slots, _, _, _, _ = HEADER.unpack_from(self.buf, 0)
+
+    @staticmethod
+    def size(vfd_slots: int, sensor_slots: int, event_slots: int) -> int:
+        return HEADER_SIZE + (vfd_slots + sensor_slots) * SLOT_SIZE + event_slots * EVENT_SLOT_SIZE
+
+    @classmethod
+    def create(cls, name: str, vfd_slots: int, sensor_slots: int, event_slots: int = EVENT_SLOTS) -> "StatePlane":
+        shm = shared_memory.SharedMemory(name=name, create=True, size=cls.size(vfd_slots, sensor_slots, event_slots))
+        shm.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        HEADER.pack_into(shm.buf, 0, bytes(8), bytes(8), vfd_slots, sensor_slots, event_slots, 0, 0, 0, 0)
+        return cls(shm)
+
+    @classmethod
+    def attach(cls, name: str) -> "StatePlane":
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 attaching registers the segment again, which is harmless
+            # as processes spawned by the creator share its resource tracker
+            shm = shared_memory.SharedMemory(name=name)
+        return cls(shm)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+    # Header
+
+    def __header(self) -> tuple:
+        return HEADER.unpack_from(self.buf, 0)
+
+    @property
+    def ready(self) -> bool:
+        return self.__header()[0] == MAGIC
+
+    @property
+    def epoch(self) -> str:
+        return self.__header()[1].decode()
+
+    @property
+    def vfd_generation(self) -> int:
+        return GENERATIONS.unpack_from(self.buf, GENERATIONS_OFFSET)[0]
+
+    @property
+    def vfd_list_generation(self) -> int:
+        return GENERATIONS.unpack_from(self.buf, GENERATIONS_OFFSET)[1]
+
+    @property
+    def sensor_generation(self) -> int:
+        return GENERATIONS.unpack_from(self.buf, GENERATIONS_OFFSET)[2]
+
+    @property
+    def event_sequence(self) -> int:
+        return SEQUENCE.unpack_from(self.buf, EVENT_SEQUENCE_OFFSET)[0]
+
+    def format(self, epoch: str, vfd_ids: List[str], sensor_ids: List[str], event_sequence: int = 0):
+        """Assigns slots and marks the plane ready, called by the owner once its devices are registered.
+
+        `event_sequence` is the id the owner's next event will get.
+        """
+        vfd_slots, sensor_slots, event_slots = self.vfd_slots, self.sensor_slots, self.event_slots
+        if len(vfd_ids) > vfd_slots or len(sensor_ids) > sensor_slots:
+            raise ValueError(f"State plane has room for {vfd_slots} VFDs and {sensor_slots} sensors")
+        for id in vfd_ids + sensor_ids:
+            if len(id.encode()) > 32:
+                raise ValueError(f"ID {id} is longer than the 32 bytes a state plane slot holds")
+        HEADER.pack_into(self.buf, 0, bytes(8), epoch.encode()[:8], vfd_slots, sensor_slots, event_slots, 0, 0, 0, event_sequence)
+        for index in range(vfd_slots):
+            vfd_id = vfd_ids[index] if index < len(vfd_ids) else ""
+            self.write_vfd(index, vfd_id, 0, VFDTypes.VFDState().model_dump(), 0)
+        for index in range(sensor_slots):
+            sensor_id = sensor_ids[index] if index < len(sensor_ids) else ""
+            self.__write(self.__sensor_offset(index), SENSOR_SLOT, sensor_id.encode(), 0, math.nan, math.nan, 0, 0, 0, 0)
+        for index in range(event_slots):
+            self.__write(self.__event_offset(index), EVENT_SLOT, 0, b"", 0, b"", 0, NO_DRIVE_MODE, b"")
+        # The magic goes in last, readers wait for it before reading slots
+        HEADER.pack_into(self.buf, 0, MAGIC, epoch.encode()[:8], vfd_slots, sensor_slots, event_slots, 0, 0, 0, event_sequence)
+
+    def set_generations(self, vfd_generation: int, vfd_list_generation: int, sensor_generation: int):
+        GENERATIONS.pack_into(self.buf, GENERATIONS_OFFSET, vfd_generation, vfd_list_generation, sensor_generation)
+
+    # Slots
+
+    def __vfd_offset(self, index: int) -> int:
+        return HEADER_SIZE + index * SLOT_SIZE
+
+    def __sensor_offset(self, index: int) -> int:
+        return HEADER_SIZE + (self.vfd_slots + index) * SLOT_SIZE
+
+    def __event_offset(self, index: int) -> int:
+        return HEADER_SIZE + (self.vfd_slots + self.sensor_slots) * SLOT_SIZE + index * EVENT_SLOT_SIZE
+
+    def __write(self, offset: int, layout: struct.Struct, *values):
+        sequence = SEQUENCE.unpack_from(self.buf, offset)[0]
+        SEQUENCE.pack_into(self.buf, offset, sequence + 1)
+        payload = layout.pack(*values)
+        start = offset + SEQUENCE.size
+        self.buf[start:start + layout.size] = payload
+        CHECKSUM.pack_into(self.buf, start + layout.size, zlib.crc32(payload))
+        SEQUENCE.pack_into(self.buf, offset, sequence + 2)
+
+    def __read(self, offset: int, layout: struct.Struct) -> tuple:
+        start = offset + SEQUENCE.size
+        for _ in range(MAX_READ_ATTEMPTS):
+            sequence = SEQUENCE.unpack_from(self.buf, offset)[0]
+            if sequence & 1:
+                continue
+            slot = bytes(self.buf[start:start + layout.size + CHECKSUM.size])
+            if SEQUENCE.unpack_from(self.buf, offset)[0] != sequence:
+                continue
+            if zlib.crc32(slot[:layout.size]) == CHECKSUM.unpack_from(slot, layout.size)[0]:
+                return layout.unpack_from(slot)
+        raise TimeoutError(f"State plane slot at {offset} was never stable, did the bus owner die while writing it?")
+
+    def slot_ids(self) -> Tuple[List[str], List[str]]:
+        vfd_ids = [self.__read(self.__vfd_offset(index), VFD_SLOT)[0].rstrip(b"\0").decode() for index in range(self.vfd_slots)]
+        sensor_ids = [self.__read(self.__sensor_offset(index), SENSOR_SLOT)[0].rstrip(b"\0").decode() for index in range(self.sensor_slots)]
+        return [id for id in vfd_ids if id], [id for id in sensor_ids if id]
+
+    def write_vfd(self, index: int, vfd_id: str, generation: int, state: dict, poll_fail_count: int):
+        self.__write(self.__vfd_offset(index), VFD_SLOT, vfd_id.encode(), generation,
+                     state["cur_frequency"], state["tgt_frequency"], state["output_voltage"], state["output_current"],
+                     state["input_power"], state["max_frequency"], state["cur_drive_mode"], state["tgt_drive_mode"],
+                     state["alarm_code"], poll_fail_count)
+
+    def read_vfd(self, index: int) -> Tuple[int, dict, int]:
+        """Returns the generation, state and poll fail count of a VFD slot."""
+        _, generation, cur_frequency, tgt_frequency, output_voltage, output_current, input_power, max_frequency, \
+            cur_drive_mode, tgt_drive_mode, alarm_code, poll_fail_count = self.__read(self.__vfd_offset(index), VFD_SLOT)
+        # Same field order as VFDTypes.VFDState, so the JSON matches the single process encoding
+        state = {
+            "cur_frequency": cur_frequency,
+            "tgt_frequency": tgt_frequency,
+            "cur_drive_mode": VFDTypes.DriveMode(cur_drive_mode),
+            "tgt_drive_mode": VFDTypes.DriveMode(tgt_drive_mode),
+            "output_voltage": output_voltage,
+            "output_current": output_current,
+            "input_power": input_power,
+            "max_frequency": max_frequency,
+            "alarm_code": alarm_code,
+        }
+        return generation, state, poll_fail_count
+
+    def write_sensor(self, index: int, sensor_id: str, generation: int, reading: dict):
+        self.__write(self.__sensor_offset(index), SENSOR_SLOT, sensor_id.encode(), generation,
+                     math.nan if reading["value"] is None else reading["value"],
+                     math.nan if reading["raw"] is None else reading["raw"],
+                     reading["timestamp"], reading["sample_rate"], reading["jitter"], reading["errors"])
+
+    def read_sensor(self, index: int) -> Tuple[int, dict]:
+        """Returns the generation and reading of a sensor slot."""
+        _, generation, value, raw, timestamp, sample_rate, jitter, errors = self.__read(self.__sensor_offset(index), SENSOR_SLOT)
+        reading = {
+            "value": None if math.isnan(value) else value,
+            "raw": None if math.isnan(raw) else raw,
+            "timestamp": timestamp,
+            "sample_rate": sample_rate,
+            "jitter": jitter,
+            "errors": errors,
+        }
+        return generation, reading
+
+    def write_event(self, event: VFDTypes.VFDEvent):
+        """Puts an event in its ring slot and advances the event sequence past it."""
+        self.__write(self.__event_offset(event.id % self.event_slots), EVENT_SLOT, event.id, event.vfd_id.encode(), event.timestamp,
+                     event.kind.value.encode(), event.alarm_code, NO_DRIVE_MODE if event.drive_mode is None else event.drive_mode,
+                     event.message.encode())
+        SEQUENCE.pack_into(self.buf, EVENT_SEQUENCE_OFFSET, event.id + 1)
+
+    def read_event(self, id: int) -> Optional[VFDTypes.VFDEvent]:
+        """Returns event `id`, or None if its slot has since been reused."""
+        slot_id, vfd_id, timestamp, kind, alarm_code, drive_mode, message = self.__read(self.__event_offset(id % self.event_slots), EVENT_SLOT)
+        if slot_id != id:
+            return None
+        return VFDTypes.VFDEvent(id=id, vfd_id=vfd_id.rstrip(b"\0").decode(), timestamp=timestamp,
+                                 kind=VFDTypes.EventKind(kind.rstrip(b"\0").decode()), alarm_code=alarm_code,
+                                 drive_mode=None if drive_mode == NO_DRIVE_MODE else VFDTypes.DriveMode(drive_mode),
+                                 message=message.rstrip(b"\0").decode(errors="ignore"))
@@ -1,9 +1,18 @@
 from sanic import Sanic
+from .BusOwnerBlueprint import BusOwnerBlueprint
 from .vfd.VFDBlueprint import VFDBlueprint
+from .sensors.SensorBlueprint import SensorBlueprint
+from .autopilot.AutopilotBlueprint import AutopilotBlueprint
+from .MetricsBlueprint import MetricsBlueprint
 from sanic.log import logger
 
 logger.setLevel("DEBUG")
 app = Sanic("LevitreeBackend")
 app.config.CORS_ORIGINS = "*"
 
-app.blueprint(VFDBlueprint)
\ No newline at end of file
+# Registered first, its listeners decide whether the subsystems run in this process
+app.blueprint(BusOwnerBlueprint)
+app.blueprint(VFDBlueprint)
+app.blueprint(SensorBlueprint)
+app.blueprint(AutopilotBlueprint)
+app.blueprint(MetricsBlueprint)
\ No newline at end of file
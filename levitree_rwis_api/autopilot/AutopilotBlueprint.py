@@ -0,0 +1,135 @@
+import os
+import yaml
+
+from sanic.log import logger
+from sanic.response import json
+from sanic import BadRequest, Blueprint, InternalServerError
+from sanic_ext import validate, openapi
+from sanic_ext.extensions.openapi.definitions import Response
+
+from levitree_rwis_api import AppTypes
+
+from . import AutopilotTypes, AutopilotController
+
+AutopilotBlueprint = Blueprint("AutopilotBlueprint", url_prefix="/autopilot")
+
+@AutopilotBlueprint.get("/")
+@openapi.definition(
+    summary="List autopilot loops with their tuning and state",
+    tag="Autopilot",
+    response=[Response({"application/json": AutopilotTypes.AutopilotLoop.model_json_schema()}, 200, "Success")]
+)
+async def get_loop_list(request):
+    if not hasattr(request.app.ctx, 'autopilot_controller'):
+        raise InternalServerError("Autopilot subsystem not initialized!")
+    controller: AutopilotController.AutopilotController = request.app.ctx.autopilot_controller
+
+    return json([loop.model_dump() for loop in (await controller.get_loops()).values()])
+
+@AutopilotBlueprint.get("/<loop_id>/state")
+@openapi.definition(
+    summary="Get autopilot loop state",
+    tag="Autopilot",
+    response=[Response({"application/json": AutopilotTypes.LoopState.model_json_schema()}, 200, "Success")]
+)
+async def get_loop_state(request, loop_id: str):
+    if not hasattr(request.app.ctx, 'autopilot_controller'):
+        raise InternalServerError("Autopilot subsystem not initialized!")
+    controller: AutopilotController.AutopilotController = request.app.ctx.autopilot_controller
+
+    if not controller.has_loop(loop_id):
+        raise BadRequest(f"Autopilot loop {loop_id} does not exist!")
+
+    return json((await controller.get_loop(loop_id)).state.model_dump())
+
+@AutopilotBlueprint.post("/<loop_id>/enable")
+@openapi.definition(
+    summary="Enable autopilot loop",
+    description="The loop starts from the drive's current target frequency and only writes while the drive is running.",
+    tag="Autopilot",
+    response=[Response({"application/json": AppTypes.GenericResponse.model_json_schema()}, 200, "Success")]
+)
+async def enable_loop(request, loop_id: str):
+    if not hasattr(request.app.ctx, 'autopilot_controller'):
+        raise InternalServerError("Autopilot subsystem not initialized!")
+    controller: AutopilotController.AutopilotController = request.app.ctx.autopilot_controller
+
+    if not controller.has_loop(loop_id):
+        raise BadRequest(f"Autopilot loop {loop_id} does not exist!")
+
+    await controller.enable(loop_id)
+
+    return json({"error": False, "message": f"Autopilot loop {loop_id} enabled"})
+
+@AutopilotBlueprint.post("/<loop_id>/disable")
+@openapi.definition(
+    summary="Disable autopilot loop",
+    description="The drive is left at the last frequency the loop wrote.",
+    tag="Autopilot",
+    response=[Response({"application/json": AppTypes.GenericResponse.model_json_schema()}, 200, "Success")]
+)
+async def disable_loop(request, loop_id: str):
+    if not hasattr(request.app.ctx, 'autopilot_controller'):
+        raise InternalServerError("Autopilot subsystem not initialized!")
+    controller: AutopilotController.AutopilotController = request.app.ctx.autopilot_controller
+
+    if not controller.has_loop(loop_id):
+        raise BadRequest(f"Autopilot loop {loop_id} does not exist!")
+
+    await controller.disable(loop_id)
+
+    return json({"error": False, "message": f"Autopilot loop {loop_id} disabled"})
+
+@AutopilotBlueprint.post("/<loop_id>/tune")
+@openapi.definition(
+    summary="Tune autopilot loop",
+    description="Only the fields given are changed. Takes effect on the next iteration without disabling the loop.",
+    tag="Autopilot",
+    body={"application/json": AutopilotTypes.TuneLoopParams.model_json_schema()},
+    response=[Response({"application/json": AutopilotTypes.LoopTuning.model_json_schema()}, 200, "Success")]
+)
+@validate(json=AutopilotTypes.TuneLoopParams)
+async def tune_loop(request, loop_id: str, body: AutopilotTypes.TuneLoopParams):
+    if not hasattr(request.app.ctx, 'autopilot_controller'):
+        raise InternalServerError("Autopilot subsystem not initialized!")
+    controller: AutopilotController.AutopilotController = request.app.ctx.autopilot_controller
+
+    if not controller.has_loop(loop_id):
+        raise BadRequest(f"Autopilot loop {loop_id} does not exist!")
+
+    try:
+        tuning = await controller.tune(loop_id, body)
+    except ValueError as e:
+        raise BadRequest(str(e))
+
+    return json(tuning.model_dump())
+
+async def configure_autopilot(cfg: dict, vfd_controller, sensor_suite) -> AutopilotController.AutopilotController:
+    autopilot_controller = AutopilotController.AutopilotController(vfd_controller, sensor_suite)
+    for autopilot_loop in cfg.get("autopilot_loops") or []:
+        tuning = AutopilotTypes.LoopTuning(**{field: autopilot_loop[field] for field in AutopilotTypes.LoopTuning.model_fields if field in autopilot_loop})
+        try:
+            autopilot_controller.register_loop(autopilot_loop["id"], autopilot_loop["name"], autopilot_loop["sensor"], autopilot_loop["vfd"],
+                                               period=autopilot_loop.get("period", 0.2), tuning=tuning)
+        except ValueError as e:
+            logger.error(f"Not running autopilot loop {autopilot_loop['name']}: {e}")
+            continue
+        if autopilot_loop.get("enabled", False):
+            await autopilot_controller.enable(autopilot_loop["id"])
+    return autopilot_controller
+
+@AutopilotBlueprint.listener('after_server_start')
+async def start_autopilot(app):
+    if hasattr(app.ctx, 'bus_owner'):
+        # Loops run in the bus owner process, see BusOwnerBlueprint
+        return
+    # The VFD and sensor subsystems are set up before the server starts
+    config_path = os.environ.get("CONFIG_PATH", "./config.yaml")
+    with open(config_path) as cfgFile:
+        cfg = yaml.load(cfgFile, Loader=yaml.FullLoader)
+        app.ctx.autopilot_controller = await configure_autopilot(cfg, app.ctx.vfd_controller, app.ctx.sensor_suite)
+
+@AutopilotBlueprint.listener('before_server_stop')
+async def stop_autopilot(app):
+    if hasattr(app.ctx, 'autopilot_controller') and not hasattr(app.ctx, 'bus_owner'):
+        await app.ctx.autopilot_controller.disable_all()
@@ -0,0 +1,216 @@
+from typing import Dict, Optional
+from sanic.log import logger
+
+import asyncio
+import time
+
+from levitree_rwis_api.Metrics import REGISTRY
+from levitree_rwis_api.SensorSuite import SensorSuite
+from levitree_rwis_api.vfd import VFDTypes
+from levitree_rwis_api.vfd.VFDController import VFDController
+
+from . import AutopilotTypes
+
+LOOP_LATENESS = REGISTRY.histogram("autopilot_loop_lateness_seconds", "Delay of control loop iterations past their deadline", ("loop",))
+LOOP_WRITES = REGISTRY.counter("autopilot_frequency_writes_total", "Frequency writes issued by control loops", ("loop",))
+LOOP_SUPPRESSED_WRITES = REGISTRY.counter("autopilot_suppressed_writes_total", "Output changes held back by the deadband or rate limit", ("loop",))
+
+
+class ControlLoop:
+    def __init__(self, loop: AutopilotTypes.AutopilotLoop):
+        self.loop = loop
+        self.task: Optional[asyncio.Task] = None
+        self.write_task: Optional[asyncio.Task] = None
+        self.last_write = 0.0
+        self.last_process_value: Optional[float] = None
+        self.initialized = False
+        self.lateness = LOOP_LATENESS.labels(loop.id)
+        self.writes = LOOP_WRITES.labels(loop.id)
+        self.suppressed_writes = LOOP_SUPPRESSED_WRITES.labels(loop.id)
+
+
+class AutopilotController:
+    """Runs PID loops that drive VFD frequencies from sensor readings.
+
+    Each enabled loop iterates on absolute deadlines at its period. The drive
+    is only written when the output has moved by more than the deadband and
+    the last write is at least `min_write_interval` old, and writes run beside
+    the loop so a slow bus never stretches its period.
+    """
+
+    SMOOTHING = 0.1
+    # Regulation resolution of S05 (Hz)
+    FREQUENCY_RESOLUTION = 0.01
+
+    def __init__(self, vfd_controller: VFDController, sensor_suite: SensorSuite):
+        self.vfd_controller = vfd_controller
+        self.sensor_suite = sensor_suite
+        self.loops: Dict[str, ControlLoop] = {}
+
+    def register_loop(self, id: str, display_name: str, sensor_id: str, vfd_id: str, period: float = 0.2,
+                      tuning: AutopilotTypes.LoopTuning = None):
+        if not self.sensor_suite.has_sensor(sensor_id):
+            raise ValueError(f"Autopilot loop {id} reads unknown sensor {sensor_id}")
+        if not self.vfd_controller.has_vfd(vfd_id):
+            raise ValueError(f"Autopilot loop {id} drives unknown VFD {vfd_id}")
+        if period <= 0:
+            raise ValueError(f"Autopilot loop {id} needs a positive period")
+
+        loop = AutopilotTypes.AutopilotLoop(id=id, display_name=display_name, sensor_id=sensor_id, vfd_id=vfd_id,
+                                            period=period, tuning=tuning or AutopilotTypes.LoopTuning())
+        self.__check_tuning(loop.tuning)
+        self.loops[id] = ControlLoop(loop)
+
+        logger.info(f"Registering autopilot loop {display_name} driving VFD {vfd_id} from sensor {sensor_id} every {period}s")
+
+    def has_loop(self, id: str) -> bool:
+        return (id in self.loops)
+
+    async def get_loops(self) -> Dict[str, AutopilotTypes.AutopilotLoop]:
+        return {id: control_loop.loop for id, control_loop in self.loops.items()}
+
+    async def get_loop(self, id: str) -> AutopilotTypes.AutopilotLoop:
+        return self.loops[id].loop
+
+    async def enable(self, id: str):
+        control_loop = self.loops[id]
+        if control_loop.task is not None:
+            return
+        control_loop.loop.state = AutopilotTypes.LoopState(enabled=True)
+        control_loop.initialized = False
+        control_loop.last_process_value = None
+        control_loop.task = asyncio.create_task(self.__run(control_loop), name=f"autopilot_{id}")
+        logger.info(f"Autopilot loop {control_loop.loop.display_name} enabled")
+
+    async def disable(self, id: str):
+        """Stops a loop, leaving the drive at the last frequency written."""
+        control_loop = self.loops[id]
+        if control_loop.task is None:
+            return
+        control_loop.task.cancel()
+        try:
+            await control_loop.task
+        except asyncio.CancelledError:
+            pass
+        control_loop.task = None
+        control_loop.loop.state.enabled = False
+        control_loop.loop.state.message = ""
+        logger.info(f"Autopilot loop {control_loop.loop.display_name} disabled")
+
+    async def disable_all(self):
+        await asyncio.gather(*[self.disable(id) for id in self.loops])
+
+    async def tune(self, id: str, params: AutopilotTypes.TuneLoopParams) -> AutopilotTypes.LoopTuning:
+        loop = self.loops[id].loop
+        tuning = loop.tuning.model_copy(update=params.model_dump(exclude_none=True))
+        self.__check_tuning(tuning)
+        # The integral is kept in Hz, so gain changes take effect without a bump
+        loop.tuning = tuning
+        logger.info(f"Autopilot loop {loop.display_name} tuned to {tuning}")
+        return tuning
+
+    def __check_tuning(self, tuning: AutopilotTypes.LoopTuning):
+        if tuning.min_frequency > tuning.max_frequency:
+            raise ValueError("min_frequency may not be greater than max_frequency")
+
+    async def __run(self, control_loop: ControlLoop):
+        loop = control_loop.loop
+        state = loop.state
+        deadline = time.monotonic()
+        last_start = None
+        while True:
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            started = time.monotonic()
+            lateness = max(started - deadline, 0.0)
+            control_loop.lateness.observe(lateness)
+            dt = loop.period
+            if last_start is not None:
+                dt = started - last_start
+                state.interval = dt if not state.interval else state.interval + self.SMOOTHING * (dt - state.interval)
+                state.jitter = state.jitter + self.SMOOTHING * (lateness - state.jitter)
+            last_start = started
+
+            try:
+                self.__iterate(control_loop, dt)
+            except Exception as e:
+                state.message = repr(e)
+                logger.error(f"Autopilot loop {loop.display_name} failed an iteration: {e!r}")
+            state.iterations += 1
+
+            deadline += loop.period
+            if deadline <= started:
+                # Skip the iterations that were missed instead of bursting to catch up
+                state.overruns += 1
+                deadline = started + loop.period
+
+    def __iterate(self, control_loop: ControlLoop, dt: float):
+        loop = control_loop.loop
+        tuning = loop.tuning
+        state = loop.state
+
+        reading = self.sensor_suite.get_reading(loop.sensor_id)
+        if reading.value is None or time.time() - reading.timestamp > max(3 * loop.period, 1.0):
+            state.message = "Sensor reading is stale"
+            control_loop.last_process_value = None
+            return
+        process_value = reading.value
+        state.process_value = process_value
+
+        sign = -1.0 if tuning.reverse_acting else 1.0
+        error = sign * (tuning.setpoint - process_value)
+        state.error = error
+
+        vfd_state = self.vfd_controller.get_vfd_state(loop.vfd_id)
+        running = vfd_state["cur_drive_mode"] in (VFDTypes.DriveMode.FORWARD, VFDTypes.DriveMode.REVERSE)
+
+        proportional = tuning.kp * error
+        derivative = 0.0
+        if control_loop.last_process_value is not None and dt > 0:
+            # Derivative on the measurement, so setpoint changes do not kick the output
+            derivative = -tuning.kd * sign * (process_value - control_loop.last_process_value) / dt
+        control_loop.last_process_value = process_value
+
+        if not control_loop.initialized:
+            # Start from the frequency the drive is already set to
+            state.integral = vfd_state["tgt_frequency"] - proportional - derivative
+            control_loop.initialized = True
+
+        integral = state.integral
+        if running:
+            integral += tuning.ki * error * dt
+        unclamped = proportional + integral + derivative
+        output = min(max(unclamped, tuning.min_frequency), tuning.max_frequency)
+        if output == unclamped or (unclamped > output) != (error > 0):
+            # Only integrate while unsaturated or when winding back towards the range
+            state.integral = integral
+        state.integral = min(max(state.integral, tuning.min_frequency), tuning.max_frequency)
+        state.output = output
+
+        if not running:
+            state.message = "Drive is not running"
+            return
+        state.message = ""
+
+        change = abs(output - state.written_frequency) if state.written_frequency is not None else float("inf")
+        if change < self.FREQUENCY_RESOLUTION:
+            return
+        now = time.monotonic()
+        if change < tuning.deadband or now - control_loop.last_write < tuning.min_write_interval \
+                or (control_loop.write_task is not None and not control_loop.write_task.done()):
+            state.suppressed_writes += 1
+            control_loop.suppressed_writes.inc()
+            return
+        control_loop.last_write = now
+        control_loop.write_task = asyncio.create_task(self.__write(control_loop, round(output, 2)))
+
+    async def __write(self, control_loop: ControlLoop, frequency: float):
+        loop = control_loop.loop
+        try:
+            loop.state.written_frequency = await self.vfd_controller.set_frequency(loop.vfd_id, frequency)
+            loop.state.writes += 1
+            control_loop.writes.inc()
+        except Exception as e:
+            loop.state.write_errors += 1
+            logger.error(f"Autopilot loop {loop.display_name} could not set VFD {loop.vfd_id} frequency: {e!r}")
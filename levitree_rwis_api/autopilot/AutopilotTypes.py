@@ -0,0 +1,62 @@
+from typing import Optional
+from pydantic import BaseModel, Field, validator
+
+class LoopTuning(BaseModel):
+    setpoint: float = Field(default=0, description='Target process value, in the unit of the sensor', examples=[0.5, 30.0])
+    kp: float = Field(default=1.0, description='Proportional gain (Hz per unit of error)', examples=[5.0])
+    ki: float = Field(default=0.0, description='Integral gain (Hz per unit of error and second)', examples=[0.5])
+    kd: float = Field(default=0.0, description='Derivative gain (Hz per unit of error per second)', examples=[0.0])
+    reverse_acting: bool = Field(default=False, description='Raise the output when the process value is above the setpoint, e.g. for distance to a falling liquid level')
+    min_frequency: float = Field(default=0, description='Lowest frequency the loop will command (Hz)', examples=[10.0])
+    max_frequency: float = Field(default=60, description='Highest frequency the loop will command (Hz)', examples=[60.0])
+    deadband: float = Field(default=0.2, description='Smallest frequency change worth writing to the drive (Hz)', examples=[0.2, 0.5])
+    min_write_interval: float = Field(default=1.0, description='Shortest time between frequency writes (s)', examples=[1.0, 0.5])
+
+class TuneLoopParams(BaseModel):
+    setpoint: Optional[float] = Field(default=None, description='Target process value, in the unit of the sensor', examples=[0.5, 30.0])
+    kp: Optional[float] = Field(default=None, description='Proportional gain (Hz per unit of error)', examples=[5.0])
+    ki: Optional[float] = Field(default=None, description='Integral gain (Hz per unit of error and second)', examples=[0.5])
+    kd: Optional[float] = Field(default=None, description='Derivative gain (Hz per unit of error per second)', examples=[0.0])
+    reverse_acting: Optional[bool] = Field(default=None, description='Raise the output when the process value is above the setpoint')
+    min_frequency: Optional[float] = Field(default=None, description='Lowest frequency the loop will command (Hz)', examples=[10.0])
+    max_frequency: Optional[float] = Field(default=None, description='Highest frequency the loop will command (Hz)', examples=[60.0])
+    deadband: Optional[float] = Field(default=None, description='Smallest frequency change worth writing to the drive (Hz)', examples=[0.2])
+    min_write_interval: Optional[float] = Field(default=None, description='Shortest time between frequency writes (s)', examples=[1.0])
+
+    @validator('min_frequency', 'max_frequency')
+    def assert_frequency(cls, frequency):
+        if frequency is not None:
+            assert frequency >= 0, 'frequency may not be negative'
+            assert frequency <= 120, 'frequency may not be greater than 120'
+        return frequency
+
+    @validator('deadband', 'min_write_interval')
+    def assert_positive(cls, value):
+        if value is not None:
+            assert value >= 0, 'value may not be negative'
+        return value
+
+class LoopState(BaseModel):
+    enabled: bool = Field(default=False, description='Whether the loop is running')
+    message: str = Field(default="", description='Why the loop is holding its output, if it is', examples=["", "Sensor reading is stale"])
+    process_value: Optional[float] = Field(default=None, description='Latest process value', examples=[0.52])
+    error: float = Field(default=0, description='Setpoint minus process value, negated for reverse acting loops', examples=[-0.02])
+    output: float = Field(default=0, description='Frequency computed by the loop (Hz)', examples=[42.3])
+    written_frequency: Optional[float] = Field(default=None, description='Frequency last written to the drive (Hz)', examples=[42.0])
+    integral: float = Field(default=0, description='Integral term (Hz)', examples=[12.5])
+    iterations: int = Field(default=0, description='Loop iterations since enabled', examples=[1200])
+    writes: int = Field(default=0, description='Frequency writes since enabled', examples=[40])
+    suppressed_writes: int = Field(default=0, description='Output changes not written because of the deadband or rate limit', examples=[1100])
+    write_errors: int = Field(default=0, description='Failed frequency writes since enabled', examples=[0])
+    interval: float = Field(default=0, description='Smoothed time between iterations (s)', examples=[0.2])
+    jitter: float = Field(default=0, description='Smoothed lateness of iterations past their deadline (s)', examples=[0.0004])
+    overruns: int = Field(default=0, description='Iterations that started a full period late', examples=[0])
+
+class AutopilotLoop(BaseModel):
+    id: str = Field(default="", description='Loop internal ID', examples=["Tank_Level"])
+    display_name: str = Field(default="", description='Loop display name', examples=["Tank Level"])
+    sensor_id: str = Field(default="", description='Sensor providing the process value', examples=["Mix_Tank_Distance"])
+    vfd_id: str = Field(default="", description='VFD whose frequency is controlled', examples=["TestVFD"])
+    period: float = Field(default=0.2, description='Loop period (s)', examples=[0.2, 1.0])
+    tuning: LoopTuning = Field(default=LoopTuning(), description='Loop tuning')
+    state: LoopState = Field(default=LoopState(), description='Current loop state')
@@ -0,0 +1,143 @@
+import os
+import time
+import yaml
+
+from sanic.log import logger
+from sanic.response import json
+from sanic import BadRequest, Blueprint, InternalServerError, Request, Websocket
+from sanic_ext import openapi
+from sanic_ext.extensions.openapi.definitions import Response
+
+from levitree_rwis_api import SensorSuite
+from levitree_rwis_api.vfd import StateBroadcaster
+
+from . import SensorTypes, SensorDrivers
+
+SensorBlueprint = Blueprint("SensorBlueprint", url_prefix="/sensors")
+
+@SensorBlueprint.websocket("/live_state")
+@openapi.definition(
+    summary="Subscribe to live readings of all sensors attached to system",
+    description="Sends all readings on connect and whenever new samples are filtered. With `?mode=delta` only changed fields are sent after the first snapshot.",
+    tag="Sensors"
+)
+async def live_state(request: Request, ws: Websocket):
+    if not hasattr(request.app.ctx, 'sensor_broadcaster'):
+        raise InternalServerError("Sensor subsystem not initialized!")
+    broadcaster: StateBroadcaster.StateBroadcaster = request.app.ctx.sensor_broadcaster
+    subscription = broadcaster.subscribe(delta=request.args.get("mode") == "delta")
+    try:
+        while True:
+            frame = await subscription.next_frame()
+            started = time.monotonic()
+            await ws.send(frame)
+            broadcaster.send_seconds.observe(time.monotonic() - started)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+@SensorBlueprint.get("/")
+@openapi.definition(
+    summary="List sensors",
+    tag="Sensors",
+    response=[Response({"application/json": SensorTypes.Sensor.model_json_schema()}, 200, "Success")]
+)
+async def get_sensor_list(request):
+    if not hasattr(request.app.ctx, 'sensor_suite'):
+        raise InternalServerError("Sensor subsystem not initialized!")
+    suite: SensorSuite.SensorSuite = request.app.ctx.sensor_suite
+
+    return json([sensor.model_dump() for sensor in suite.get_sensors().values()])
+
+@SensorBlueprint.get("/<sensor_id>/reading")
+@openapi.definition(
+    summary="Get the latest filtered sensor reading",
+    tag="Sensors",
+    response=[Response({"application/json": SensorTypes.SensorReading.model_json_schema()}, 200, "Success")]
+)
+async def get_sensor_reading(request, sensor_id: str):
+    if not hasattr(request.app.ctx, 'sensor_suite'):
+        raise InternalServerError("Sensor subsystem not initialized!")
+    suite: SensorSuite.SensorSuite = request.app.ctx.sensor_suite
+
+    if not suite.has_sensor(sensor_id):
+        raise BadRequest(f"Sensor {sensor_id} does not exist!")
+
+    return json(suite.get_reading(sensor_id).model_dump())
+
+@SensorBlueprint.get("/<sensor_id>/samples")
+@openapi.definition(
+    summary="Get recent raw and filtered samples",
+    description="Query parameters: `seconds` of history (default 60) and at most `points` samples (default 1000), thinned out evenly.",
+    tag="Sensors",
+    response=[Response({"application/json": SensorTypes.SensorSamples.model_json_schema()}, 200, "Success")]
+)
+async def get_sensor_samples(request, sensor_id: str):
+    if not hasattr(request.app.ctx, 'sensor_suite'):
+        raise InternalServerError("Sensor subsystem not initialized!")
+    suite: SensorSuite.SensorSuite = request.app.ctx.sensor_suite
+
+    if not suite.has_sensor(sensor_id):
+        raise BadRequest(f"Sensor {sensor_id} does not exist!")
+
+    try:
+        seconds = float(request.args.get("seconds", 60))
+        points = int(request.args.get("points", 1000))
+    except ValueError:
+        raise BadRequest("seconds and points must be numbers!")
+    if seconds <= 0:
+        raise BadRequest("seconds must be positive!")
+    if points < 1 or points > 10000:
+        raise BadRequest("points must be between 1 and 10000!")
+
+    return json((await suite.get_samples(sensor_id, seconds, points)).model_dump())
+
+def create_adc_driver(adc: dict) -> SensorDrivers.SensorDriver:
+    if adc["type"] == "ads1115":
+        return SensorDrivers.ADS1115Driver(adc.get("address", 0x48), adc.get("channel", 0), gain=adc.get("gain", 1),
+                                           data_rate=adc.get("data_rate", 860), i2c_bus=adc.get("i2c_bus", 1))
+    elif adc["type"] == "simulated":
+        return SensorDrivers.SimulatedADCDriver(offset=adc.get("sim_offset", 1.65), amplitude=adc.get("sim_amplitude", 0.5))
+    raise ValueError(f"Unknown ADC type {adc['type']}")
+
+def create_distance_driver(distance_sensor: dict) -> SensorDrivers.SensorDriver:
+    sensor_type = distance_sensor.get("type", "ultrasonic")
+    if sensor_type == "ultrasonic":
+        return SensorDrivers.UltrasonicDriver(distance_sensor["gpio_trigger"], distance_sensor["gpio_echo"],
+                                              timeout=distance_sensor.get("timeout", 0.04))
+    elif sensor_type == "simulated":
+        return SensorDrivers.SimulatedDistanceDriver(distance=distance_sensor.get("sim_distance", 1.0), dropout=distance_sensor.get("sim_dropout", 0.0))
+    raise ValueError(f"Unknown distance sensor type {sensor_type}")
+
+def configure_sensor_suite(cfg: dict) -> SensorSuite.SensorSuite:
+    sensor_suite = SensorSuite.SensorSuite(buffer_seconds=cfg.get("sensor_buffer_seconds", 600))
+    sensors = [(SensorTypes.SensorKind.ADC, adc, create_adc_driver, 50, 1) for adc in cfg.get("adcs") or []] \
+        + [(SensorTypes.SensorKind.DISTANCE, sensor, create_distance_driver, 10, 5) for sensor in cfg.get("distance_sensors") or []]
+    for kind, sensor, create_driver, rate, median_window in sensors:
+        try:
+            driver = create_driver(sensor)
+        except (RuntimeError, ValueError) as e:
+            logger.error(f"Not sampling sensor {sensor['name']}: {e}")
+            continue
+        sensor_suite.register_sensor(sensor["id"], sensor["name"], kind, sensor.get("type", "ultrasonic"), driver,
+                                     sensor.get("rate", rate), oversample=sensor.get("oversample", 1),
+                                     median_window=sensor.get("median_window", median_window), ema_alpha=sensor.get("ema_alpha"),
+                                     scale=sensor.get("scale", 1.0), offset=sensor.get("offset", 0.0), unit=sensor.get("unit"))
+    return sensor_suite
+
+@SensorBlueprint.listener('before_server_start')
+async def start_sensors(app):
+    if hasattr(app.ctx, 'bus_owner'):
+        # Sensors are sampled by the bus owner process, see BusOwnerBlueprint
+        return
+    config_path = os.environ.get("CONFIG_PATH", "./config.yaml")
+    with open(config_path) as cfgFile:
+        cfg = yaml.load(cfgFile, Loader=yaml.FullLoader)
+        app.ctx.sensor_suite = configure_sensor_suite(cfg)
+    app.ctx.sensor_suite.start()
+    app.ctx.sensor_broadcaster = StateBroadcaster.StateBroadcaster(app.ctx.sensor_suite, min_interval=0.1, stream="sensors")
+    app.add_task(app.ctx.sensor_broadcaster.run(), name="sensor_broadcaster")
+
+@SensorBlueprint.listener('after_server_stop')
+def stop_sensors(app):
+    if hasattr(app.ctx, 'sensor_suite') and not hasattr(app.ctx, 'bus_owner'):
+        app.ctx.sensor_suite.stop()
@@ -0,0 +1,172 @@
+"""Blocking sensor drivers, called from SensorSuite worker threads only."""
+from typing import Dict, Tuple
+import math
+import random
+import threading
+import time
+
+try:
+    from smbus2 import SMBus
+except ImportError:
+    SMBus = None
+
+try:
+    from RPi import GPIO
+except ImportError:
+    GPIO = None
+
+
+class SensorDriver:
+    unit = ""
+
+    def open(self):
+        pass
+
+    def read(self) -> float:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# One handle and lock per I2C bus, shared by every device on it
+_i2c_buses: Dict[int, Tuple["SMBus", threading.Lock]] = {}
+_i2c_buses_lock = threading.Lock()
+
+def _open_i2c_bus(bus: int) -> Tuple["SMBus", threading.Lock]:
+    with _i2c_buses_lock:
+        if bus not in _i2c_buses:
+            _i2c_buses[bus] = (SMBus(bus), threading.Lock())
+        return _i2c_buses[bus]
+
+
+class ADS1115Driver(SensorDriver):
+    """Single-ended single-shot conversions of one ADS1115 input, in volts."""
+
+    unit = "V"
+
+    CONVERSION_REGISTER = 0x00
+    CONFIG_REGISTER = 0x01
+    # Full scale range (V) per PGA setting
+    FULL_SCALE = {0: 6.144, 1: 4.096, 2: 2.048, 3: 1.024, 4: 0.512, 5: 0.256}
+    DATA_RATES = {8: 0, 16: 1, 32: 2, 64: 3, 128: 4, 250: 5, 475: 6, 860: 7}
+
+    def __init__(self, address: int = 0x48, channel: int = 0, gain: int = 1, data_rate: int = 860, i2c_bus: int = 1):
+        if SMBus is None:
+            raise RuntimeError("The ads1115 driver requires the smbus2 package")
+        if channel not in range(4):
+            raise ValueError(f"ADS1115 channel must be between 0 and 3, not {channel}")
+        if gain not in self.FULL_SCALE or data_rate not in self.DATA_RATES:
+            raise ValueError(f"Unsupported ADS1115 gain {gain} or data rate {data_rate}")
+        self.address = address
+        self.i2c_bus = i2c_bus
+        self.full_scale = self.FULL_SCALE[gain]
+        self.conversion_time = 1 / data_rate + 0.0001
+        config = (1 << 15) | ((0b100 | channel) << 12) | (gain << 9) | (1 << 8) | (self.DATA_RATES[data_rate] << 5) | 0b11
+        self.config = [config >> 8, config & 0xFF]
+        self.bus = None
+        self.lock = None
+
+    def open(self):
+        self.bus, self.lock = _open_i2c_bus(self.i2c_bus)
+
+    def read(self) -> float:
+        # The input multiplexer is shared, so channels of one chip must not interleave
+        with self.lock:
+            self.bus.write_i2c_block_data(self.address, self.CONFIG_REGISTER, self.config)
+            time.sleep(self.conversion_time)
+            high, low = self.bus.read_i2c_block_data(self.address, self.CONVERSION_REGISTER, 2)
+        value = (high << 8) | low
+        if value & 0x8000:
+            value -= 1 << 16
+        return value * self.full_scale / 32768
+
+
+class UltrasonicDriver(SensorDriver):
+    """HC-SR04 style trigger/echo distance sensor, in meters.
+
+    Both echo edges are caught by an RPi.GPIO edge callback armed once when
+    the sensor is opened, so no edge falls between two waits. The callback
+    only takes a timestamp, and the reading thread sleeps on an event until
+    the falling edge arrives.
+    """
+
+    unit = "m"
+
+    def __init__(self, gpio_trigger: int, gpio_echo: int, timeout: float = 0.04, speed_of_sound: float = 343.0):
+        if GPIO is None:
+            raise RuntimeError("The ultrasonic driver requires the RPi.GPIO package")
+        self.gpio_trigger = gpio_trigger
+        self.gpio_echo = gpio_echo
+        self.timeout = timeout
+        self.speed_of_sound = speed_of_sound
+        # Edge timestamps of the current measurement, filled in by the callback thread
+        self.edges = []
+        self.echoed = threading.Event()
+
+    def open(self):
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(self.gpio_trigger, GPIO.OUT, initial=GPIO.LOW)
+        GPIO.setup(self.gpio_echo, GPIO.IN)
+        GPIO.add_event_detect(self.gpio_echo, GPIO.BOTH, callback=self.__edge)
+
+    def __edge(self, channel: int):
+        edges = self.edges
+        edges.append(time.perf_counter())
+        # The echo line idles low, so the first edge after a trigger rises and the second falls
+        if len(edges) == 2:
+            self.echoed.set()
+
+    def read(self) -> float:
+        self.edges = []
+        self.echoed.clear()
+        GPIO.output(self.gpio_trigger, GPIO.HIGH)
+        time.sleep(0.00001)
+        GPIO.output(self.gpio_trigger, GPIO.LOW)
+        if not self.echoed.wait(2 * self.timeout):
+            raise TimeoutError("Echo did not end" if self.edges else "No echo started")
+        rise, fall = self.edges[:2]
+        return (fall - rise) * self.speed_of_sound / 2
+
+    def close(self):
+        GPIO.remove_event_detect(self.gpio_echo)
+        GPIO.cleanup((self.gpio_trigger, self.gpio_echo))
+
+
+class SimulatedADCDriver(SensorDriver):
+    """Noisy sine wave standing in for an ADC input, blocking for a conversion time."""
+
+    unit = "V"
+
+    def __init__(self, offset: float = 1.65, amplitude: float = 0.5, period: float = 10.0, noise: float = 0.01, conversion_time: float = 0.0012):
+        self.offset = offset
+        self.amplitude = amplitude
+        self.period = period
+        self.noise = noise
+        self.conversion_time = conversion_time
+
+    def read(self) -> float:
+        time.sleep(self.conversion_time)
+        return self.offset + self.amplitude * math.sin(2 * math.pi * time.time() / self.period) + random.gauss(0, self.noise)
+
+
+class SimulatedDistanceDriver(SensorDriver):
+    """Slowly varying distance standing in for an ultrasonic sensor, blocking for the echo time."""
+
+    unit = "m"
+
+    def __init__(self, distance: float = 1.0, amplitude: float = 0.2, period: float = 60.0, noise: float = 0.005,
+                 dropout: float = 0.0, speed_of_sound: float = 343.0):
+        self.distance = distance
+        self.amplitude = amplitude
+        self.period = period
+        self.noise = noise
+        self.dropout = dropout
+        self.speed_of_sound = speed_of_sound
+
+    def read(self) -> float:
+        distance = self.distance + self.amplitude * math.sin(2 * math.pi * time.time() / self.period)
+        time.sleep(2 * distance / self.speed_of_sound)
+        if random.random() < self.dropout:
+            raise TimeoutError("No echo started")
+        return distance + random.gauss(0, self.noise)
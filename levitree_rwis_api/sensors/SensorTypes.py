@@ -0,0 +1,28 @@
+from enum import Enum
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+class SensorKind(str, Enum):
+    ADC = "adc"
+    DISTANCE = "distance"
+
+class Sensor(BaseModel):
+    id: str = Field(default="", description='Sensor internal ID', examples=["Pump_Pressure", "Mix_Tank_Distance"])
+    display_name: str = Field(default="", description='Sensor display name', examples=["Pressure Sensor"])
+    kind: SensorKind = Field(default=SensorKind.ADC, description='Sensor kind', examples=[SensorKind.ADC, SensorKind.DISTANCE])
+    driver: str = Field(default="", description='Driver sampling the sensor', examples=["ads1115", "ultrasonic", "simulated"])
+    unit: str = Field(default="", description='Unit of the filtered value', examples=["V", "m", "psi"])
+    rate: float = Field(default=0, description='Configured sample rate (Hz)', examples=[50.0, 10.0])
+
+class SensorReading(BaseModel):
+    value: Optional[float] = Field(default=None, description='Latest filtered value, null until the first sample', examples=[1.25, 0.82])
+    raw: Optional[float] = Field(default=None, description='Latest unfiltered sample', examples=[1.27, 0.84])
+    timestamp: float = Field(default=0, description='Time of the latest sample (UNIX time)', examples=[1700000000.0])
+    sample_rate: float = Field(default=0, description='Achieved sample rate (Hz)', examples=[49.8, 10.0])
+    jitter: float = Field(default=0, description='Mean lateness of samples past their deadline (s)', examples=[0.0002, 0.004])
+    errors: int = Field(default=0, description='Failed samples since startup', examples=[0, 3])
+
+class SensorSamples(BaseModel):
+    timestamps: List[float] = Field(default=[], description='Sample times (UNIX time)', examples=[[1700000000.0, 1700000000.02]])
+    raw: List[float] = Field(default=[], description='Unfiltered samples')
+    filtered: List[float] = Field(default=[], description='Filtered samples')
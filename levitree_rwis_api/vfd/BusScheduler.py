@@ -0,0 +1,93 @@
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Dict, List, Tuple
+import asyncio
+import heapq
+import itertools
+import time
+
+from levitree_rwis_api.Metrics import REGISTRY
+
+BUS_WAIT_SECONDS = REGISTRY.histogram("modbus_bus_wait_seconds", "Time transactions waited for the bus", ("bus", "priority"))
+BUS_HOLD_SECONDS = REGISTRY.histogram("modbus_bus_hold_seconds", "Time transactions held the bus", ("bus", "priority"))
+BUS_QUEUE_DEPTH = REGISTRY.gauge("modbus_bus_queue_depth", "Transactions waiting for the bus", ("bus", "priority"))
+
+
+class Priority(IntEnum):
+    EMERGENCY = 0
+    OPERATOR_WRITE = 1
+    USER_READ = 2
+    POLL = 3
+
+
+class PriorityStats:
+    def __init__(self, bus: str, priority: Priority):
+        self.queue_depth = 0
+        self.transactions = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.wait_histogram = BUS_WAIT_SECONDS.labels(bus, priority.name)
+        self.hold_histogram = BUS_HOLD_SECONDS.labels(bus, priority.name)
+        BUS_QUEUE_DEPTH.labels(bus, priority.name).set_function(lambda: self.queue_depth)
+
+    def record_wait(self, wait: float):
+        self.transactions += 1
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+        self.wait_histogram.observe(wait)
+
+
+class BusScheduler:
+    """Grants a bus to one transaction at a time, highest priority first.
+
+    Waiters of equal priority are served in arrival order. The bus is handed
+    over directly on release, so a queued stop command always runs before the
+    next background poll transaction.
+    """
+
+    def __init__(self, name: str = "default"):
+        self._busy = False
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self.stats: Dict[Priority, PriorityStats] = {priority: PriorityStats(name, priority) for priority in Priority}
+
+    @asynccontextmanager
+    async def reserve(self, priority: Priority):
+        await self.acquire(priority)
+        acquired = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stats[priority].hold_histogram.observe(time.monotonic() - acquired)
+            self.release()
+
+    async def acquire(self, priority: Priority):
+        stats = self.stats[priority]
+        if not self._busy and not self._waiters:
+            self._busy = True
+            stats.record_wait(0.0)
+            return
+
+        start = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        stats.queue_depth += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # The bus may have been handed to us just before the cancellation landed
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            stats.queue_depth -= 1
+        stats.record_wait(time.monotonic() - start)
+
+    def release(self):
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._busy = False
@@ -0,0 +1,98 @@
+from enum import Enum
+from typing import Dict
+
+from levitree_rwis_api.Metrics import REGISTRY
+
+BREAKER_TRANSITIONS = REGISTRY.counter("vfd_breaker_transitions_total", "Device circuit breaker state changes", ("bus", "vfd", "state"))
+BUS_RECONNECTS = REGISTRY.counter("modbus_bus_reconnects_total", "Reconnects of a bus on which every device was failing", ("bus",))
+
+
+class BreakerState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class DeviceBreaker:
+    """Circuit breaker of a single device.
+
+    After `failure_threshold` failed polls in a row the breaker opens and the
+    device leaves the regular sweep. It is then probed once per probe
+    interval, the interval doubling after every failed probe up to
+    `max_probe_interval`. The first successful poll closes it again.
+    """
+
+    def __init__(self, bus: str, vfd_id: str, failure_threshold: int = 3, probe_interval: float = 2.0, max_probe_interval: float = 60.0):
+        self.bus = bus
+        self.vfd_id = vfd_id
+        self.failure_threshold = failure_threshold
+        self.initial_probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.probe_interval = probe_interval
+        self.next_probe = 0.0
+
+    def __transition(self, state: BreakerState):
+        self.state = state
+        BREAKER_TRANSITIONS.labels(self.bus, self.vfd_id, state.value).inc()
+
+    def begin_probe(self):
+        if self.state == BreakerState.OPEN:
+            self.__transition(BreakerState.HALF_OPEN)
+
+    def record_success(self) -> bool:
+        """Returns True if this closed the breaker."""
+        self.failures = 0
+        self.probe_interval = self.initial_probe_interval
+        if self.state != BreakerState.CLOSED:
+            self.__transition(BreakerState.CLOSED)
+            return True
+        return False
+
+    def record_failure(self, now: float) -> bool:
+        """Returns True if this opened the breaker."""
+        self.failures += 1
+        if self.state == BreakerState.HALF_OPEN:
+            self.probe_interval = min(self.probe_interval * 2, self.max_probe_interval)
+            self.next_probe = now + self.probe_interval
+            self.__transition(BreakerState.OPEN)
+        elif self.state == BreakerState.CLOSED and self.failures >= self.failure_threshold:
+            self.next_probe = now + self.probe_interval
+            self.__transition(BreakerState.OPEN)
+            return True
+        return False
+
+
+class BusHealth:
+    """Circuit breakers of the devices on one bus, and the bus's reconnect backoff.
+
+    A single dead device never touches the shared connection. The bus is only
+    reconnected once every device on it is failing, at most once per
+    reconnect interval, which doubles after each reconnect that did not help.
+    """
+
+    def __init__(self, name: str, reconnect_interval: float = 1.0, max_reconnect_interval: float = 60.0):
+        self.name = name
+        self.breakers: Dict[str, DeviceBreaker] = {}
+        self.initial_reconnect_interval = reconnect_interval
+        self.max_reconnect_interval = max_reconnect_interval
+        self.reconnect_interval = reconnect_interval
+        self.next_reconnect = 0.0
+
+    def add(self, vfd_id: str):
+        self.breakers[vfd_id] = DeviceBreaker(self.name, vfd_id)
+
+    def failing(self) -> bool:
+        return bool(self.breakers) and all(breaker.state != BreakerState.CLOSED for breaker in self.breakers.values())
+
+    def reconnect_due(self, now: float) -> bool:
+        return self.failing() and now >= self.next_reconnect
+
+    def record_reconnect(self, now: float):
+        BUS_RECONNECTS.labels(self.name).inc()
+        self.next_reconnect = now + self.reconnect_interval
+        self.reconnect_interval = min(self.reconnect_interval * 2, self.max_reconnect_interval)
+
+    def record_success(self):
+        self.reconnect_interval = self.initial_reconnect_interval
@@ -0,0 +1,150 @@
+from typing import List, Optional, Set
+from sanic.log import logger
+
+import asyncio
+import sqlite3
+import threading
+import time
+
+from . import VFDTypes
+from levitree_rwis_api.Metrics import REGISTRY
+
+EVENTS = REGISTRY.counter("vfd_events_total", "Recorded VFD alarm and state transition events", ("kind",))
+EVENT_FLUSH_SECONDS = REGISTRY.histogram("vfd_event_flush_seconds", "Duration of writing one batch of events to the event log").labels()
+EVENTS_DROPPED = REGISTRY.counter("vfd_events_dropped_total", "Events not delivered to a live subscriber that fell behind").labels()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    vfd_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    kind TEXT NOT NULL,
+    alarm_code INTEGER NOT NULL,
+    drive_mode INTEGER,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_vfd_time ON events (vfd_id, timestamp);
+CREATE INDEX IF NOT EXISTS events_time ON events (timestamp);
+"""
+
+COLUMNS = ("id", "vfd_id", "timestamp", "kind", "alarm_code", "drive_mode", "message")
+
+
+class EventLog:
+    """Append-only log of VFD alarms and state transitions in SQLite.
+
+    Events are recorded in memory on the event loop and written by a
+    background thread in one transaction every `flush_interval` seconds, so a
+    poll never waits for the disk. The database runs in WAL mode and is
+    indexed by device and time. Live subscribers get every event as it is
+    recorded, through a bounded queue each.
+    """
+
+    def __init__(self, path: str = ":memory:", flush_interval: float = 1.0, subscriber_queue_size: int = 1000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.subscriber_queue_size = subscriber_queue_size
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.__pending: List[VFDTypes.VFDEvent] = []
+        self.__pending_lock = threading.Lock()
+        # One connection, shared by the writer thread and queries under this lock
+        self.__db_lock = threading.Lock()
+        self.__db = self.__open(path)
+        self.next_id = (self.__db.execute("SELECT MAX(id) FROM events").fetchone()[0] or 0) + 1
+        self.__stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def __open(path: str) -> sqlite3.Connection:
+        try:
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.Error as e:
+            logger.error(f"Could not open event log {path} ({e}), events are only kept in memory")
+            db = sqlite3.connect(":memory:", check_same_thread=False)
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA)
+        return db
+
+    def start(self):
+        self.__stop.clear()
+        self.thread = threading.Thread(target=self.__write, name="vfd_event_log", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops the writer thread and writes out any events still pending."""
+        self.__stop.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def record(self, vfd_id: str, kind: VFDTypes.EventKind, alarm_code: int = 0,
+               drive_mode: Optional[VFDTypes.DriveMode] = None, message: str = "") -> VFDTypes.VFDEvent:
+        """Records an event, runs on the event loop and never touches the database."""
+        event = VFDTypes.VFDEvent(id=self.next_id, vfd_id=vfd_id, timestamp=time.time(), kind=kind,
+                                  alarm_code=alarm_code, drive_mode=drive_mode, message=message)
+        self.next_id += 1
+        with self.__pending_lock:
+            self.__pending.append(event)
+        EVENTS.labels(kind.value).inc()
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                EVENTS_DROPPED.inc()
+        return event
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(self.subscriber_queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def flush(self):
+        # The swap happens under the database lock too, so a query never overtakes a batch taken before it
+        with self.__db_lock:
+            with self.__pending_lock:
+                events, self.__pending = self.__pending, []
+            if not events:
+                return
+            started = time.monotonic()
+            rows = [(event.id, event.vfd_id, event.timestamp, event.kind.value, event.alarm_code,
+                     None if event.drive_mode is None else int(event.drive_mode), event.message) for event in events]
+            try:
+                with self.__db:
+                    self.__db.executemany(f"INSERT OR IGNORE INTO events ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            except sqlite3.Error as e:
+                logger.error(f"Could not write {len(rows)} events to the event log: {e}")
+                return
+        EVENT_FLUSH_SECONDS.observe(time.monotonic() - started)
+
+    def query(self, vfd_id: Optional[str] = None, start: Optional[float] = None, end: Optional[float] = None,
+              kinds: Optional[List[VFDTypes.EventKind]] = None, limit: int = 100) -> List[VFDTypes.VFDEvent]:
+        """Returns matching events, newest first. Blocks on the database, run it in a thread."""
+        # Pending events are written first so a query sees everything recorded before it
+        self.flush()
+        conditions, params = [], []
+        if vfd_id is not None:
+            conditions.append("vfd_id = ?")
+            params.append(vfd_id)
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("timestamp < ?")
+            params.append(end)
+        if kinds:
+            conditions.append(f"kind IN ({', '.join('?' for _ in kinds)})")
+            params.extend(kind.value for kind in kinds)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.__db_lock:
+            rows = self.__db.execute(f"SELECT {', '.join(COLUMNS)} FROM events {where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+                                     (*params, limit)).fetchall()
+        return [VFDTypes.VFDEvent(**dict(zip(COLUMNS, row))) for row in rows]
+
+    def __write(self):
+        while not self.__stop.wait(self.flush_interval):
+            self.flush()
@@ -0,0 +1,282 @@
+"""Simulated Frenic drives behind a Modbus RTU slave.
+
+The simulator answers on a TCP loopback socket (`serial-tcp://` URLs, raw RTU
+frames over TCP) or on a pseudo terminal (`serial://` URLs), so anything that
+opens a bus through `core.modbus_for_url` can talk to it without hardware.
+
+    python -m levitree_rwis_api.vfd.FrenicSimulator --devices 4 --port 5020
+"""
+from typing import Dict, Optional
+import argparse
+import asyncio
+import os
+import random
+import struct
+import time
+import tty
+
+from umodbus.client.serial.redundancy_check import get_crc
+
+from . import Frenic
+
+ILLEGAL_FUNCTION = 1
+ILLEGAL_DATA_ADDRESS = 2
+
+# Bits per character on the line: start, 8 data, parity, stop
+CHARACTER_BITS = 11
+
+
+class SimulatedFrenic:
+    """Register image of a single drive.
+
+    Output frequency follows the commanded frequency with a fixed ramp while
+    the drive runs, and the measured values are derived from it.
+    """
+
+    RAMP_RATE = 10.0
+
+    def __init__(self, slave_id: int, max_frequency: float = 60.0):
+        self.slave_id = slave_id
+        self.registers: Dict[int, int] = {}
+        for code in ("M05", "M06", "M07", "M08", "M09", "M10", "M11", "M12", "M13", "M14", "M15",
+                     "M16", "M17", "M18", "M19", "S05", "S06"):
+            self.registers[Frenic.function_code_to_coil(code)] = 0
+        self.registers[Frenic.function_code_to_coil("F03")] = int(max_frequency * 10)
+        self.frequency = 0.0
+        self.last_update = time.monotonic()
+
+    def __getitem__(self, code: str) -> int:
+        return self.registers[Frenic.function_code_to_coil(code)]
+
+    def __setitem__(self, code: str, value: int):
+        self.registers[Frenic.function_code_to_coil(code)] = value & 0xFFFF
+
+    def trip(self, alarm_code: int):
+        for newer, older in (("M18", "M19"), ("M17", "M18"), ("M16", "M17")):
+            self[older] = self[newer]
+        self["M16"] = alarm_code
+        self["S06"] = 0
+
+    def update(self):
+        now = time.monotonic()
+        elapsed = now - self.last_update
+        self.last_update = now
+
+        command = self["S06"]
+        alarm = self["M16"] != 0
+        running = bool(command & 0b11) and not alarm
+        target = self["S05"] / 100 if running else 0.0
+        step = self.RAMP_RATE * elapsed
+        if self.frequency < target:
+            self.frequency = min(target, self.frequency + step)
+        else:
+            self.frequency = max(target, self.frequency - step)
+
+        status = command & 0b11 if self.frequency > 0 or running else 0
+        if alarm:
+            status |= 1 << 11
+        load = self.frequency / max(self["F03"] / 10, 1)
+        self["M05"] = self["S05"]
+        self["M09"] = int(self.frequency * 100)
+        self["M10"] = int(load * 150)
+        self["M11"] = int(load * 820)
+        self["M12"] = int(load * 2300)
+        self["M13"] = command & 0b11
+        self["M14"] = status
+
+    def read(self, address: int, count: int) -> Optional[list]:
+        self.update()
+        values = []
+        for offset in range(count):
+            value = self.registers.get(address + offset)
+            if value is None:
+                return None
+            values.append(value)
+        return values
+
+    def write(self, address: int, value: int) -> bool:
+        if address not in self.registers:
+            return False
+        if address == Frenic.function_code_to_coil("S06") and value & 0x8000:
+            self["M16"] = 0
+            value &= 0x7FFF
+        self.registers[address] = value & 0xFFFF
+        self.update()
+        return True
+
+
+class FrenicSimulator:
+    """Modbus RTU slave serving a number of simulated drives.
+
+    `baudrate` adds the time the request and response would spend on the wire,
+    `latency` the drive's turnaround time, and `drop_rate` the probability a
+    request is silently ignored, as a drive with a corrupted frame would.
+    """
+
+    def __init__(self, devices: int = 1, baudrate: int = 9600, latency: float = 0.005,
+                 drop_rate: float = 0.0, first_slave_id: int = 1):
+        self.baudrate = baudrate
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.devices: Dict[int, SimulatedFrenic] = {
+            slave_id: SimulatedFrenic(slave_id) for slave_id in range(first_slave_id, first_slave_id + devices)
+        }
+        self.requests = 0
+        self.dropped = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+        self._pty_fds = None
+
+    def wire_time(self, frame_bytes: int) -> float:
+        if not self.baudrate:
+            return 0.0
+        return frame_bytes * CHARACTER_BITS / self.baudrate
+
+    @staticmethod
+    def frame_length(buffer: bytes) -> Optional[int]:
+        if len(buffer) < 2:
+            return None
+        function = buffer[1]
+        if function in (3, 4, 5, 6):
+            return 8
+        if function in (15, 16):
+            return 9 + buffer[6] if len(buffer) >= 7 else None
+        return -1
+
+    def handle(self, frame: bytes) -> Optional[bytes]:
+        """Returns the response frame for a request, or None if nothing is sent back."""
+        self.requests += 1
+        if get_crc(frame[:-2]) != frame[-2:]:
+            return None
+        if self.drop_rate and random.random() < self.drop_rate:
+            self.dropped += 1
+            return None
+
+        slave_id, function = frame[0], frame[1]
+        targets = list(self.devices.values()) if slave_id == 0 else [self.devices.get(slave_id)]
+        if targets[0] is None:
+            return None
+
+        if function == 3:
+            if slave_id == 0:
+                return None
+            address, count = struct.unpack(">HH", frame[2:6])
+            values = targets[0].read(address, count)
+            if values is None:
+                pdu = struct.pack(">BB", function | 0x80, ILLEGAL_DATA_ADDRESS)
+            else:
+                pdu = struct.pack(f">BB{count}H", function, count * 2, *values)
+        elif function == 6:
+            address, value = struct.unpack(">HH", frame[2:6])
+            ok = all([device.write(address, value) for device in targets])
+            pdu = frame[1:6] if ok else struct.pack(">BB", function | 0x80, ILLEGAL_DATA_ADDRESS)
+        elif function == 16:
+            address, count = struct.unpack(">HH", frame[2:6])
+            values = struct.unpack(f">{count}H", frame[7:7 + count * 2])
+            ok = all([device.write(address + offset, value) for device in targets for offset, value in enumerate(values)])
+            pdu = frame[1:6] if ok else struct.pack(">BB", function | 0x80, ILLEGAL_DATA_ADDRESS)
+        else:
+            pdu = struct.pack(">BB", function | 0x80, ILLEGAL_FUNCTION)
+
+        # Broadcast requests are never answered
+        if slave_id == 0:
+            return None
+        response = bytes([slave_id]) + pdu
+        return response + get_crc(response)
+
+    async def _process(self, buffer: bytearray, send):
+        while True:
+            length = self.frame_length(buffer)
+            if length is None or len(buffer) < length:
+                return
+            if length < 0:
+                # Unknown framing, resynchronise on the next request
+                buffer.clear()
+                return
+            frame = bytes(buffer[:length])
+            del buffer[:length]
+            response = self.handle(frame)
+            wire_time = self.wire_time(len(frame) + (len(response) if response else 0))
+            await asyncio.sleep(wire_time + self.latency)
+            if response is not None:
+                send(response)
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        buffer = bytearray()
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                data = await reader.read(256)
+                if not data:
+                    return
+                buffer += data
+                await self._process(buffer, writer.write)
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def serve_tcp(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Listens on a loopback socket and returns the bus URL for it."""
+        self._server = await asyncio.start_server(self._serve_connection, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        return f"serial-tcp://{host}:{port}"
+
+    async def serve_pty(self) -> str:
+        """Opens a pseudo terminal and returns the bus URL of its slave side."""
+        master, slave = os.openpty()
+        tty.setraw(master)
+        tty.setraw(slave)
+        self._pty_fds = (master, slave)
+        loop = asyncio.get_running_loop()
+        buffer = bytearray()
+        pending = asyncio.Queue()
+
+        def on_readable():
+            pending.put_nowait(os.read(master, 256))
+
+        async def pump():
+            while True:
+                buffer.extend(await pending.get())
+                await self._process(buffer, lambda response: os.write(master, response))
+
+        loop.add_reader(master, on_readable)
+        self._pty_task = asyncio.create_task(pump())
+        return f"serial://{os.ttyname(slave)}"
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            connections = list(self._connections.items())
+            for writer, _ in connections:
+                writer.close()
+            await asyncio.gather(*[task for _, task in connections], return_exceptions=True)
+            await self._server.wait_closed()
+        if self._pty_fds is not None:
+            asyncio.get_running_loop().remove_reader(self._pty_fds[0])
+            self._pty_task.cancel()
+            for fd in self._pty_fds:
+                os.close(fd)
+            self._pty_fds = None
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Simulated Frenic Modbus RTU drives")
+    parser.add_argument("--devices", type=int, default=1, help="number of drives, slave IDs start at 1")
+    parser.add_argument("--baudrate", type=int, default=9600, help="simulated line speed, 0 for no wire delay")
+    parser.add_argument("--latency", type=float, default=0.005, help="drive turnaround time (s)")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="probability of ignoring a request")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--pty", action="store_true", help="serve on a pseudo terminal instead of TCP")
+    args = parser.parse_args()
+
+    simulator = FrenicSimulator(args.devices, baudrate=args.baudrate, latency=args.latency, drop_rate=args.drop_rate)
+    url = await (simulator.serve_pty() if args.pty else simulator.serve_tcp(args.host, args.port))
+    print(f"Simulating {args.devices} Frenic drive(s) at {url}", flush=True)
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+from typing import Dict, List
+from urllib.parse import urlparse
+from sanic.log import logger
+from async_modbus import core, AsyncClient, AsyncRTUClient
+from umodbus.client.serial import rtu
+from umodbus.client.serial.redundancy_check import CRCError
+from umodbus.exceptions import ModbusError
+import asyncio
+import connio
+import time
+
+from levitree_rwis_api.Metrics import REGISTRY
+from .BusScheduler import BusScheduler
+from .DeviceHealth import BusHealth
+from .PollScheduler import PollScheduler
+
+TRANSACTION_SECONDS = REGISTRY.histogram("modbus_transaction_seconds", "Duration of successful Modbus transactions", ("bus", "slave", "function"))
+TRANSACTION_ERRORS = REGISTRY.counter("modbus_transaction_errors_total", "Failed Modbus transactions by cause", ("bus", "slave", "kind"))
+
+# Bits per character on the line: start, 8 data, parity, stop
+CHARACTER_BITS = 11
+
+
+class SlaveMetrics:
+    __slots__ = ("read_latency", "write_latency", "timeouts", "crc_errors", "exceptions", "serial_errors")
+
+    def __init__(self, bus: str, slave_id: int):
+        self.read_latency = TRANSACTION_SECONDS.labels(bus, slave_id, "read")
+        self.write_latency = TRANSACTION_SECONDS.labels(bus, slave_id, "write")
+        self.timeouts = TRANSACTION_ERRORS.labels(bus, slave_id, "timeout")
+        self.crc_errors = TRANSACTION_ERRORS.labels(bus, slave_id, "crc")
+        self.exceptions = TRANSACTION_ERRORS.labels(bus, slave_id, "exception_response")
+        self.serial_errors = TRANSACTION_ERRORS.labels(bus, slave_id, "serial")
+
+
+class ModbusBus:
+    """A single Modbus line with its own client and transaction scheduler.
+
+    Every bus is polled by its own task, so drives on different lines never
+    wait on each other.
+    """
+
+    def __init__(self, name: str, url: str, baudrate: int = 9600, parity: str = "E",
+                 poll_rate_running: float = 5, poll_rate_stopped: float = 0.5, turnaround: float = 0.01, broadcast: bool = False):
+        self.name = name
+        self.url = url
+        self.baudrate = baudrate
+        self.parity = parity
+        self.poll_rate_running = poll_rate_running
+        self.poll_rate_stopped = poll_rate_stopped
+        # Typical slave response delay (s), used to estimate the bus budget
+        self.turnaround = turnaround
+        # Every slave on the line acts on a broadcast, so it is only used when the line is known to hold nothing but our drives
+        self.broadcast = broadcast
+        # Time slaves are given to act on a broadcast before the next frame (s)
+        self.broadcast_delay = 0.1
+        self.client: AsyncClient = None
+        self.scheduler = BusScheduler(name)
+        self.poller = PollScheduler()
+        self.health = BusHealth(name)
+        self.vfd_ids: List[str] = []
+        self._slave_metrics: Dict[int, SlaveMetrics] = {}
+
+    def transaction_time(self, request_bytes: int, response_bytes: int) -> float:
+        character = CHARACTER_BITS / self.baudrate
+        # Both frames are followed by a 3.5 character silent interval
+        return (request_bytes + response_bytes + 7) * character + self.turnaround
+
+    async def read_holding_registers(self, slave_id: int, address: int, count: int, timeout: float = 0.4):
+        metrics = self.__slave_metrics(slave_id)
+        return await self.__transaction(metrics, metrics.read_latency, self.client.read_holding_registers(slave_id, address, count), timeout)
+
+    async def write_register(self, slave_id: int, address: int, value: int, timeout: float = 0.4):
+        metrics = self.__slave_metrics(slave_id)
+        return await self.__transaction(metrics, metrics.write_latency, self.client.write_register(slave_id, address, value), timeout)
+
+    async def write_registers(self, slave_id: int, address: int, values: List[int], timeout: float = 0.4):
+        metrics = self.__slave_metrics(slave_id)
+        return await self.__transaction(metrics, metrics.write_latency, self.client.write_registers(slave_id, address, values), timeout)
+
+    def __slave_metrics(self, slave_id: int) -> SlaveMetrics:
+        metrics = self._slave_metrics.get(slave_id)
+        if metrics is None:
+            metrics = self._slave_metrics[slave_id] = SlaveMetrics(self.name, slave_id)
+        return metrics
+
+    async def __transaction(self, metrics: SlaveMetrics, latency, request, timeout: float):
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(request, timeout=timeout)
+        except asyncio.TimeoutError:
+            metrics.timeouts.inc()
+            raise
+        except CRCError:
+            metrics.crc_errors.inc()
+            raise
+        except ModbusError:
+            metrics.exceptions.inc()
+            raise
+        except OSError:
+            metrics.serial_errors.inc()
+            raise
+        latency.observe(time.monotonic() - start)
+        return result
+
+    def supports_broadcast(self) -> bool:
+        return self.broadcast and isinstance(self.client, AsyncRTUClient)
+
+    async def broadcast_register(self, address: int, value: int):
+        """Writes a register on every slave of the bus with a single frame.
+
+        Broadcasts are never answered, so the caller must hold the bus and
+        verify the result with reads if needed.
+        """
+        self.client.stream.write(rtu.write_single_register(0, address, value))
+        await self.client.stream.drain()
+        await asyncio.sleep(self.transaction_time(8, 0) + self.broadcast_delay)
+
+    def initialize(self):
+        logger.info(f"Initializing Modbus communications on bus {self.name} ({self.url})")
+        self.client = self.__create_client()
+
+    async def reconnect(self):
+        """Replaces the client with a new connection, created in a thread as opening a serial port can block."""
+        logger.info(f"Reconnecting Modbus bus {self.name} ({self.url})")
+        old_client = self.client
+        self.client = await asyncio.to_thread(self.__create_client)
+        if old_client is not None:
+            try:
+                await old_client.stream.close()
+            except Exception as e:
+                logger.debug(f"Closing the previous connection of bus {self.name} failed: {e!r}")
+
+    def __create_client(self) -> AsyncClient:
+        conn_options = {}
+        if urlparse(self.url).scheme in connio.SERIAL_SCHEMES:
+            conn_options = {"baudrate": self.baudrate, "parity": self.parity}
+        return core.modbus_for_url(self.url, conn_options)
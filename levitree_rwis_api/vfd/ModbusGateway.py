@@ -0,0 +1,154 @@
+from typing import Dict, Optional
+from sanic.log import logger
+
+from umodbus.client.serial.redundancy_check import CRCError
+from umodbus.exceptions import ModbusError
+import asyncio
+import struct
+
+from levitree_rwis_api.Metrics import REGISTRY
+from .VFDController import VFDController
+
+GATEWAY_REQUESTS = REGISTRY.counter("modbus_gateway_requests_total", "Modbus TCP gateway requests by function and result", ("function", "result"))
+# Only labelled once a gateway starts, so processes without one do not export it
+GATEWAY_CONNECTIONS = REGISTRY.gauge("modbus_gateway_connections", "Connected Modbus TCP gateway clients")
+
+# transaction id, protocol id, length of the unit id and PDU, unit id
+MBAP = struct.Struct(">HHHB")
+
+READ_HOLDING_REGISTERS = 3
+WRITE_SINGLE_REGISTER = 6
+WRITE_MULTIPLE_REGISTERS = 16
+
+ILLEGAL_FUNCTION = 1
+ILLEGAL_DATA_VALUE = 3
+SLAVE_DEVICE_FAILURE = 4
+GATEWAY_PATH_UNAVAILABLE = 10
+GATEWAY_TARGET_FAILED_TO_RESPOND = 11
+
+
+class GatewayException(Exception):
+    def __init__(self, code: int):
+        self.code = code
+
+
+class ModbusGateway:
+    """Modbus TCP server that shares the RTU buses with polling.
+
+    Unit IDs map to drives, by default each drive's slave ID. Holding
+    register reads are answered from the poll cache when it is no older than
+    `max_age` seconds and otherwise read at user priority, identical reads in
+    flight sharing one bus transaction. Writes go through the bus scheduler
+    at operator priority, like the API's own commands.
+    """
+
+    def __init__(self, controller: VFDController, host: str = "0.0.0.0", port: int = 502, max_age: float = 0.5,
+                 units: Optional[Dict[int, str]] = None):
+        self.controller = controller
+        self.host = host
+        self.port = port
+        self.max_age = max_age
+        self.units: Dict[int, str] = {}
+        if units is None:
+            for vfd in controller.get_vfds().values():
+                if vfd.slave_id in self.units:
+                    logger.warning(f"Modbus gateway unit {vfd.slave_id} is already mapped to {self.units[vfd.slave_id]}, {vfd.id} is not reachable through it")
+                    continue
+                self.units[vfd.slave_id] = vfd.id
+        else:
+            for unit_id, vfd_id in units.items():
+                if not controller.has_vfd(vfd_id):
+                    raise ValueError(f"Modbus gateway unit {unit_id} is mapped to unknown VFD {vfd_id}")
+                self.units[int(unit_id)] = vfd_id
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.connections: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+        self.connections_gauge = None
+
+    async def start(self):
+        self.connections_gauge = GATEWAY_CONNECTIONS.labels()
+        self.server = await asyncio.start_server(self.__serve, self.host, self.port)
+        logger.info(f"Modbus TCP gateway listening on {self.host}:{self.port} for units {', '.join(str(unit_id) for unit_id in sorted(self.units))}")
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            connections = list(self.connections.items())
+            for writer, _ in connections:
+                writer.close()
+            await asyncio.gather(*[task for _, task in connections], return_exceptions=True)
+            await self.server.wait_closed()
+            self.server = None
+
+    async def __serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tasks = set()
+        self.connections[writer] = asyncio.current_task()
+        self.connections_gauge.set(len(self.connections))
+        try:
+            while True:
+                transaction_id, protocol_id, length, unit_id = MBAP.unpack(await reader.readexactly(MBAP.size))
+                if protocol_id != 0 or length < 2 or length > 254:
+                    # Not Modbus, or the framing is lost
+                    return
+                pdu = await reader.readexactly(length - 1)
+                # Clients may pipeline requests, responses go out as they complete
+                task = asyncio.create_task(self.__respond(transaction_id, unit_id, pdu, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            self.connections_gauge.set(len(self.connections))
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def __respond(self, transaction_id: int, unit_id: int, pdu: bytes, writer: asyncio.StreamWriter):
+        function = pdu[0]
+        try:
+            response = await self.__handle(unit_id, function, pdu)
+            GATEWAY_REQUESTS.labels(function, "ok").inc()
+        except GatewayException as e:
+            response = struct.pack(">BB", function | 0x80, e.code)
+            GATEWAY_REQUESTS.labels(function, "exception").inc()
+        if writer.is_closing():
+            return
+        writer.write(MBAP.pack(transaction_id, 0, len(response) + 1, unit_id) + response)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def __handle(self, unit_id: int, function: int, pdu: bytes) -> bytes:
+        vfd_id = self.units.get(unit_id)
+        if vfd_id is None:
+            raise GatewayException(GATEWAY_PATH_UNAVAILABLE)
+        try:
+            if function == READ_HOLDING_REGISTERS and len(pdu) == 5:
+                address, count = struct.unpack(">HH", pdu[1:5])
+                if count < 1 or count > 125:
+                    raise GatewayException(ILLEGAL_DATA_VALUE)
+                values = await self.controller.read_registers(vfd_id, address, count, max_age=self.max_age)
+                return struct.pack(f">BB{count}H", function, count * 2, *values)
+            if function == WRITE_SINGLE_REGISTER and len(pdu) == 5:
+                address, value = struct.unpack(">HH", pdu[1:5])
+                await self.controller.write_registers(vfd_id, address, [value])
+                return pdu
+            if function == WRITE_MULTIPLE_REGISTERS and len(pdu) >= 6:
+                address, count, byte_count = struct.unpack(">HHB", pdu[1:6])
+                if count < 1 or count > 123 or byte_count != count * 2 or len(pdu) != 6 + byte_count:
+                    raise GatewayException(ILLEGAL_DATA_VALUE)
+                await self.controller.write_registers(vfd_id, address, list(struct.unpack(f">{count}H", pdu[6:])))
+                return pdu[:5]
+        except ModbusError as e:
+            # The drive's own exception response is passed through
+            raise GatewayException(e.error_code)
+        except (asyncio.TimeoutError, CRCError, OSError) as e:
+            logger.debug(f"Modbus gateway request for unit {unit_id} failed: {e!r}")
+            raise GatewayException(GATEWAY_TARGET_FAILED_TO_RESPOND)
+        except GatewayException:
+            raise
+        except Exception as e:
+            logger.warning(f"Modbus gateway request for unit {unit_id} failed: {e!r}")
+            raise GatewayException(SLAVE_DEVICE_FAILURE)
+        raise GatewayException(ILLEGAL_FUNCTION)
@@ -0,0 +1,55 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .RegisterMap import ReadBlock, RegisterMap
+
+
+class ParameterCache:
+    """Raw register values last read from a single drive.
+
+    Registers with a TTL in the register map are only re-read once their cached
+    value expires, so configuration parameters such as the maximum frequency
+    stay off the bus between polls. Writes and reconnects invalidate entries.
+    """
+
+    def __init__(self):
+        self.values: Dict[int, Tuple[int, float]] = {}
+
+    def due(self, register_map: RegisterMap, codes: Iterable[str], now: float) -> Set[str]:
+        due = set()
+        for code in codes:
+            register = register_map[code]
+            if register.ttl is None:
+                due.add(code)
+                continue
+            entry = self.values.get(register.address)
+            if entry is None or now - entry[1] >= register.ttl:
+                due.add(code)
+        return due
+
+    def store(self, blocks: Sequence[ReadBlock], results: Sequence[Sequence[int]], now: float):
+        for block, result in zip(blocks, results):
+            for offset in range(block.count):
+                self.values[block.address + offset] = (int(result[offset]), now)
+
+    def store_range(self, address: int, values: Sequence[int], now: float):
+        for offset, value in enumerate(values):
+            self.values[address + offset] = (int(value), now)
+
+    def get(self, address: int) -> Optional[Tuple[int, float]]:
+        return self.values.get(address)
+
+    def get_range(self, address: int, count: int, oldest: float) -> Optional[List[int]]:
+        """Returns the cached values of a register range if all of them were read at or after `oldest`."""
+        values = []
+        for offset in range(count):
+            entry = self.values.get(address + offset)
+            if entry is None or entry[1] < oldest:
+                return None
+            values.append(entry[0])
+        return values
+
+    def invalidate(self, address: Optional[int] = None):
+        if address is None:
+            self.values.clear()
+        else:
+            self.values.pop(address, None)
@@ -0,0 +1,82 @@
+from typing import Dict
+import asyncio
+import time
+
+
+class PollTarget:
+    def __init__(self, vfd_id: str, running_rate: float, stopped_rate: float, cost: float):
+        self.vfd_id = vfd_id
+        self.running_rate = running_rate
+        self.stopped_rate = stopped_rate
+        # Estimated bus time of one poll of this device (s)
+        self.cost = cost
+        self.period = 1 / running_rate
+        self.deadline = 0.0
+        self.last_start = None
+        self.interval = 0.0
+        self.jitter = 0.0
+        self.polls = 0
+
+
+class PollScheduler:
+    """Earliest-deadline-first polling of the devices on one bus.
+
+    Each device is due again one period after its previous deadline, at its
+    running or stopped rate. Deadlines are absolute, so time spent polling does
+    not stretch the period, and when the bus is saturated the most overdue
+    device is always polled next.
+    """
+
+    SMOOTHING = 0.1
+
+    def __init__(self):
+        self.targets: Dict[str, PollTarget] = {}
+        self._wakeup = asyncio.Event()
+
+    def add(self, vfd_id: str, running_rate: float, stopped_rate: float, cost: float):
+        self.targets[vfd_id] = PollTarget(vfd_id, running_rate, stopped_rate, cost)
+
+    def expedite(self, vfd_id: str):
+        """Makes a device due immediately, e.g. after a command changed its state."""
+        target = self.targets[vfd_id]
+        target.deadline = min(target.deadline, time.monotonic())
+        self._wakeup.set()
+
+    def defer(self, vfd_id: str, until: float):
+        """Keeps a device out of the sweep until `until`, e.g. while its circuit breaker is open."""
+        self.targets[vfd_id].deadline = until
+
+    async def next_target(self) -> PollTarget:
+        while True:
+            target = min(self.targets.values(), key=lambda target: target.deadline)
+            delay = target.deadline - time.monotonic()
+            if delay <= 0:
+                return target
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def complete(self, target: PollTarget, started: float, running: bool):
+        lateness = max(started - target.deadline, 0.0)
+        if target.last_start is not None:
+            interval = started - target.last_start
+            target.interval = interval if not target.interval else target.interval + self.SMOOTHING * (interval - target.interval)
+            target.jitter = target.jitter + self.SMOOTHING * (lateness - target.jitter)
+        target.last_start = started
+        target.polls += 1
+
+        period = 1 / (target.running_rate if running else target.stopped_rate)
+        if period != target.period:
+            # Rate class changed, start measuring the achieved rate afresh
+            target.period = period
+            target.interval = 0.0
+            target.last_start = None
+        target.deadline += target.period
+        if target.deadline <= started:
+            # Skip the slots that were missed instead of bursting to catch up
+            target.deadline = started + target.period
+
+    def estimated_utilization(self) -> float:
+        return sum(target.cost / target.period for target in self.targets.values())
@@ -0,0 +1,83 @@
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+
+class Register(NamedTuple):
+    code: str
+    address: int
+    field: str
+    divisor: int = 1
+    # Seconds a read value stays valid, None re-reads the register on every poll
+    ttl: Optional[float] = None
+
+
+class ReadBlock(NamedTuple):
+    address: int
+    count: int
+    registers: Tuple[Tuple[int, Register], ...]
+
+
+class RegisterMap:
+    """Declarative register map for a drive model.
+
+    Addresses and scaling are resolved once when the map is built. `plan` merges
+    the requested function codes into the fewest contiguous reads, and `decode`
+    turns the raw read results back into scaled field values in a single pass.
+    """
+
+    def __init__(self, registers: Iterable[Register], max_gap: int = 8, max_count: int = 64):
+        self.registers: Dict[str, Register] = {register.code: register for register in registers}
+        self.fields: Dict[str, Register] = {register.field: register for register in self.registers.values()}
+        # Reading a few unused registers is far cheaper than another round trip on the bus
+        self.max_gap = max_gap
+        self.max_count = max_count
+        self._plans: Dict[FrozenSet[str], Tuple[ReadBlock, ...]] = {}
+
+    def __getitem__(self, code: str) -> Register:
+        return self.registers[code]
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.registers
+
+    def address(self, code: str) -> int:
+        return self.registers[code].address
+
+    def plan(self, codes: Iterable[str]) -> Tuple[ReadBlock, ...]:
+        key = frozenset(codes)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = self._build_plan(key)
+            self._plans[key] = plan
+        return plan
+
+    def _build_plan(self, codes: FrozenSet[str]) -> Tuple[ReadBlock, ...]:
+        ordered = sorted((self.registers[code] for code in codes), key=lambda register: register.address)
+        groups: List[List[Register]] = []
+        for register in ordered:
+            if groups:
+                first = groups[-1][0]
+                last = groups[-1][-1]
+                # Never merge across function code groups, the gap between them is not readable
+                if (register.address >> 8) == (first.address >> 8) \
+                        and register.address - last.address - 1 <= self.max_gap \
+                        and register.address - first.address + 1 <= self.max_count:
+                    groups[-1].append(register)
+                    continue
+            groups.append([register])
+
+        blocks = []
+        for group in groups:
+            start = group[0].address
+            blocks.append(ReadBlock(
+                address=start,
+                count=group[-1].address - start + 1,
+                registers=tuple((register.address - start, register) for register in group)
+            ))
+        return tuple(blocks)
+
+    def decode(self, blocks: Sequence[ReadBlock], results: Sequence[Sequence[int]]) -> Dict[str, float]:
+        values = {}
+        for block, result in zip(blocks, results):
+            for offset, register in block.registers:
+                value = int(result[offset])
+                values[register.field] = value / register.divisor if register.divisor != 1 else value
+        return values
@@ -0,0 +1,102 @@
+from json import dumps
+from typing import Dict, Optional, Set
+import asyncio
+import time
+
+from levitree_rwis_api.Metrics import REGISTRY
+
+SUBSCRIBERS = REGISTRY.gauge("live_state_subscribers", "Connected live_state websocket subscribers", ("stream",))
+DROPPED_FRAMES = REGISTRY.counter("live_state_dropped_frames_total", "Frames skipped because a subscriber was still busy", ("stream",))
+BUILD_SECONDS = REGISTRY.histogram("live_state_build_seconds", "Time to build and encode one live_state snapshot", ("stream",))
+SEND_SECONDS = REGISTRY.histogram("live_state_send_seconds", "Time to send one live_state frame to a subscriber", ("stream",))
+
+
+class Subscription:
+    """A single websocket client of the broadcaster.
+
+    Only the newest frame is ever held for a subscriber. A slow client that has
+    not picked up its previous frame skips it instead of queueing, and delta
+    subscribers are resynchronised with a full snapshot when that happens.
+    """
+
+    def __init__(self, delta: bool = False, stream: str = "vfd"):
+        self.delta = delta
+        self.dropped_frames = 0
+        self._dropped_counter = DROPPED_FRAMES.labels(stream)
+        self._frame: Optional[str] = None
+        self._ready = asyncio.Event()
+
+    def offer(self, full_frame: str, delta_frame: str):
+        if self._frame is not None:
+            self.dropped_frames += 1
+            self._dropped_counter.inc()
+            self._frame = full_frame
+        else:
+            self._frame = delta_frame if self.delta else full_frame
+        self._ready.set()
+
+    async def next_frame(self) -> str:
+        await self._ready.wait()
+        self._ready.clear()
+        frame = self._frame
+        self._frame = None
+        return frame
+
+
+class StateBroadcaster:
+    """Builds one snapshot of all VFD states per poll generation and fans the
+    same encoded frame out to every live_state subscriber.
+
+    Any source with `generation`, `wait_for_generation` and
+    `get_state_snapshot` can be broadcast, `stream` names it in metrics.
+    """
+
+    def __init__(self, controller, min_interval: float = 0.2, stream: str = "vfd"):
+        self.controller = controller
+        self.min_interval = min_interval
+        self.stream = stream
+        self.build_seconds = BUILD_SECONDS.labels(stream)
+        self.send_seconds = SEND_SECONDS.labels(stream)
+        self.subscribers: Set[Subscription] = set()
+        self.generation = -1
+        self._snapshot: Dict[str, dict] = {}
+        self._full_frame: Optional[str] = None
+        SUBSCRIBERS.labels(stream).set_function(lambda: len(self.subscribers))
+
+    def subscribe(self, delta: bool = False) -> Subscription:
+        subscription = Subscription(delta=delta, stream=self.stream)
+        if self._full_frame is not None:
+            # New subscribers always start from a complete picture
+            subscription.offer(self._full_frame, self._full_frame)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscribers.discard(subscription)
+
+    async def run(self):
+        while True:
+            await self.controller.wait_for_generation(self.generation)
+            self.generation = self.controller.generation
+            started = time.monotonic()
+            snapshot = self.controller.get_state_snapshot()
+
+            delta = {}
+            for vfd_id, state in snapshot.items():
+                previous = self._snapshot.get(vfd_id)
+                if previous is None:
+                    delta[vfd_id] = state
+                    continue
+                changed = {field: value for field, value in state.items() if previous.get(field) != value}
+                if changed:
+                    delta[vfd_id] = changed
+
+            if delta:
+                self._snapshot = snapshot
+                self._full_frame = dumps(snapshot)
+                delta_frame = dumps(delta)
+                self.build_seconds.observe(time.monotonic() - started)
+                for subscription in self.subscribers:
+                    subscription.offer(self._full_frame, delta_frame)
+
+            await asyncio.sleep(self.min_interval)
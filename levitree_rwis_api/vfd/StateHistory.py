@@ -0,0 +1,69 @@
+from typing import Dict, List, Sequence
+import numpy as np
+
+
+class StateHistory:
+    """Fixed-size ring buffer of poll samples for a single drive.
+
+    Samples are stored column-wise in preallocated numpy arrays, so memory is
+    bounded by the capacity and range queries are reduced with vectorized
+    operations instead of Python loops.
+
+    Range queries binary search the timestamps, so they must never decrease.
+    A timestamp older than the previous one, e.g. after the wall clock was
+    stepped back, is stored as the previous one.
+    """
+
+    METRICS = ("cur_frequency", "output_current", "output_voltage", "input_power", "cur_drive_mode")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros((len(self.METRICS), capacity), dtype=np.float32)
+        self.size = 0
+        self.head = 0
+        self.last_timestamp = float("-inf")
+
+    def append(self, timestamp: float, state: dict):
+        self.last_timestamp = max(timestamp, self.last_timestamp)
+        self.timestamps[self.head] = self.last_timestamp
+        for row, metric in enumerate(self.METRICS):
+            self.values[row, self.head] = state[metric]
+        self.head = (self.head + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def _range(self, start: float, end: float):
+        if self.size < self.capacity:
+            segments = [(0, self.size)]
+        else:
+            segments = [(self.head, self.capacity), (0, self.head)]
+        # Only the requested range is copied out of the ring, never the whole buffer
+        timestamps, values = [], []
+        for seg_start, seg_end in segments:
+            lo, hi = np.searchsorted(self.timestamps[seg_start:seg_end], [start, end], side="left")
+            timestamps.append(self.timestamps[seg_start + lo:seg_start + hi])
+            values.append(self.values[:, seg_start + lo:seg_start + hi])
+        return np.concatenate(timestamps), np.concatenate(values, axis=1)
+
+    def query(self, start: float, end: float, buckets: int, metrics: Sequence[str]) -> Dict[str, List]:
+        timestamps, values = self._range(start, end)
+        result = {"timestamps": [], "metrics": {metric: {"min": [], "max": [], "mean": []} for metric in metrics}}
+        if timestamps.size == 0:
+            return result
+
+        width = (end - start) / buckets
+        bucket_ids = np.minimum(((timestamps - start) // width).astype(np.int64), buckets - 1)
+        # Samples are time ordered, so each non-empty bucket is a contiguous run
+        boundaries = np.flatnonzero(np.r_[True, bucket_ids[1:] != bucket_ids[:-1]])
+        counts = np.diff(np.r_[boundaries, timestamps.size])
+
+        result["timestamps"] = (start + bucket_ids[boundaries] * width).tolist()
+        for metric in metrics:
+            series = values[self.METRICS.index(metric)]
+            result["metrics"][metric] = {
+                "min": np.minimum.reduceat(series, boundaries).tolist(),
+                "max": np.maximum.reduceat(series, boundaries).tolist(),
+                "mean": (np.add.reduceat(series, boundaries, dtype=np.float64) / counts).tolist()
+            }
+        return result
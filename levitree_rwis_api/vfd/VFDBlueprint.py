@@ -1,9 +1,9 @@
-import asyncio
-from json import dumps
+from typing import Optional
 import os
+import time
 import yaml
 
-from sanic.response import json
+from sanic.response import HTTPResponse, json, raw
 from sanic import BadRequest, Blueprint, InternalServerError, Request, Websocket
 from sanic_ext import validate, openapi
 from sanic_ext.extensions.openapi.definitions import Response
@@ -11,25 +11,117 @@ from sanic_ext.extensions.openapi.definitions import Response
 from levitree_rwis_api import AppTypes
 
 from . import VFDTypes, VFDController
+from . import StateBroadcaster
+from .ModbusGateway import ModbusGateway
+from .StateHistory import StateHistory
 
 VFDBlueprint = Blueprint("VFDBlueprint", url_prefix="/vfds")
 
+# Upper bound for `?timeout=` on long-polling state reads (s)
+MAX_LONG_POLL_TIMEOUT = 120
+
+async def versioned_json(request: Request, controller: VFDController.VFDController, get_json, vfd_id: str = None, long_poll: bool = True) -> HTTPResponse:
+    """Serves pre-encoded JSON with a generation ETag.
+
+    `If-None-Match` with the current ETag returns 304. With `?since=<generation>`
+    the request is held until the generation moves past it or `?timeout=`
+    seconds (default 30) elapse.
+    """
+    since = request.args.get("since")
+    if long_poll and since is not None:
+        try:
+            since = int(since)
+            timeout = float(request.args.get("timeout", 30))
+        except ValueError:
+            raise BadRequest("since must be an integer and timeout a number!")
+        await controller.wait_for_state(vfd_id, since, min(max(timeout, 0), MAX_LONG_POLL_TIMEOUT))
+
+    generation, body = get_json()
+    etag = f'"{controller.epoch}-{generation}"'
+    headers = {"ETag": etag, "X-Generation": str(generation), "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return HTTPResponse(status=304, headers=headers)
+    return raw(body, content_type="application/json", headers=headers)
+
+def parse_event_kinds(kinds: str) -> list:
+    if not kinds:
+        return []
+    try:
+        return [VFDTypes.EventKind(kind) for kind in kinds.split(",")]
+    except ValueError:
+        raise BadRequest(f"kinds must be a comma separated list of {', '.join(kind.value for kind in VFDTypes.EventKind)}!")
+
 @VFDBlueprint.websocket("/live_state")
 @openapi.definition(
     summary="Subscribe to live state changes of all VFDs attached to system",
+    description="Sends a full snapshot on connect and whenever state changes. With `?mode=delta` only changed fields are sent after the first snapshot.",
     tag="VFD Control"
 )
 async def live_state(request: Request, ws: Websocket):
+    if not hasattr(request.app.ctx, 'vfd_broadcaster'):
+        raise InternalServerError("VFD subsystem not initialized!")
+    broadcaster: StateBroadcaster.StateBroadcaster = request.app.ctx.vfd_broadcaster
+    subscription = broadcaster.subscribe(delta=request.args.get("mode") == "delta")
+    try:
+        while True:
+            frame = await subscription.next_frame()
+            started = time.monotonic()
+            await ws.send(frame)
+            broadcaster.send_seconds.observe(time.monotonic() - started)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+@VFDBlueprint.websocket("/live_events")
+@openapi.definition(
+    summary="Subscribe to VFD alarms and state transitions as they are recorded",
+    description="Sends every new event as a JSON object. `?vfd_id=` limits the stream to one VFD, `?kinds=alarm,alarm_cleared` to the given kinds.",
+    tag="VFD Control"
+)
+async def live_events(request: Request, ws: Websocket):
     if not hasattr(request.app.ctx, 'vfd_controller'):
         raise InternalServerError("VFD subsystem not initialized!")
     controller: VFDController.VFDController = request.app.ctx.vfd_controller
-    while True:
-        dataDict = {}
-        for vfd in controller.get_vfds_dict():
-            dataDict[vfd] = controller.get_vfd_state(vfd, ext_rep=True)
-        data = dumps(dataDict)
-        await ws.send(data)
-        await asyncio.sleep(0.2)
+
+    vfd_id = request.args.get("vfd_id")
+    kinds = parse_event_kinds(request.args.get("kinds"))
+    queue = controller.subscribe_events()
+    try:
+        while True:
+            event: VFDTypes.VFDEvent = await queue.get()
+            if (vfd_id is None or event.vfd_id == vfd_id) and (not kinds or event.kind in kinds):
+                await ws.send(event.model_dump_json())
+    finally:
+        controller.unsubscribe_events(queue)
+
+@VFDBlueprint.get("/events")
+@openapi.definition(
+    summary="Query recorded VFD alarms and state transitions",
+    description="Query parameters: `vfd_id`, `start` and `end` as UNIX time, `kinds` as a comma separated list of event kinds and `limit` (default 100, at most 5000). Newest events first.",
+    tag="VFD Control",
+    response=[Response({"application/json": VFDTypes.VFDEvent.model_json_schema()}, 200, "Success")]
+)
+async def get_vfd_events(request):
+    if not hasattr(request.app.ctx, 'vfd_controller'):
+        raise InternalServerError("VFD subsystem not initialized!")
+    controller: VFDController.VFDController = request.app.ctx.vfd_controller
+
+    vfd_id = request.args.get("vfd_id")
+    if vfd_id is not None and not controller.has_vfd(vfd_id):
+        raise BadRequest(f"VFD {vfd_id} does not exist!")
+    try:
+        start = request.args.get("start")
+        start = None if start is None else float(start)
+        end = request.args.get("end")
+        end = None if end is None else float(end)
+        limit = int(request.args.get("limit", 100))
+    except ValueError:
+        raise BadRequest("start, end and limit must be numbers!")
+    if limit < 1 or limit > 5000:
+        raise BadRequest("limit must be between 1 and 5000!")
+    kinds = parse_event_kinds(request.args.get("kinds"))
+
+    return json([event.model_dump(mode="json") for event in await controller.get_events(vfd_id, start, end, kinds, limit)])
 
 @VFDBlueprint.get("/")
 @openapi.definition(
@@ -42,17 +134,54 @@ async def get_vfd_list(request):
         raise InternalServerError("VFD subsystem not initialized!")
     controller: VFDController.VFDController = request.app.ctx.vfd_controller
 
-    vfds = controller.get_vfds()
-    arr = []
-    for vfd_id in vfds:
-        vfd = vfds[vfd_id].model_dump()
-        del vfd['state']
-        arr.append(vfd)
-    return json(arr)
+    return await versioned_json(request, controller, controller.get_vfd_list_json, long_poll=False)
+
+@VFDBlueprint.get("/states")
+@openapi.definition(
+    summary="Get the state of all VFDs",
+    description="Keyed by VFD ID. Supports `If-None-Match` and long-polling with `?since=<generation>&timeout=<seconds>`, the generation being returned in the `X-Generation` header.",
+    tag="VFD Control",
+    response=[Response({"application/json": VFDTypes.VFDState.model_json_schema()}, 200, "Success")]
+)
+async def get_vfd_states(request):
+    if not hasattr(request.app.ctx, 'vfd_controller'):
+        raise InternalServerError("VFD subsystem not initialized!")
+    controller: VFDController.VFDController = request.app.ctx.vfd_controller
+
+    return await versioned_json(request, controller, controller.get_snapshot_json)
+
+@VFDBlueprint.get("/buses")
+@openapi.definition(
+    summary="List Modbus buses with scheduler queue statistics",
+    tag="VFD Control",
+    response=[Response({"application/json": VFDTypes.BusStatus.model_json_schema()}, 200, "Success")]
+)
+async def get_bus_list(request):
+    if not hasattr(request.app.ctx, 'vfd_controller'):
+        raise InternalServerError("VFD subsystem not initialized!")
+    controller: VFDController.VFDController = request.app.ctx.vfd_controller
+
+    return json([bus.model_dump() for bus in await controller.get_bus_status()])
+
+@VFDBlueprint.post("/emergency_stop")
+@openapi.definition(
+    summary="Stop all VFDs ahead of any other bus traffic",
+    tag="VFD Control",
+    response=[Response({"application/json": AppTypes.GenericResponse.model_json_schema()}, 200, "Success")]
+)
+async def emergency_stop(request):
+    if not hasattr(request.app.ctx, 'vfd_controller'):
+        raise InternalServerError("VFD subsystem not initialized!")
+    controller: VFDController.VFDController = request.app.ctx.vfd_controller
+
+    await controller.emergency_stop()
+
+    return json({"error": False, "message": "All VFDs stopped"})
 
 @VFDBlueprint.get("/<vfd_id>/state")
 @openapi.definition(
     summary="Get VFD state",
+    description="Supports `If-None-Match` and long-polling with `?since=<generation>&timeout=<seconds>`, the generation being returned in the `X-Generation` header.",
     tag="VFD Control",
     response=[Response({"application/json": VFDTypes.VFDState.model_json_schema()}, 200, "Success")]
 )
@@ -64,13 +193,46 @@ async def get_vfd_state(request, vfd_id: str):
     if not controller.has_vfd(vfd_id):
         raise BadRequest(f"VFD {vfd_id} does not exist!")
 
-    vfdState = controller.get_vfd_state(vfd_id, ext_rep=True)
+    return await versioned_json(request, controller, lambda: controller.get_state_json(vfd_id), vfd_id=vfd_id)
+
+@VFDBlueprint.get("/<vfd_id>/history")
+@openapi.definition(
+    summary="Get downsampled VFD state history",
+    description="Query parameters: `start` and `end` as UNIX time (default last hour), `buckets` (default 300), `metrics` as a comma separated list (default all).",
+    tag="VFD Control",
+    response=[Response({"application/json": VFDTypes.VFDHistory.model_json_schema()}, 200, "Success")]
+)
+async def get_vfd_history(request, vfd_id: str):
+    if not hasattr(request.app.ctx, 'vfd_controller'):
+        raise InternalServerError("VFD subsystem not initialized!")
+    controller: VFDController.VFDController = request.app.ctx.vfd_controller
+
+    if not controller.has_vfd(vfd_id):
+        raise BadRequest(f"VFD {vfd_id} does not exist!")
+
+    try:
+        end = float(request.args.get("end", time.time()))
+        start = float(request.args.get("start", end - 3600))
+        buckets = int(request.args.get("buckets", 300))
+    except ValueError:
+        raise BadRequest("start, end and buckets must be numbers!")
+    if start >= end:
+        raise BadRequest("start must be before end!")
+    if buckets < 1 or buckets > 5000:
+        raise BadRequest("buckets must be between 1 and 5000!")
 
-    return json(vfdState)
+    metrics = request.args.get("metrics")
+    metrics = metrics.split(",") if metrics else list(StateHistory.METRICS)
+    for metric in metrics:
+        if metric not in StateHistory.METRICS:
+            raise BadRequest(f"Unknown metric {metric}!")
 
-@VFDBlueprint.get("/<vfd_id>/read/<code>/<num_regs>")
+    return json(await controller.get_vfd_history(vfd_id, start, end, buckets, metrics))
+
+@VFDBlueprint.get("/<vfd_id>/read/<code>/<num_regs:int>")
 @openapi.definition(
     summary="Read VFD registers",
+    description="With `?max_age=<seconds>` the registers are served from the poll cache when it is fresh enough.",
     tag="VFD Control",
     response=[Response({"application/json": VFDTypes.ReadRegistersResponse.model_json_schema()}, 200, "Success")]
 )
@@ -82,10 +244,42 @@ async def read_vfd_registers(request, vfd_id: str, code: str, num_regs: int):
     if not controller.has_vfd(vfd_id):
         raise BadRequest(f"VFD {vfd_id} does not exist!")
 
-    register_array = await controller.read_vfd_registers(vfd_id, code, num_regs)
+    max_age = request.args.get("max_age")
+    if max_age:
+        try:
+            max_age = float(max_age)
+        except ValueError:
+            raise BadRequest("max_age must be a number!")
+        # Also rejects NaN
+        if not max_age >= 0:
+            raise BadRequest("max_age must be a non-negative number!")
+    else:
+        max_age = None
+    register_array = await controller.read_vfd_registers(vfd_id, code, num_regs, max_age=max_age)
 
     return json({"error": False, "registers": register_array})
 
+@VFDBlueprint.post("/read")
+@openapi.definition(
+    summary="Read register ranges from many VFDs in one request",
+    tag="VFD Control",
+    body={"application/json": VFDTypes.ReadBatchParams.model_json_schema()},
+    response=[Response({"application/json": VFDTypes.ReadBatchResponse.model_json_schema()}, 200, "Success")]
+)
+@validate(json=VFDTypes.ReadBatchParams)
+async def read_vfd_registers_batch(request, body: VFDTypes.ReadBatchParams):
+    if not hasattr(request.app.ctx, 'vfd_controller'):
+        raise InternalServerError("VFD subsystem not initialized!")
+    controller: VFDController.VFDController = request.app.ctx.vfd_controller
+
+    for register_range in body.reads:
+        if not controller.has_vfd(register_range.vfd_id):
+            raise BadRequest(f"VFD {register_range.vfd_id} does not exist!")
+
+    results = await controller.read_batch(body.reads, max_age=body.max_age)
+
+    return json({"error": any(result.error for result in results), "results": [result.model_dump() for result in results]})
+
 @VFDBlueprint.get("/<vfd_id>/clear_alarm")
 @openapi.definition(
     summary="Clear alarm",
@@ -104,6 +298,24 @@ async def clear_vfd_alarm(request, vfd_id: str):
 
     return json({"error": False, "message": "Alarm cleared"})
 
+@VFDBlueprint.post("/<vfd_id>/refresh")
+@openapi.definition(
+    summary="Refresh cached drive parameters",
+    tag="VFD Control",
+    response=[Response({"application/json": AppTypes.GenericResponse.model_json_schema()}, 200, "Success")]
+)
+async def refresh_vfd_parameters(request, vfd_id: str):
+    if not hasattr(request.app.ctx, 'vfd_controller'):
+        raise InternalServerError("VFD subsystem not initialized!")
+    controller: VFDController.VFDController = request.app.ctx.vfd_controller
+
+    if not controller.has_vfd(vfd_id):
+        raise BadRequest(f"VFD {vfd_id} does not exist!")
+
+    await controller.refresh_parameters(vfd_id)
+
+    return json({"error": False, "message": "Parameters refreshed"})
+
 @VFDBlueprint.post("/<vfd_id>/drive_mode")
 @openapi.definition(
     summary="Set drive mode",
@@ -120,9 +332,9 @@ async def set_vfd_drive_mode(request, vfd_id: str, body: VFDTypes.SetVFDDriveMod
     if not controller.has_vfd(vfd_id):
         raise BadRequest(f"VFD {vfd_id} does not exist!")
 
-    await controller.set_drive_mode(vfd_id, body.drive_mode)
+    drive_mode = await controller.set_drive_mode(vfd_id, body.drive_mode)
 
-    return json({"error": False, "message": f"Drive mode updated to {body.drive_mode.name}"})
+    return json({"error": False, "message": f"Drive mode updated to {drive_mode.name}"})
 
 @VFDBlueprint.post("/<vfd_id>/frequency")
 @openapi.definition(
@@ -140,21 +352,112 @@ async def set_vfd_state(request, vfd_id: str, body: VFDTypes.SetVFDFrequencyPara
     if not controller.has_vfd(vfd_id):
         raise BadRequest(f"VFD {vfd_id} does not exist!")
 
-    await controller.set_frequency(vfd_id, body.frequency)
+    frequency = await controller.set_frequency(vfd_id, body.frequency)
 
-    return json({"error": False, "message": f"Frequency updated to {body.frequency} Hz"})
+    return json({"error": False, "message": f"Frequency updated to {frequency} Hz"})
 
 
 
+@VFDBlueprint.post("/group/drive_mode")
+@openapi.definition(
+    summary="Set drive mode of a group of VFDs in one bus window",
+    tag="VFD Control",
+    body={"application/json": VFDTypes.SetGroupDriveModeParams.model_json_schema()},
+    response=[Response({"application/json": VFDTypes.GroupCommandResponse.model_json_schema()}, 200, "Success")]
+)
+@validate(json=VFDTypes.SetGroupDriveModeParams)
+async def set_group_drive_mode(request, body: VFDTypes.SetGroupDriveModeParams):
+    if not hasattr(request.app.ctx, 'vfd_controller'):
+        raise InternalServerError("VFD subsystem not initialized!")
+    controller: VFDController.VFDController = request.app.ctx.vfd_controller
+
+    vfd_ids = body.vfd_ids or list(controller.get_vfds())
+    for vfd_id in vfd_ids:
+        if not controller.has_vfd(vfd_id):
+            raise BadRequest(f"VFD {vfd_id} does not exist!")
+
+    results = await controller.set_group_drive_mode(vfd_ids, body.drive_mode)
+
+    return json({"error": any(result.error for result in results.values()), "results": {vfd_id: result.model_dump() for vfd_id, result in results.items()}})
+
+@VFDBlueprint.post("/group/frequency")
+@openapi.definition(
+    summary="Set frequency of a group of VFDs in one bus window",
+    tag="VFD Control",
+    body={"application/json": VFDTypes.SetGroupFrequencyParams.model_json_schema()},
+    response=[Response({"application/json": VFDTypes.GroupCommandResponse.model_json_schema()}, 200, "Success")]
+)
+@validate(json=VFDTypes.SetGroupFrequencyParams)
+async def set_group_frequency(request, body: VFDTypes.SetGroupFrequencyParams):
+    if not hasattr(request.app.ctx, 'vfd_controller'):
+        raise InternalServerError("VFD subsystem not initialized!")
+    controller: VFDController.VFDController = request.app.ctx.vfd_controller
+
+    vfd_ids = body.vfd_ids or list(controller.get_vfds())
+    for vfd_id in vfd_ids:
+        if not controller.has_vfd(vfd_id):
+            raise BadRequest(f"VFD {vfd_id} does not exist!")
+
+    results = await controller.set_group_frequency(vfd_ids, body.frequency)
+
+    return json({"error": any(result.error for result in results.values()), "results": {vfd_id: result.model_dump() for vfd_id, result in results.items()}})
+
+def configure_vfd_controller(cfg: dict) -> VFDController.VFDController:
+    vfd_controller = VFDController.VFDController(history_hours=cfg.get("history_hours", 24), event_log_path=cfg.get("event_log_path", "./vfd_events.db"))
+    buses = cfg.get("modbus_buses")
+    if not buses:
+        modbus_path = os.environ.get("MODBUS_PATH", "serial:///dev/tty.usbserial-B000DTU5")
+        buses = [{"name": "default", "url": modbus_path}]
+    for bus in buses:
+        vfd_controller.register_bus(bus["name"], bus["url"], baudrate=bus.get("baudrate", 9600), parity=bus.get("parity", "E"),
+                                    poll_rate_running=bus.get("poll_rate_running", 5), poll_rate_stopped=bus.get("poll_rate_stopped", 0.5),
+                                    broadcast=bus.get("broadcast", False))
+    for modbus_device in cfg["modbus_devices"]:
+        if modbus_device["type"] == "VFD":
+            vfd_controller.register_vfd(modbus_device["slave_id"], modbus_device["display_name"], modbus_device["name"], model=modbus_device["model"], bus=modbus_device.get("bus", buses[0]["name"]),
+                                        poll_rate_running=modbus_device.get("poll_rate_running"), poll_rate_stopped=modbus_device.get("poll_rate_stopped"))
+    return vfd_controller
+
+def configure_modbus_gateway(cfg: dict, vfd_controller: VFDController.VFDController) -> Optional[ModbusGateway]:
+    gateway = cfg.get("modbus_gateway")
+    if not gateway:
+        return None
+    return ModbusGateway(vfd_controller, host=gateway.get("host", "0.0.0.0"), port=gateway.get("port", 502),
+                         max_age=gateway.get("max_age", 0.5), units=gateway.get("units"))
+
 @VFDBlueprint.listener('before_server_start')
 def open_serial_port(app):
+    if hasattr(app.ctx, 'bus_owner'):
+        # The bus owner process polls the buses, see BusOwnerBlueprint
+        return
     config_path = os.environ.get("CONFIG_PATH", "./config.yaml")
     with open(config_path) as cfgFile:
         cfg = yaml.load(cfgFile, Loader=yaml.FullLoader)
-        modbus_path = os.environ.get("MODBUS_PATH", "serial:///dev/tty.usbserial-B000DTU5")
-        app.ctx.vfd_controller = VFDController.VFDController(modbus_path)
-        for modbus_device in cfg["modbus_devices"]:
-            if modbus_device["type"] == "VFD":
-                app.ctx.vfd_controller.register_vfd(modbus_device["slave_id"], modbus_device["display_name"], modbus_device["name"], model=modbus_device["model"])
-        app.add_task(app.ctx.vfd_controller.initialize_modbus, name="init_modbus")
-        app.add_task(app.ctx.vfd_controller.modbus_polling_loop, name="modbus_consumer")
\ No newline at end of file
+        app.ctx.vfd_controller = configure_vfd_controller(cfg)
+        app.ctx.vfd_controller.event_log.start()
+        for bus_name in app.ctx.vfd_controller.buses:
+            app.add_task(app.ctx.vfd_controller.modbus_polling_loop(bus_name), name=f"modbus_consumer_{bus_name}")
+        app.ctx.vfd_broadcaster = StateBroadcaster.StateBroadcaster(app.ctx.vfd_controller)
+        app.add_task(app.ctx.vfd_broadcaster.run(), name="vfd_broadcaster")
+
+@VFDBlueprint.listener('before_server_start')
+async def start_modbus_gateway(app):
+    if not hasattr(app.ctx, 'vfd_controller') or hasattr(app.ctx, 'bus_owner'):
+        return
+    config_path = os.environ.get("CONFIG_PATH", "./config.yaml")
+    with open(config_path) as cfgFile:
+        cfg = yaml.load(cfgFile, Loader=yaml.FullLoader)
+        gateway = configure_modbus_gateway(cfg, app.ctx.vfd_controller)
+    if gateway is not None:
+        await gateway.start()
+        app.ctx.modbus_gateway = gateway
+
+@VFDBlueprint.listener('after_server_stop')
+async def stop_modbus_gateway(app):
+    if hasattr(app.ctx, 'modbus_gateway'):
+        await app.ctx.modbus_gateway.close()
+
+@VFDBlueprint.listener('after_server_stop')
+def close_event_log(app):
+    if hasattr(app.ctx, 'vfd_controller') and not hasattr(app.ctx, 'bus_owner'):
+        app.ctx.vfd_controller.event_log.stop()
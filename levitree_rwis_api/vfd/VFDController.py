@@ -1,40 +1,101 @@
 from enum import Enum
-from typing import Dict
+from json import dumps
+from typing import Dict, List, Optional, Tuple
 from sanic.log import logger
-from async_modbus import core, AsyncRTUClient
 
 from serial import SerialException
 from . import VFDTypes, Frenic
+from .BusScheduler import Priority
+from .DeviceHealth import BreakerState
+from .EventLog import EventLog
+from .ModbusBus import ModbusBus
+from .ParameterCache import ParameterCache
+from .StateHistory import StateHistory
+from .WriteCoalescer import WriteCoalescer
+from levitree_rwis_api.Metrics import REGISTRY
 import asyncio
-import math
+import os
+import time
 from aioretry import (
     retry,
     RetryPolicyStrategy,
     RetryInfo
 )
 
+COMMAND_RETRIES = REGISTRY.counter("vfd_command_retries_total", "Failed VFD command attempts handled by the retry policy").labels()
+POLL_SECONDS = REGISTRY.histogram("vfd_poll_seconds", "Duration of a single device poll", ("bus",))
+POLL_LATENESS = REGISTRY.histogram("vfd_poll_lateness_seconds", "Delay of polls past their deadline", ("bus",))
+SWEEP_SECONDS = REGISTRY.histogram("vfd_poll_sweep_seconds", "Time for every device on a bus to be polled once", ("bus",), buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+POLL_FAILURES = REGISTRY.counter("vfd_poll_failures_total", "Failed device polls", ("bus", "vfd"))
+
 def retry_policy(info: RetryInfo) -> RetryPolicyStrategy:
+    COMMAND_RETRIES.inc()
     return (info.fails > 10), (info.fails - 1) % 3 * 0.1
 
 class VFDController:
-    vfds: Dict[str, VFDTypes.VFD] = {}
-    serial_path = ""
-    client: AsyncRTUClient = None
-    client_lock = asyncio.Lock()
+    # Timeout of a regular poll transaction, and the shortest one a probe of a failing drive gets (s)
+    POLL_TIMEOUT = 0.4
+    MIN_PROBE_TIMEOUT = 0.05
+
+    def __init__(self, serial_path: str = None, history_hours: float = 24, event_log_path: str = ":memory:"):
+        self.history_hours = history_hours
+        self.event_log = EventLog(event_log_path)
+        self.vfds: Dict[str, VFDTypes.VFD] = {}
+        self.buses: Dict[str, ModbusBus] = {}
+        self.parameter_caches: Dict[str, ParameterCache] = {}
+        self.histories: Dict[str, StateHistory] = {}
+        self.states: Dict[str, dict] = {}
+        self.generation = 0
+        # Fleet generation at which each drive's state last changed
+        self.state_generations: Dict[str, int] = {}
+        # Distinguishes generations of this process from those of a previous run in ETags
+        self.epoch = os.urandom(4).hex()
+        self.__state_json: Dict[str, Optional[bytes]] = {}
+        self.__snapshot_json: Optional[bytes] = None
+        self.__vfd_list_json: Optional[bytes] = None
+        self.vfd_list_generation = 0
+        self.__inflight_reads: Dict[tuple, asyncio.Future] = {}
+        self.write_coalescer = WriteCoalescer(retry_policy)
+        self.__generation_event = asyncio.Event()
+        if serial_path is not None:
+            self.register_bus("default", serial_path)
+
+    def register_bus(self, name: str, url: str, baudrate: int = 9600, parity: str = "E",
+                     poll_rate_running: float = 5, poll_rate_stopped: float = 0.5, broadcast: bool = False):
+        self.buses[name] = ModbusBus(name, url, baudrate=baudrate, parity=parity,
+                                     poll_rate_running=poll_rate_running, poll_rate_stopped=poll_rate_stopped, broadcast=broadcast)
 
-    def __init__(self, serial_path):
-        self.serial_path = serial_path
+        logger.info(f"Registering Modbus bus {name} at {url}")
+
+    def register_vfd(self, slave_id: int, display_name: str, id: str, model="Frenic", bus="default",
+                     poll_rate_running: float = None, poll_rate_stopped: float = None):
+        if bus not in self.buses:
+            raise ValueError(f"VFD {id} is assigned to unknown bus {bus}")
 
-    def register_vfd(self, slave_id: int, display_name: str, id: str, model="Frenic"):
         newVFD = VFDTypes.VFD()
         newVFD.display_name = display_name
         newVFD.slave_id = slave_id
         newVFD.id = id
         newVFD.model = model
+        newVFD.bus = bus
 
         self.vfds[id] = newVFD
+        self.parameter_caches[id] = ParameterCache()
+        modbus_bus = self.buses[bus]
+        modbus_bus.vfd_ids.append(id)
+        modbus_bus.health.add(id)
+        poll_rate_running = poll_rate_running or modbus_bus.poll_rate_running
+        modbus_bus.poller.add(id, poll_rate_running, poll_rate_stopped or modbus_bus.poll_rate_stopped,
+                              self.__poll_cost(modbus_bus, model))
+        self.states[id] = newVFD.state.model_dump()
+        self.state_generations[id] = self.generation
+        self.__state_json[id] = None
+        self.__snapshot_json = None
+        self.__invalidate_vfd_list()
+        # Sized for the drive's running poll rate, the fastest it gets samples at
+        self.histories[id] = StateHistory(max(1, int(self.history_hours * 3600 * poll_rate_running)))
 
-        logger.info(f"Registering VFD {slave_id} with name {display_name}")
+        logger.info(f"Registering VFD {slave_id} with name {display_name} on bus {bus}")
 
     def has_vfd(self, id: str) -> bool:
         return (id in self.vfds)
@@ -45,73 +106,283 @@ class VFDController:
     def get_vfd_state(self, vfd_id: str, ext_rep=False) -> VFDTypes.VFDState:
         return self.vfds[vfd_id].state.model_dump()
 
-    async def read_vfd_registers(self, vfd_id: str, start_code: str, num: int):
+    async def get_vfd_history(self, vfd_id: str, start: float, end: float, buckets: int, metrics: List[str]) -> dict:
+        return self.histories[vfd_id].query(start, end, buckets, metrics)
+
+    async def get_events(self, vfd_id: Optional[str] = None, start: Optional[float] = None, end: Optional[float] = None,
+                         kinds: Optional[List[VFDTypes.EventKind]] = None, limit: int = 100) -> List[VFDTypes.VFDEvent]:
+        return await asyncio.to_thread(self.event_log.query, vfd_id, start, end, kinds, limit)
+
+    def subscribe_events(self) -> asyncio.Queue:
+        return self.event_log.subscribe()
+
+    def unsubscribe_events(self, queue: asyncio.Queue):
+        self.event_log.unsubscribe(queue)
+
+    def get_state_snapshot(self) -> Dict[str, dict]:
+        return dict(self.states)
+
+    def get_state_json(self, vfd_id: str) -> Tuple[int, bytes]:
+        """Returns a drive's state generation and its state encoded as JSON, encoding at most once per change."""
+        body = self.__state_json[vfd_id]
+        if body is None:
+            body = self.__state_json[vfd_id] = dumps(self.states[vfd_id]).encode()
+        return self.state_generations[vfd_id], body
+
+    def get_snapshot_json(self) -> Tuple[int, bytes]:
+        if self.__snapshot_json is None:
+            self.__snapshot_json = dumps(self.states).encode()
+        return self.generation, self.__snapshot_json
+
+    def get_vfd_list_json(self) -> Tuple[int, bytes]:
+        if self.__vfd_list_json is None:
+            self.__vfd_list_json = dumps([vfd.model_dump(exclude={"state"}) for vfd in self.vfds.values()]).encode()
+        return self.vfd_list_generation, self.__vfd_list_json
+
+    async def wait_for_generation(self, generation: int):
+        while self.generation <= generation:
+            await self.__generation_event.wait()
+
+    async def wait_for_state(self, vfd_id: Optional[str], since: int, timeout: float) -> bool:
+        """Waits until the state of a drive, or of any drive if `vfd_id` is None, is newer than `since`.
+
+        Returns False if nothing changed within `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while (self.generation if vfd_id is None else self.state_generations[vfd_id]) <= since:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self.__generation_event.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def __publish_state(self, vfd_id: str):
+        state = self.vfds[vfd_id].state.model_dump()
+        if state != self.states[vfd_id]:
+            self.states[vfd_id] = state
+            self.generation += 1
+            self.state_generations[vfd_id] = self.generation
+            self.__state_json[vfd_id] = None
+            self.__snapshot_json = None
+            self.__generation_event.set()
+            self.__generation_event = asyncio.Event()
+
+    def __invalidate_vfd_list(self):
+        self.vfd_list_generation += 1
+        self.__vfd_list_json = None
+
+    def __set_poll_fail_count(self, vfd: VFDTypes.VFD, count: int):
+        if vfd.poll_fail_count != count:
+            vfd.poll_fail_count = count
+            self.__invalidate_vfd_list()
+
+    def __record_transitions(self, vfd_id: str, previous: dict, state: VFDTypes.VFDState):
+        alarm_code = previous["alarm_code"]
+        if state.alarm_code != alarm_code:
+            if alarm_code:
+                self.event_log.record(vfd_id, VFDTypes.EventKind.ALARM_CLEARED, alarm_code=alarm_code,
+                                      message=f"{Frenic.alarm_lookup(alarm_code)} cleared")
+            if state.alarm_code:
+                self.event_log.record(vfd_id, VFDTypes.EventKind.ALARM, alarm_code=state.alarm_code,
+                                      message=Frenic.alarm_lookup(state.alarm_code))
+        # The first poll after startup only establishes the drive mode
+        if state.cur_drive_mode != previous["cur_drive_mode"] and previous["cur_drive_mode"] != VFDTypes.DriveMode.OFFLINE:
+            self.event_log.record(vfd_id, VFDTypes.EventKind.DRIVE_MODE, drive_mode=state.cur_drive_mode,
+                                  message=f"Drive mode changed to {state.cur_drive_mode.name}")
+
+    def __poll_cost(self, bus: ModbusBus, model: str) -> float:
+        if model != "Frenic":
+            return 0.0
+        live_codes = [code for code in Frenic.POLL_CODES if Frenic.REGISTER_MAP[code].ttl is None]
+        # Read request is 8 bytes, the response 5 bytes plus 2 per register
+        return sum(bus.transaction_time(8, 5 + 2 * block.count) for block in Frenic.REGISTER_MAP.plan(live_codes))
+
+    def get_bus(self, vfd_id: str) -> ModbusBus:
+        return self.buses[self.vfds[vfd_id].bus]
+
+    async def get_bus_status(self) -> List[VFDTypes.BusStatus]:
+        statuses = []
+        for bus in self.buses.values():
+            queues = {}
+            for priority, stats in bus.scheduler.stats.items():
+                queues[priority.name] = VFDTypes.BusQueueStats(
+                    queue_depth=stats.queue_depth,
+                    transactions=stats.transactions,
+                    mean_wait=stats.total_wait / stats.transactions if stats.transactions else 0,
+                    max_wait=stats.max_wait
+                )
+            polling = {}
+            for vfd_id, target in bus.poller.targets.items():
+                polling[vfd_id] = VFDTypes.PollStats(
+                    target_rate=1 / target.period,
+                    achieved_rate=1 / target.interval if target.interval else 0,
+                    jitter=target.jitter,
+                    polls=target.polls,
+                    breaker=bus.health.breakers[vfd_id].state.value
+                )
+            statuses.append(VFDTypes.BusStatus(name=bus.name, url=bus.url, vfds=list(bus.vfd_ids), queues=queues,
+                                               estimated_utilization=bus.poller.estimated_utilization(), polling=polling))
+        return statuses
+
+    async def read_vfd_registers(self, vfd_id: str, start_code: str, num: int, max_age: float = None) -> List[int]:
         vfd = self.vfds[vfd_id]
         if vfd.model == "Frenic":
-            async with self.client_lock:
-                state = await asyncio.wait_for(self.client.read_holding_registers(vfd.slave_id, Frenic.function_code_to_coil(start_code), num), timeout=0.4)
-                return state
+            return await self.read_registers(vfd_id, Frenic.function_code_to_coil(start_code), num, max_age=max_age)
         else:
-            logger.error(f"Cannot update state for VFD {vfd.display_name} as {vfd.model} is unimplemented!")
-    
-    async def __updateState(self, vfd_id: str):
+            logger.error(f"Cannot read registers for VFD {vfd.display_name} as {vfd.model} is unimplemented!")
+
+    async def read_registers(self, vfd_id: str, address: int, count: int, max_age: float = None) -> List[int]:
+        """Reads a register range, from the poll cache if it is no older than `max_age` seconds.
+
+        Identical reads that are already in flight share one bus transaction.
+        """
+        if max_age is not None:
+            values = self.parameter_caches[vfd_id].get_range(address, count, time.monotonic() - max_age)
+            if values is not None:
+                return values
+
+        vfd = self.vfds[vfd_id]
+        key = (vfd.bus, vfd.slave_id, address, count)
+        pending = self.__inflight_reads.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self.__read_registers(vfd_id, address, count))
+            self.__inflight_reads[key] = pending
+            pending.add_done_callback(lambda future: self.__finish_read(key, future))
+        # Shielded so one caller going away does not cancel the read for the others
+        return await asyncio.shield(pending)
+
+    def __finish_read(self, key, future: asyncio.Future):
+        self.__inflight_reads.pop(key, None)
+        if not future.cancelled():
+            future.exception()
+
+    async def __read_registers(self, vfd_id: str, address: int, count: int) -> List[int]:
+        vfd = self.vfds[vfd_id]
+        bus = self.get_bus(vfd_id)
+        async with bus.scheduler.reserve(Priority.USER_READ):
+            registers = await bus.read_holding_registers(vfd.slave_id, address, count)
+        values = [int(value) for value in registers]
+        self.parameter_caches[vfd_id].store_range(address, values, time.monotonic())
+        return values
+
+    async def write_registers(self, vfd_id: str, address: int, values: List[int]):
+        """Writes raw registers on behalf of an external client, at the priority of the API's own commands.
+
+        The frequency and run commands go through the write coalescer like the
+        API's own, so they keep their order with commands already queued.
+        """
+        vfd = self.vfds[vfd_id]
+        coalesced = {}
+        if vfd.model == "Frenic":
+            coalesced = {Frenic.REGISTER_MAP.address(code): code for code in ("S05", "S06")}
+        # Runs of other registers are written directly, all in address order
+        run_start = address
+        for offset in range(len(values) + 1):
+            register = address + offset
+            if offset < len(values) and register not in coalesced:
+                continue
+            if register > run_start:
+                await self.__write_registers(vfd_id, run_start, values[run_start - address:offset], Priority.OPERATOR_WRITE)
+            if offset < len(values):
+                await self.__write_command(vfd_id, coalesced[register], values[offset])
+            run_start = register + 1
+        logger.info(f"VFD {vfd.display_name} registers {address}-{address + len(values) - 1} written by an external client")
+
+    async def __write_command(self, vfd_id: str, code: str, value: int):
+        if code == "S05":
+            await self.set_frequency(vfd_id, value / 100)
+        elif value in (VFDTypes.DriveMode.STOP, VFDTypes.DriveMode.FORWARD, VFDTypes.DriveMode.REVERSE):
+            await self.set_drive_mode(vfd_id, VFDTypes.DriveMode(value))
+        else:
+            # Other run command bits, e.g. an alarm reset. Without the forward and reverse bits it stops the drive.
+            stop = not value & 0b11
+            priority = Priority.EMERGENCY if stop else Priority.OPERATOR_WRITE
+            await self.write_coalescer.write((vfd_id, code), value, lambda value: self.__write_registers(vfd_id, Frenic.REGISTER_MAP.address(code), [value], priority),
+                                             skip_confirmed=not stop, barrier=stop)
+
+    async def __write_registers(self, vfd_id: str, address: int, values: List[int], priority: Priority):
         vfd = self.vfds[vfd_id]
+        bus = self.get_bus(vfd_id)
+        async with bus.scheduler.reserve(priority):
+            if len(values) == 1:
+                await bus.write_register(vfd.slave_id, address, values[0])
+            else:
+                await bus.write_registers(vfd.slave_id, address, values)
+        for register in range(address, address + len(values)):
+            self.parameter_caches[vfd_id].invalidate(register)
+        bus.poller.expedite(vfd_id)
+
+    async def read_batch(self, reads: List[VFDTypes.RegisterRange], max_age: float = None) -> List[VFDTypes.RegisterRangeResult]:
+        async def read(register_range: VFDTypes.RegisterRange) -> VFDTypes.RegisterRangeResult:
+            result = VFDTypes.RegisterRangeResult(vfd_id=register_range.vfd_id, code=register_range.code, count=register_range.count)
+            try:
+                result.registers = await self.read_vfd_registers(register_range.vfd_id, register_range.code, register_range.count, max_age=max_age)
+            except Exception as e:
+                result.error = True
+                result.message = repr(e)
+            return result
+        return await asyncio.gather(*[read(register_range) for register_range in reads])
+
+    async def __updateState(self, vfd_id: str, timeout: float = POLL_TIMEOUT):
+        vfd = self.vfds[vfd_id]
+        bus = self.get_bus(vfd_id)
         if vfd.model == "Frenic":
-            #We're starting read at M05, 10 regs, to M15.
-            async with self.client_lock:
-                state = await asyncio.wait_for(self.client.read_holding_registers(vfd.slave_id, Frenic.function_code_to_coil("M05"), 10), timeout=0.4)
-
-                tgt_freq = float(state[0] / 100)
-                freq = float(state[4] / 100)
-                input_power = float(state[5] / 100)
-                output_current = float(state[6] / 100)
-                output_voltage = float(state[7] / 10)
-                operation_command = state[8]
-                operation_status = state[9]
-                tgt_drive_mode = VFDTypes.DriveMode.OFFLINE
-                if operation_command & 0b1:
-                    tgt_drive_mode = VFDTypes.DriveMode.FORWARD
-                elif operation_command & 0b10:
-                    tgt_drive_mode = VFDTypes.DriveMode.REVERSE
-                else:
-                    tgt_drive_mode = VFDTypes.DriveMode.STOP
-                cur_drive_mode = VFDTypes.DriveMode.OFFLINE
-                if operation_status & 0b1:
-                    cur_drive_mode = VFDTypes.DriveMode.FORWARD
-                elif operation_status & 0b10:
-                    cur_drive_mode = VFDTypes.DriveMode.REVERSE
-                else:
-                    cur_drive_mode = VFDTypes.DriveMode.STOP
-
-                vfd.state.tgt_frequency = tgt_freq
-                vfd.state.cur_frequency = freq
-
-                vfd.state.input_power = input_power
-                vfd.state.output_voltage = output_voltage
-                vfd.state.output_current = output_current
-
-                vfd.state.tgt_drive_mode = tgt_drive_mode
-                vfd.state.cur_drive_mode = cur_drive_mode
-
-                #Get max allowed run frequency from unit - this populates range sliders
-                state = await asyncio.wait_for(self.client.read_holding_registers(vfd.slave_id, Frenic.function_code_to_coil("F03"), 1), timeout=0.4) #DF 22
-                max_freq = int(state[0] / 10)
-                vfd.state.max_frequency = max_freq
+            cache = self.parameter_caches[vfd_id]
+            now = time.monotonic()
+            blocks = Frenic.REGISTER_MAP.plan(cache.due(Frenic.REGISTER_MAP, Frenic.POLL_CODES, now))
+            results = []
+            for block in blocks:
+                # Reserve per transaction so queued commands can run between the reads of a poll
+                async with bus.scheduler.reserve(Priority.POLL):
+                    results.append(await bus.read_holding_registers(vfd.slave_id, block.address, block.count, timeout=timeout))
+            cache.store(blocks, results, now)
+            values = Frenic.REGISTER_MAP.decode(blocks, results)
+
+            vfd.state.tgt_frequency = values["tgt_frequency"]
+            vfd.state.cur_frequency = values["cur_frequency"]
+
+            vfd.state.input_power = values["input_power"]
+            vfd.state.output_voltage = values["output_voltage"]
+            vfd.state.output_current = values["output_current"]
+
+            vfd.state.tgt_drive_mode = Frenic.decode_drive_mode(values["operation_command"])
+            vfd.state.cur_drive_mode = Frenic.decode_drive_mode(values["operation_status"])
+            vfd.state.alarm_code = Frenic.decode_alarm(values["operation_status"], values["latest_alarm"])
+
+            #Max allowed run frequency from unit - this populates range sliders, only re-read once its TTL expires
+            if "max_frequency" in values:
+                vfd.state.max_frequency = int(values["max_frequency"])
+            self.__record_transitions(vfd_id, self.states[vfd_id], vfd.state)
+            self.__publish_state(vfd_id)
+            self.histories[vfd_id].append(time.time(), self.states[vfd_id])
         else:
             logger.error(f"Cannot update state for VFD {vfd.display_name} as {vfd.model} is unimplemented!")
     
-    @retry(retry_policy)
-    async def set_frequency(self, vfd_id: str, frequency: float):
+    async def set_frequency(self, vfd_id: str, frequency: float) -> float:
+        """Sets the frequency of a drive, returning the frequency applied, which is newer if another request superseded this one."""
         vfd = self.vfds[vfd_id]
         if vfd.model == "Frenic":
-            regVal = math.floor(frequency * 100)
-            async with self.client_lock:
-                await asyncio.wait_for(self.client.write_register(vfd.slave_id, Frenic.function_code_to_coil("S05"), regVal),timeout=0.4) #DF 22
-                logger.info(f"VFD {vfd.display_name} frequency updated to {frequency}Hz")
-                vfd.state.tgt_frequency = frequency
+            regVal = round(frequency * 100)
+            written = await self.write_coalescer.write((vfd_id, "S05"), regVal, lambda value: self.__write_frequency(vfd_id, value))
+            return written / 100
+        return frequency
 
-    @retry(retry_policy)
-    async def set_drive_mode(self, vfd_id: str, drive_mode: VFDTypes.DriveMode):
+    async def __write_frequency(self, vfd_id: str, regVal: int):
+        vfd = self.vfds[vfd_id]
+        bus = self.get_bus(vfd_id)
+        async with bus.scheduler.reserve(Priority.OPERATOR_WRITE):
+            await bus.write_register(vfd.slave_id, Frenic.REGISTER_MAP.address("S05"), regVal)
+            self.parameter_caches[vfd_id].invalidate(Frenic.REGISTER_MAP.address("S05"))
+            logger.info(f"VFD {vfd.display_name} frequency updated to {regVal / 100}Hz")
+            vfd.state.tgt_frequency = regVal / 100
+            self.__publish_state(vfd_id)
+            bus.poller.expedite(vfd_id)
+
+    async def set_drive_mode(self, vfd_id: str, drive_mode: VFDTypes.DriveMode) -> VFDTypes.DriveMode:
+        """Sets the drive mode of a drive, returning the mode applied, which is newer if another request superseded this one."""
         vfd = self.vfds[vfd_id]
         if vfd.model == "Frenic":
             if drive_mode == VFDTypes.DriveMode.FORWARD:
@@ -121,43 +392,216 @@ class VFDController:
             elif drive_mode == VFDTypes.DriveMode.STOP:
                 regVal = 0
             else:
-                return
-            async with self.client_lock:
-                await asyncio.wait_for(self.client.write_register(vfd.slave_id, Frenic.function_code_to_coil("S06"), regVal),timeout=0.4) #DF 14
-                logger.info(f"VFD {vfd.display_name} drive mode updated to {repr(drive_mode)}")
-                vfd.state.tgt_drive_mode = drive_mode
+                return drive_mode
+            # A stop is always sent, even if the drive was just told to stop, and never superseded by a later command
+            stop = drive_mode == VFDTypes.DriveMode.STOP
+            written = await self.write_coalescer.write((vfd_id, "S06"), regVal, lambda value: self.__write_drive_mode(vfd_id, value),
+                                                       skip_confirmed=not stop, barrier=stop)
+            return VFDTypes.DriveMode(written)
+        return drive_mode
+
+    async def __write_drive_mode(self, vfd_id: str, regVal: int):
+        vfd = self.vfds[vfd_id]
+        bus = self.get_bus(vfd_id)
+        drive_mode = VFDTypes.DriveMode(regVal)
+        priority = Priority.EMERGENCY if drive_mode == VFDTypes.DriveMode.STOP else Priority.OPERATOR_WRITE
+        async with bus.scheduler.reserve(priority):
+            await bus.write_register(vfd.slave_id, Frenic.REGISTER_MAP.address("S06"), regVal)
+            self.parameter_caches[vfd_id].invalidate(Frenic.REGISTER_MAP.address("S06"))
+            logger.info(f"VFD {vfd.display_name} drive mode updated to {repr(drive_mode)}")
+            vfd.state.tgt_drive_mode = drive_mode
+            self.__publish_state(vfd_id)
+            bus.poller.expedite(vfd_id)
 
     @retry(retry_policy)
     async def clear_alarm(self, vfd_id: str):
         vfd = self.vfds[vfd_id]
+        bus = self.get_bus(vfd_id)
         if vfd.model == "Frenic":
-            async with self.client_lock:
-                await asyncio.wait_for(self.client.write_register(vfd.slave_id, Frenic.function_code_to_coil("S06"), 0b1000000000000000),timeout=0.4) #DF 14
+            async with bus.scheduler.reserve(Priority.OPERATOR_WRITE):
+                await bus.write_register(vfd.slave_id, Frenic.REGISTER_MAP.address("S06"), 0b1000000000000000)
+                self.parameter_caches[vfd_id].invalidate(Frenic.REGISTER_MAP.address("S06"))
+                self.write_coalescer.invalidate((vfd_id, "S06"))
                 logger.info(f"VFD {vfd.display_name} alarm cleared")
+                bus.poller.expedite(vfd_id)
+
+    async def set_group_frequency(self, vfd_ids: List[str], frequency: float) -> Dict[str, VFDTypes.GroupCommandResult]:
+        regVal = round(frequency * 100)
+        results = await self.__group_write(vfd_ids, "S05", regVal, Priority.OPERATOR_WRITE)
+        for vfd_id, result in results.items():
+            if not result.error:
+                self.vfds[vfd_id].state.tgt_frequency = regVal / 100
+                self.__publish_state(vfd_id)
+        logger.info(f"VFD group {', '.join(vfd_ids)} frequency updated to {regVal / 100}Hz")
+        return results
+
+    async def set_group_drive_mode(self, vfd_ids: List[str], drive_mode: VFDTypes.DriveMode) -> Dict[str, VFDTypes.GroupCommandResult]:
+        priority = Priority.EMERGENCY if drive_mode == VFDTypes.DriveMode.STOP else Priority.OPERATOR_WRITE
+        results = await self.__group_write(vfd_ids, "S06", int(drive_mode), priority)
+        for vfd_id, result in results.items():
+            if not result.error:
+                self.vfds[vfd_id].state.tgt_drive_mode = drive_mode
+                self.__publish_state(vfd_id)
+        logger.info(f"VFD group {', '.join(vfd_ids)} drive mode updated to {repr(drive_mode)}")
+        return results
+
+    async def __group_write(self, vfd_ids: List[str], code: str, value: int, priority: Priority) -> Dict[str, VFDTypes.GroupCommandResult]:
+        results: Dict[str, VFDTypes.GroupCommandResult] = {}
+        by_bus: Dict[str, List[str]] = {}
+        for vfd_id in vfd_ids:
+            if self.vfds[vfd_id].model == "Frenic":
+                by_bus.setdefault(self.vfds[vfd_id].bus, []).append(vfd_id)
+            else:
+                results[vfd_id] = VFDTypes.GroupCommandResult(error=True, message=f"{self.vfds[vfd_id].model} is unimplemented")
+
+        async def write_bus(bus: ModbusBus, bus_vfd_ids: List[str]):
+            address = Frenic.REGISTER_MAP.address(code)
+
+            async def write() -> Dict[tuple, Exception]:
+                errors: Dict[str, Exception] = {}
+                # The whole group shares one bus reservation, so polling cannot interleave with it
+                async with bus.scheduler.reserve(priority):
+                    broadcast = code in Frenic.BROADCAST_CODES and bus.supports_broadcast() \
+                        and set(bus_vfd_ids) == set(bus.vfd_ids) and all(self.vfds[vfd_id].model == "Frenic" for vfd_id in bus.vfd_ids)
+                    if broadcast:
+                        try:
+                            await asyncio.wait_for(bus.broadcast_register(address, value), timeout=0.4 + bus.broadcast_delay)
+                        except Exception as e:
+                            for vfd_id in bus_vfd_ids:
+                                errors[vfd_id] = e
+                                results[vfd_id] = VFDTypes.GroupCommandResult(error=True, broadcast=True, message=repr(e))
+                    else:
+                        for vfd_id in bus_vfd_ids:
+                            try:
+                                await bus.write_register(self.vfds[vfd_id].slave_id, address, value)
+                            except Exception as e:
+                                errors[vfd_id] = e
+                                results[vfd_id] = VFDTypes.GroupCommandResult(error=True, message=repr(e))
+
+                    # Read back every drive once to confirm the write landed
+                    for vfd_id in bus_vfd_ids:
+                        # A failed broadcast may still have reached some drives, which the read back tells
+                        if vfd_id not in errors or broadcast:
+                            try:
+                                registers = await bus.read_holding_registers(self.vfds[vfd_id].slave_id, address, 1)
+                                if vfd_id in errors:
+                                    results[vfd_id].message += f", read back {int(registers[0])}"
+                                elif int(registers[0]) == value:
+                                    results[vfd_id] = VFDTypes.GroupCommandResult(broadcast=broadcast)
+                                else:
+                                    errors[vfd_id] = RuntimeError(f"Read back {int(registers[0])}, expected {value}")
+                                    results[vfd_id] = VFDTypes.GroupCommandResult(error=True, broadcast=broadcast, message=str(errors[vfd_id]))
+                            except Exception as e:
+                                if vfd_id not in errors:
+                                    errors[vfd_id] = e
+                                    results[vfd_id] = VFDTypes.GroupCommandResult(error=True, broadcast=broadcast, message=repr(e))
+                        self.parameter_caches[vfd_id].invalidate(address)
+                        bus.poller.expedite(vfd_id)
+                return {(vfd_id, code): error for vfd_id, error in errors.items()}
+
+            # Ordered after single drive writes of the same registers submitted before, so a queued command cannot land after a group stop
+            errors = await self.write_coalescer.write_many({(vfd_id, code): value for vfd_id in bus_vfd_ids}, write)
+            for vfd_id in bus_vfd_ids:
+                if vfd_id not in results:
+                    results[vfd_id] = VFDTypes.GroupCommandResult(error=True, message=repr(errors.get((vfd_id, code))))
+
+        await asyncio.gather(*[write_bus(self.buses[bus_name], bus_vfd_ids) for bus_name, bus_vfd_ids in by_bus.items()])
+        return results
+
+    async def emergency_stop(self):
+        await asyncio.gather(*[self.set_drive_mode(vfd_id, VFDTypes.DriveMode.STOP) for vfd_id in self.vfds])
+
+    async def poll_vfd(self, vfd_id: str):
+        await self.__updateState(vfd_id)
+
+    async def refresh_parameters(self, vfd_id: str):
+        self.parameter_caches[vfd_id].invalidate()
+        await self.__updateState(vfd_id)
     
-    async def modbus_polling_loop(self):
+    async def modbus_polling_loop(self, bus_name: str = "default"):
+        bus = self.buses[bus_name]
+        if bus.client is None:
+            await self.reconnect_modbus(bus_name)
+        if not bus.vfd_ids:
+            return
+        utilization = bus.poller.estimated_utilization()
+        if utilization > 1:
+            logger.warning(f"Bus {bus.name} needs an estimated {utilization:.0%} of its capacity to poll all devices at their running rate")
+        poll_seconds = POLL_SECONDS.labels(bus.name)
+        poll_lateness = POLL_LATENESS.labels(bus.name)
+        sweep_seconds = SWEEP_SECONDS.labels(bus.name)
+        poll_failures = {vfd_id: POLL_FAILURES.labels(bus.name, vfd_id) for vfd_id in bus.vfd_ids}
+        sweep_start = time.monotonic()
+        swept = set()
         while True:
-            await asyncio.sleep(0.2)
-            if self.client is not None:
-                for vfd in self.vfds:
-                    vfd = self.vfds[vfd]
-                    try:
-                        await self.__updateState(vfd.id)
-                        vfd.poll_fail_count = 0
-                        await asyncio.sleep(0.1)
-                    except SerialException as e:
-                        if e.errno == 2:
-                            logger.error(f"The serial port could not be opened!")
-                            #exit(1)
-                    except Exception:
-                        vfd.poll_fail_count = vfd.poll_fail_count + 1
-                        if vfd.poll_fail_count > 5:
-                            self.initialize_modbus()
-                        elif vfd.poll_fail_count > 10:
-                            vfd.state.drive_mode = VFDTypes.DriveMode.OFFLINE
-                            logger.error(f"Could not get VFD state: {vfd.display_name} as a serial exception occured!")
-                                
-
-    def initialize_modbus(self):
-        logger.info("Initializing Modbus communications")
-        self.client = core.modbus_for_url(self.serial_path, {"baudrate":9600, "parity":"E"})
\ No newline at end of file
+            target = await bus.poller.next_target()
+            vfd = self.vfds[target.vfd_id]
+            breaker = bus.health.breakers[vfd.id]
+            breaker.begin_probe()
+            # A drive behind an open breaker is probed with a timeout just long enough for a healthy answer
+            probing = breaker.state != BreakerState.CLOSED
+            timeout = max(2 * target.cost, self.MIN_PROBE_TIMEOUT) if probing else self.POLL_TIMEOUT
+            started = time.monotonic()
+            if target.polls and not probing:
+                poll_lateness.observe(max(started - target.deadline, 0.0))
+            try:
+                await self.__updateState(vfd.id, timeout=timeout)
+                self.__set_poll_fail_count(vfd, 0)
+                poll_seconds.observe(time.monotonic() - started)
+                bus.health.record_success()
+                if breaker.record_success():
+                    logger.info(f"VFD {vfd.display_name} is responding again")
+                    self.event_log.record(vfd.id, VFDTypes.EventKind.ONLINE, message="Responding to polls again")
+            except Exception as e:
+                poll_failures[vfd.id].inc()
+                self.__set_poll_fail_count(vfd, vfd.poll_fail_count + 1)
+                if isinstance(e, SerialException) and e.errno == 2:
+                    logger.error(f"The serial port for bus {bus.name} could not be opened!")
+                now = time.monotonic()
+                if breaker.record_failure(now):
+                    logger.error(f"VFD {vfd.display_name} failed {breaker.failures} polls in a row, probing it every {breaker.probe_interval:.0f}s or more until it responds")
+                    vfd.state.cur_drive_mode = VFDTypes.DriveMode.OFFLINE
+                    self.__publish_state(vfd.id)
+                    self.event_log.record(vfd.id, VFDTypes.EventKind.OFFLINE, message=f"No response to {breaker.failures} consecutive polls")
+                if bus.health.reconnect_due(now):
+                    await self.reconnect_modbus(bus.name)
+                    now = time.monotonic()
+                    bus.health.record_reconnect(now)
+                    # Probe every drive on the fresh connection right away
+                    for vfd_id, device in bus.health.breakers.items():
+                        device.next_probe = now
+                        bus.poller.defer(vfd_id, now)
+            running = VFDTypes.DriveMode.FORWARD in (vfd.state.cur_drive_mode, vfd.state.tgt_drive_mode) \
+                or VFDTypes.DriveMode.REVERSE in (vfd.state.cur_drive_mode, vfd.state.tgt_drive_mode)
+            bus.poller.complete(target, started, running)
+            if breaker.state != BreakerState.CLOSED:
+                # While the whole bus is down a probe is due by the next reconnect, which then probes every drive
+                bus.poller.defer(vfd.id, min(breaker.next_probe, bus.health.next_reconnect) if bus.health.failing() else breaker.next_probe)
+
+            swept.add(vfd.id)
+            healthy = [vfd_id for vfd_id, device in bus.health.breakers.items() if device.state == BreakerState.CLOSED]
+            if healthy and swept.issuperset(healthy):
+                now = time.monotonic()
+                sweep_seconds.observe(now - sweep_start)
+                sweep_start = now
+                swept.clear()
+
+    async def reconnect_modbus(self, bus_name: str):
+        """Replaces the connection of a bus without blocking the event loop."""
+        bus = self.buses[bus_name]
+        self.__invalidate_bus(bus)
+        # Ahead of everything queued, none of it can get through until the bus is back
+        async with bus.scheduler.reserve(Priority.EMERGENCY):
+            await bus.reconnect()
+
+    def __invalidate_bus(self, bus: ModbusBus):
+        for vfd_id in bus.vfd_ids:
+            self.parameter_caches[vfd_id].invalidate()
+            self.write_coalescer.invalidate((vfd_id, "S05"))
+            self.write_coalescer.invalidate((vfd_id, "S06"))
+
+    def initialize_modbus(self, bus_name: str = None):
+        buses = self.buses.values() if bus_name is None else [self.buses[bus_name]]
+        for bus in buses:
+            self.__invalidate_bus(bus)
+            bus.initialize()
\ No newline at end of file
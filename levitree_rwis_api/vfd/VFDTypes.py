@@ -1,5 +1,5 @@
-from enum import IntEnum
-from typing import List
+from enum import Enum, IntEnum
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field, validator
 
 class DriveMode(IntEnum):
@@ -8,10 +8,49 @@ class DriveMode(IntEnum):
     REVERSE = 2
     OFFLINE = 254
 
+class EventKind(str, Enum):
+    ALARM = "alarm"
+    ALARM_CLEARED = "alarm_cleared"
+    DRIVE_MODE = "drive_mode"
+    OFFLINE = "offline"
+    ONLINE = "online"
+
 class ReadRegistersResponse(BaseModel):
     error: bool = Field(default=False, description='Self explanatory')
     registers: List[int] = Field(default=[], description='Array of uint16 register values', examples=[[0,1,2], [25564, 0, 124, 5]])
 
+class RegisterRange(BaseModel):
+    vfd_id: str = Field(default="", description='Device internal ID', examples=["VFD1"])
+    code: str = Field(default="M05", description='Function code of the first register', examples=["M05", "F03"])
+    count: int = Field(default=1, description='Number of registers to read', examples=[1, 10])
+
+    @validator('count')
+    def assert_count(cls, count):
+        assert count >= 1, 'count must be at least 1'
+        assert count <= 125, 'count may not be greater than 125'
+        return count
+
+class ReadBatchParams(BaseModel):
+    reads: List[RegisterRange] = Field(default=[], description='Register ranges to read')
+    max_age: Optional[float] = Field(default=None, ge=0, description='Serve ranges from the poll cache if no older than this (s)', examples=[0.5, 5.0])
+
+    @validator('reads')
+    def assert_reads(cls, reads):
+        assert len(reads) <= 256, 'at most 256 ranges may be read per batch'
+        return reads
+
+class RegisterRangeResult(BaseModel):
+    vfd_id: str = Field(default="", description='Device internal ID', examples=["VFD1"])
+    code: str = Field(default="M05", description='Function code of the first register', examples=["M05", "F03"])
+    count: int = Field(default=1, description='Number of registers read', examples=[1, 10])
+    error: bool = Field(default=False, description='Self explanatory')
+    message: str = Field(default="", description='Error message', examples=["", "TimeoutError()"])
+    registers: List[int] = Field(default=[], description='Array of uint16 register values', examples=[[0,1,2], [25564, 0, 124, 5]])
+
+class ReadBatchResponse(BaseModel):
+    error: bool = Field(default=False, description='Self explanatory')
+    results: List[RegisterRangeResult] = Field(default=[], description='Result per requested range, in request order')
+
 class VFDState(BaseModel):
     cur_frequency: float = Field(default=0, description='Current operating frequency (Hz)', examples=[44.2, 60.0, 0.0])
     tgt_frequency: float = Field(default=0, description='Target / set operating frequency (Hz)', examples=[44.2, 60.0, 0.0])
@@ -21,6 +60,25 @@ class VFDState(BaseModel):
     output_current: float = Field(default=0, description='Output current (A)', examples=[44.2,0.1,93.2])
     input_power: float = Field(default=0, description='Input power (W)', examples=[9.02, 11.22])
     max_frequency: float = Field(default=0, description='Max supported frequency (Hz)', examples=[0.0,60.0,120.0])
+    alarm_code: int = Field(default=0, description='Active alarm code, 0 if the drive is not tripped', examples=[0, 1, 17])
+
+class VFDEvent(BaseModel):
+    id: int = Field(default=0, description='Event ID, increasing in the order events were recorded', examples=[1, 5021])
+    vfd_id: str = Field(default="", description='Device internal ID', examples=["VFD1"])
+    timestamp: float = Field(default=0, description='Time the transition was seen by a poll (UNIX time)', examples=[1700000000.0])
+    kind: EventKind = Field(default=EventKind.ALARM, description='Kind of transition', examples=[EventKind.ALARM, EventKind.DRIVE_MODE])
+    alarm_code: int = Field(default=0, description='Alarm code of alarm events', examples=[0, 1, 17])
+    drive_mode: Optional[DriveMode] = Field(default=None, description='New drive mode of drive mode events', examples=[DriveMode.FORWARD, None])
+    message: str = Field(default="", description='Human readable description', examples=["Overcurrent (during acceleration)", "Drive mode changed to STOP"])
+
+class HistorySeries(BaseModel):
+    min: List[float] = Field(default=[], description='Minimum value per bucket')
+    max: List[float] = Field(default=[], description='Maximum value per bucket')
+    mean: List[float] = Field(default=[], description='Mean value per bucket')
+
+class VFDHistory(BaseModel):
+    timestamps: List[float] = Field(default=[], description='Start of each non-empty bucket (UNIX time)', examples=[[1700000000.0, 1700000012.0]])
+    metrics: Dict[str, HistorySeries] = Field(default={}, description='Downsampled series per metric')
 
 class VFD(BaseModel):
     state: VFDState = Field(default=VFDState(), description='Current device state')
@@ -28,6 +86,7 @@ class VFD(BaseModel):
     display_name: str = Field(default=0, description='Device display name', examples=["My VFD", "Big VFD"])
     id: str = Field(default=0, description='Device internal ID', examples=["VFD1", "BigVFD"])
     model: str = Field(default="Frenic", description='Device brand', examples=["Frenic"])
+    bus: str = Field(default="default", description='Modbus bus the device is attached to', examples=["default", "line2"])
     poll_fail_count: int = Field(default=0, description='Poll fail count', examples=[0,10])
 
 class StatelessVFD(BaseModel):
@@ -35,8 +94,30 @@ class StatelessVFD(BaseModel):
     display_name: str = Field(default=0, description='Device display name', examples=["My VFD", "Big VFD"])
     id: str = Field(default=0, description='Device internal ID', examples=["VFD1", "BigVFD"])
     model: str = Field(default="Frenic", description='Device brand', examples=["Frenic"])
+    bus: str = Field(default="default", description='Modbus bus the device is attached to', examples=["default", "line2"])
     poll_fail_count: int = Field(default=0, description='Poll fail count', examples=[0,10])
 
+class BusQueueStats(BaseModel):
+    queue_depth: int = Field(default=0, description='Transactions currently waiting for the bus', examples=[0, 3])
+    transactions: int = Field(default=0, description='Transactions granted the bus', examples=[0, 10423])
+    mean_wait: float = Field(default=0, description='Mean time waited for the bus (s)', examples=[0.002, 0.031])
+    max_wait: float = Field(default=0, description='Longest time waited for the bus (s)', examples=[0.045, 0.4])
+
+class PollStats(BaseModel):
+    target_rate: float = Field(default=0, description='Current target poll rate (Hz)', examples=[5.0, 0.5])
+    achieved_rate: float = Field(default=0, description='Smoothed achieved poll rate (Hz)', examples=[4.98, 0.5])
+    jitter: float = Field(default=0, description='Smoothed lateness of polls behind their deadline (s)', examples=[0.004, 0.02])
+    polls: int = Field(default=0, description='Polls performed', examples=[0, 5000])
+    breaker: str = Field(default="closed", description='Circuit breaker state, open devices are only probed now and then', examples=["closed", "open", "half_open"])
+
+class BusStatus(BaseModel):
+    name: str = Field(default="default", description='Bus name', examples=["default", "line2"])
+    url: str = Field(default="", description='Bus connection URL', examples=["serial:///dev/ttyUSB0", "tcp://10.0.0.20:502"])
+    vfds: List[str] = Field(default=[], description='IDs of devices attached to the bus', examples=[["VFD1", "BigVFD"]])
+    queues: Dict[str, BusQueueStats] = Field(default={}, description='Scheduler statistics per priority class')
+    estimated_utilization: float = Field(default=0, description='Estimated fraction of bus time needed by polling at the target rates', examples=[0.35, 1.2])
+    polling: Dict[str, PollStats] = Field(default={}, description='Polling statistics per device')
+
 class SetVFDDriveModeParams(BaseModel):
     drive_mode: DriveMode = Field(default=DriveMode.STOP, description='Target drive mode')
 
@@ -54,4 +135,19 @@ class SetVFDFrequencyParams(BaseModel):
         assert frequency is not None, 'frequency is required'
         assert frequency >= 0, 'frequency may not be negative'
         assert frequency <= 120, 'frequency may not be greater than 120'
-        return frequency
\ No newline at end of file
+        return frequency
+
+class SetGroupDriveModeParams(SetVFDDriveModeParams):
+    vfd_ids: List[str] = Field(default=[], description='Devices to command, all devices if empty', examples=[["VFD1", "VFD2"]])
+
+class SetGroupFrequencyParams(SetVFDFrequencyParams):
+    vfd_ids: List[str] = Field(default=[], description='Devices to command, all devices if empty', examples=[["VFD1", "VFD2"]])
+
+class GroupCommandResult(BaseModel):
+    error: bool = Field(default=False, description='Self explanatory')
+    message: str = Field(default="", description='Error message', examples=["", "Read back 0, expected 3000"])
+    broadcast: bool = Field(default=False, description='Whether the write was sent as a Modbus broadcast')
+
+class GroupCommandResponse(BaseModel):
+    error: bool = Field(default=False, description='True if any device failed')
+    results: Dict[str, GroupCommandResult] = Field(default={}, description='Verified result per device')
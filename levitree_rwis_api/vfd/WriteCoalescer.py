@@ -0,0 +1,196 @@
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+import asyncio
+import time
+
+from aioretry import RetryInfo, RetryPolicyStrategy
+
+
+class PendingWrite:
+    def __init__(self, value: int, barrier: bool, write: Optional[Callable[[int], Awaitable[None]]]):
+        self.value = value
+        self.barrier = barrier
+        # None for a register of a `write_many` call, which does the write itself
+        self.write = write
+        self.waiters: List[asyncio.Future] = []
+        # Only for `write_many`: granted once every earlier write is done, then set to the write's error or None
+        self.turn: Optional[asyncio.Future] = None
+        self.written: Optional[asyncio.Future] = None
+
+
+class RegisterSlot:
+    def __init__(self):
+        self.confirmed: Optional[int] = None
+        self.confirmed_at = 0.0
+        # Values still to be written, only the last one can be superseded
+        self.pending: Deque[PendingWrite] = deque()
+        self.task: Optional[asyncio.Task] = None
+
+
+class WriteCoalescer:
+    """Last-write-wins writes to single registers.
+
+    At most one write per register is on the bus at a time. Values submitted
+    while one is in flight collapse into a single pending value, and every
+    caller that was waiting on a superseded value resolves with the newer
+    value once that is written. Failed writes are retried with
+    `retry_policy`, unless a newer value has arrived in the meantime.
+
+    Writes equal to the last confirmed value are skipped, but only within
+    `confirm_ttl` seconds of the confirmation, as the drive can change a
+    register behind our back, e.g. when it is power cycled.
+
+    A barrier write, such as a stop, is never superseded. Values submitted
+    after it queue behind it, and it is retried even when newer values wait.
+    Writes of several registers in one go, e.g. group commands, take their
+    place in each register's order the same way.
+    """
+
+    def __init__(self, retry_policy: Callable[[RetryInfo], RetryPolicyStrategy], confirm_ttl: float = 1.0):
+        self.retry_policy = retry_policy
+        self.confirm_ttl = confirm_ttl
+        self.slots: Dict[Hashable, RegisterSlot] = {}
+        self.coalesced = 0
+        self.skipped = 0
+
+    async def write(self, key: Hashable, value: int, write: Callable[[int], Awaitable[None]], skip_confirmed: bool = True,
+                    barrier: bool = False) -> int:
+        """Writes `value` with `write`, returning the value that ended up written in its place.
+
+        `write` performs a single attempt and is called with the newest value
+        submitted for `key`, or with a barrier submitted before it.
+        """
+        slot = self.__slot(key)
+        if skip_confirmed and slot.task is None and slot.confirmed == value and time.monotonic() - slot.confirmed_at < self.confirm_ttl:
+            self.skipped += 1
+            return value
+
+        if slot.pending and not slot.pending[-1].barrier:
+            self.coalesced += 1
+            pending = slot.pending[-1]
+            pending.value, pending.barrier, pending.write = value, barrier, write
+        else:
+            pending = PendingWrite(value, barrier, write)
+            slot.pending.append(pending)
+        waiter = asyncio.get_running_loop().create_future()
+        pending.waiters.append(waiter)
+        self.__start(slot)
+        # Shielded so a caller giving up does not abort a write others wait on
+        return await asyncio.shield(waiter)
+
+    async def write_many(self, values: Dict[Hashable, int],
+                         write: Callable[[], Awaitable[Dict[Hashable, Exception]]]) -> Dict[Hashable, Exception]:
+        """Writes several registers with a single call of `write`, returning the error of each register that failed.
+
+        `write` is called once every write submitted earlier for any of the
+        registers is done, and returns the errors it ran into. A value still
+        waiting to be written is superseded by this one, values submitted
+        later queue behind it.
+        """
+        loop = asyncio.get_running_loop()
+        entries: Dict[Hashable, PendingWrite] = {}
+        # Queued without yielding, so concurrent calls take the same order in every register
+        for key, value in values.items():
+            slot = self.__slot(key)
+            entry = PendingWrite(value, True, None)
+            entry.turn, entry.written = loop.create_future(), loop.create_future()
+            if slot.pending and not slot.pending[-1].barrier:
+                self.coalesced += 1
+                entry.waiters = slot.pending.pop().waiters
+            slot.pending.append(entry)
+            self.__start(slot)
+            entries[key] = entry
+
+        errors = None
+        try:
+            await asyncio.gather(*[entry.turn for entry in entries.values()])
+            errors = await write()
+        except Exception as e:
+            errors = {key: e for key in entries}
+        finally:
+            for key, entry in entries.items():
+                if not entry.written.done():
+                    entry.written.set_result(RuntimeError("Register write was abandoned") if errors is None else errors.get(key))
+        return errors
+
+    def __slot(self, key: Hashable) -> RegisterSlot:
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self.slots[key] = RegisterSlot()
+        return slot
+
+    def __start(self, slot: RegisterSlot):
+        if slot.task is None:
+            slot.task = asyncio.create_task(self.__drain(slot))
+
+    def invalidate(self, key: Hashable = None):
+        """Forgets confirmed values, e.g. after a reconnect or a write that bypassed the coalescer."""
+        slots = self.slots.values() if key is None else [self.slots[key]] if key in self.slots else []
+        for slot in slots:
+            slot.confirmed = None
+
+    async def __drain(self, slot: RegisterSlot):
+        info = None
+        current = None
+        try:
+            while slot.pending:
+                current = slot.pending.popleft()
+                if current.write is None:
+                    current.turn.set_result(None)
+                    error = await current.written
+                    info = None
+                    if error is not None:
+                        slot.confirmed = None
+                        self.__resolve(current.waiters, exception=error)
+                    else:
+                        slot.confirmed = current.value
+                        slot.confirmed_at = time.monotonic()
+                        self.__resolve(current.waiters, result=current.value)
+                    continue
+                try:
+                    await current.write(current.value)
+                except Exception as e:
+                    slot.confirmed = None
+                    if slot.pending and not current.barrier:
+                        # Superseded while failing, the newer value is written instead
+                        slot.pending[0].waiters[:0] = current.waiters
+                        info = None
+                        continue
+                    info = RetryInfo(1, e, time.monotonic()) if info is None else info.update(e)
+                    abandon, delay = self.retry_policy(info)
+                    if abandon:
+                        self.__resolve(current.waiters, exception=e)
+                        info = None
+                        continue
+                    await asyncio.sleep(delay)
+                    if slot.pending and not current.barrier:
+                        slot.pending[0].waiters[:0] = current.waiters
+                        info = None
+                    else:
+                        # Keep waiting callers attached, to this value or to a newer one
+                        slot.pending.appendleft(current)
+                    continue
+                info = None
+                slot.confirmed = current.value
+                slot.confirmed_at = time.monotonic()
+                self.__resolve(current.waiters, result=current.value)
+        finally:
+            slot.task = None
+            # Only left over if draining was cancelled, nothing would write these anymore
+            abandoned = RuntimeError("Register write was abandoned")
+            left = ([] if current is None else [current]) + list(slot.pending)
+            slot.pending.clear()
+            for pending in left:
+                if pending.turn is not None and not pending.turn.done():
+                    pending.turn.set_exception(abandoned)
+                self.__resolve(pending.waiters, exception=abandoned)
+
+    @staticmethod
+    def __resolve(waiters: List[asyncio.Future], result: int = None, exception: Exception = None):
+        for waiter in waiters:
+            if waiter.done():
+                continue
+            if exception is not None:
+                waiter.set_exception(exception)
+            else:
+                waiter.set_result(result)
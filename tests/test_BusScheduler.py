@@ -0,0 +1,65 @@
+import asyncio
+
+from levitree_rwis_api.vfd.BusScheduler import BusScheduler, Priority
+
+
+async def hold(scheduler: BusScheduler, priority: Priority, order: list, name: str):
+    async with scheduler.reserve(priority):
+        order.append(name)
+        await asyncio.sleep(0)
+
+
+def test_highest_priority_first_then_arrival_order():
+    async def run():
+        scheduler = BusScheduler()
+        order = []
+        await scheduler.acquire(Priority.POLL)
+        tasks = [asyncio.create_task(hold(scheduler, priority, order, name)) for priority, name in [
+            (Priority.POLL, "poll 1"), (Priority.USER_READ, "read"), (Priority.POLL, "poll 2"),
+            (Priority.EMERGENCY, "stop"), (Priority.OPERATOR_WRITE, "write"),
+        ]]
+        await asyncio.sleep(0)
+        assert scheduler.stats[Priority.POLL].queue_depth == 2
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order, scheduler
+
+    order, scheduler = asyncio.run(run())
+    assert order == ["stop", "write", "read", "poll 1", "poll 2"]
+    assert scheduler.stats[Priority.POLL].transactions == 3
+    assert scheduler.stats[Priority.POLL].queue_depth == 0
+
+
+def test_cancelled_waiter_is_skipped():
+    async def run():
+        scheduler = BusScheduler()
+        order = []
+        await scheduler.acquire(Priority.POLL)
+        cancelled = asyncio.create_task(hold(scheduler, Priority.EMERGENCY, order, "cancelled"))
+        waiting = asyncio.create_task(hold(scheduler, Priority.POLL, order, "poll"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        scheduler.release()
+        await waiting
+        return order, scheduler
+
+    order, scheduler = asyncio.run(run())
+    assert order == ["poll"]
+    assert not scheduler._busy
+
+
+def test_waiter_cancelled_after_handover_releases_the_bus():
+    async def run():
+        scheduler = BusScheduler()
+        await scheduler.acquire(Priority.POLL)
+        handed = asyncio.create_task(scheduler.acquire(Priority.USER_READ))
+        await asyncio.sleep(0)
+        # Handed the bus and cancelled before it got to run
+        scheduler.release()
+        handed.cancel()
+        await asyncio.gather(handed, return_exceptions=True)
+        await asyncio.wait_for(scheduler.acquire(Priority.POLL), 1)
+        return handed
+
+    assert asyncio.run(run()).cancelled()
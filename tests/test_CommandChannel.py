@@ -0,0 +1,76 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+from levitree_rwis_api.CommandChannel import CommandClient, CommandServer
+from levitree_rwis_api.vfd.VFDTypes import VFDState
+
+
+def run_with_channel(test, handlers):
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            server = CommandServer(os.path.join(directory, "commands.sock"), handlers)
+            await server.start()
+            client = CommandClient(server.path)
+            try:
+                return await test(server, client)
+            finally:
+                await client.close()
+                await server.close()
+    return asyncio.run(run())
+
+
+def test_calls_run_concurrently_on_one_connection():
+    release = asyncio.Event()
+
+    async def slow():
+        await release.wait()
+        return "slow"
+
+    def quick(value, scale=1):
+        release.set()
+        return value * scale
+
+    async def test(server, client):
+        return await asyncio.gather(client.call("slow"), client.call("quick", 2, scale=3))
+
+    assert run_with_channel(test, {"slow": slow, "quick": quick}) == ["slow", 6]
+
+
+def test_models_are_sent_as_json():
+    async def test(server, client):
+        return await client.call("state")
+
+    assert run_with_channel(test, {"state": lambda: VFDState(cur_frequency=12.5)})["cur_frequency"] == 12.5
+
+
+def test_remote_errors_are_raised_on_the_calling_side():
+    def fail(kind):
+        raise {"value": ValueError, "other": ZeroDivisionError}[kind]("no such drive")
+
+    async def test(server, client):
+        errors = []
+        for method, args in (("fail", ["value"]), ("fail", ["other"]), ("missing", [])):
+            with pytest.raises(Exception) as error:
+                await client.call(method, *args)
+            errors.append((type(error.value), str(error.value)))
+        return errors
+
+    assert run_with_channel(test, {"fail": fail}) == [
+        (ValueError, "no such drive"),
+        (RuntimeError, "ZeroDivisionError: no such drive"),
+        (ValueError, "Unknown command missing"),
+    ]
+
+
+def test_calls_in_flight_fail_when_the_server_closes():
+    async def test(server, client):
+        call = asyncio.create_task(client.call("hang"))
+        await asyncio.sleep(0.05)
+        await server.close()
+        with pytest.raises(ConnectionError):
+            await call
+
+    run_with_channel(test, {"hang": lambda: asyncio.Event().wait()})
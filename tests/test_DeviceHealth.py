@@ -0,0 +1,69 @@
+from levitree_rwis_api.vfd.DeviceHealth import BreakerState, BusHealth, DeviceBreaker
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = DeviceBreaker("bus", "a", failure_threshold=3, probe_interval=2.0)
+    assert not breaker.record_failure(10.0)
+    breaker.record_success()
+    assert not breaker.record_failure(11.0)
+    assert not breaker.record_failure(12.0)
+    assert breaker.record_failure(13.0)
+    assert breaker.state == BreakerState.OPEN
+    assert breaker.next_probe == 15.0
+
+
+def test_failed_probes_back_off_up_to_the_limit():
+    breaker = DeviceBreaker("bus", "a", failure_threshold=1, probe_interval=2.0, max_probe_interval=5.0)
+    breaker.record_failure(0.0)
+    probes = []
+    for now in (2.0, 6.0, 11.0):
+        breaker.begin_probe()
+        assert breaker.state == BreakerState.HALF_OPEN
+        assert not breaker.record_failure(now)
+        assert breaker.state == BreakerState.OPEN
+        probes.append(breaker.next_probe - now)
+    assert probes == [4.0, 5.0, 5.0]
+
+
+def test_successful_probe_closes_and_resets():
+    breaker = DeviceBreaker("bus", "a", failure_threshold=1, probe_interval=2.0)
+    breaker.record_failure(0.0)
+    breaker.begin_probe()
+    breaker.record_failure(2.0)
+    breaker.begin_probe()
+    assert breaker.record_success()
+    assert breaker.state == BreakerState.CLOSED
+    assert breaker.failures == 0 and breaker.probe_interval == 2.0
+    assert not breaker.record_success()
+
+
+def test_bus_is_failing_only_when_every_device_is():
+    health = BusHealth("bus")
+    assert not health.failing()
+    for vfd_id in ("a", "b"):
+        health.add(vfd_id)
+    for _ in range(3):
+        health.breakers["a"].record_failure(0.0)
+    assert not health.failing()
+    for _ in range(3):
+        health.breakers["b"].record_failure(0.0)
+    assert health.failing()
+    assert health.reconnect_due(0.0)
+
+
+def test_reconnects_back_off_until_a_device_answers():
+    health = BusHealth("bus", reconnect_interval=1.0, max_reconnect_interval=3.0)
+    health.add("a")
+    for _ in range(3):
+        health.breakers["a"].record_failure(0.0)
+    schedule = []
+    now = 0.0
+    for _ in range(4):
+        assert health.reconnect_due(now)
+        health.record_reconnect(now)
+        assert not health.reconnect_due(now)
+        schedule.append(health.next_reconnect - now)
+        now = health.next_reconnect
+    assert schedule == [1.0, 2.0, 3.0, 3.0]
+    health.record_success()
+    assert health.reconnect_interval == 1.0
@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+from levitree_rwis_api.vfd.EventLog import EventLog
+from levitree_rwis_api.vfd.VFDTypes import DriveMode, EventKind
+
+
+def test_query_filters_newest_first():
+    log = EventLog()
+    log.record("a", EventKind.DRIVE_MODE, drive_mode=DriveMode.FORWARD)
+    log.record("b", EventKind.ALARM, alarm_code=5, message="OC1")
+    log.record("a", EventKind.ALARM, alarm_code=17)
+    log.record("a", EventKind.ALARM_CLEARED)
+
+    assert [event.kind for event in log.query(vfd_id="a")] == [EventKind.ALARM_CLEARED, EventKind.ALARM, EventKind.DRIVE_MODE]
+    alarms = log.query(kinds=[EventKind.ALARM])
+    assert [(event.vfd_id, event.alarm_code) for event in alarms] == [("a", 17), ("b", 5)]
+    assert alarms[1].message == "OC1"
+    assert log.query(vfd_id="a", kinds=[EventKind.DRIVE_MODE])[0].drive_mode == DriveMode.FORWARD
+    assert len(log.query(limit=2)) == 2
+
+
+def test_query_by_time():
+    log = EventLog()
+    first = log.record("a", EventKind.OFFLINE)
+    time.sleep(0.01)
+    second = log.record("a", EventKind.ONLINE)
+    assert [event.id for event in log.query(end=second.timestamp)] == [first.id]
+    assert [event.id for event in log.query(start=second.timestamp)] == [second.id]
+    assert log.query(start=first.timestamp + 3600) == []
+
+
+def test_events_persist_and_ids_continue(tmp_path):
+    path = str(tmp_path / "events.db")
+    log = EventLog(path, flush_interval=0.01)
+    log.start()
+    log.record("a", EventKind.ALARM, alarm_code=3)
+    last = log.record("a", EventKind.ALARM_CLEARED)
+    log.stop()
+
+    reopened = EventLog(path)
+    assert [event.id for event in reopened.query()] == [last.id, last.id - 1]
+    assert reopened.record("a", EventKind.OFFLINE).id == last.id + 1
+
+
+def test_slow_subscriber_drops_instead_of_blocking():
+    async def run():
+        log = EventLog(subscriber_queue_size=2)
+        queue = log.subscribe()
+        for _ in range(3):
+            log.record("a", EventKind.OFFLINE)
+        received = [queue.get_nowait().id for _ in range(queue.qsize())]
+        log.unsubscribe(queue)
+        log.record("a", EventKind.ONLINE)
+        return received, queue.qsize()
+
+    received, remaining = asyncio.run(run())
+    assert received == [1, 2]
+    assert remaining == 0
@@ -0,0 +1,42 @@
+from levitree_rwis_api.Metrics import MetricsRegistry, merge_rendered
+
+
+def test_render_counter_gauge_and_histogram():
+    registry = MetricsRegistry()
+    registry.counter("errors_total", "Errors", ["slave"]).labels(1).inc(2)
+    registry.gauge("depth", "Queue depth").labels().set_function(lambda: 3)
+    histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)).labels()
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    assert registry.render().splitlines() == [
+        "# HELP errors_total Errors", "# TYPE errors_total counter", 'errors_total{slave="1"} 2',
+        "# HELP depth Queue depth", "# TYPE depth gauge", "depth 3",
+        "# HELP latency_seconds Latency", "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1', 'latency_seconds_bucket{le="1.0"} 2', 'latency_seconds_bucket{le="+Inf"} 2',
+        "latency_seconds_sum 0.55", "latency_seconds_count 2",
+    ]
+
+
+def test_label_values_and_help_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter("events_total", 'Events\nby "name" C:\\', ["name"]).labels('Pump "A"\\\nline 2').inc()
+    assert registry.render().splitlines() == [
+        '# HELP events_total Events\\nby "name" C:\\\\',
+        "# TYPE events_total counter",
+        'events_total{name="Pump \\"A\\"\\\\\\nline 2"} 1',
+    ]
+
+
+def test_skip_empty_leaves_out_families_without_samples():
+    registry = MetricsRegistry()
+    registry.counter("unused_total", "Unused").labels()
+    registry.gauge("unlabelled", "No children")
+    registry.gauge("temperature", "Temperature").labels().set(0)
+    assert registry.render(skip_empty=True) == "# HELP temperature Temperature\n# TYPE temperature gauge\ntemperature 0\n"
+
+
+def test_merge_rendered_keeps_the_first_family_of_each_name():
+    worker = "# HELP shared Shared\n# TYPE shared gauge\nshared 1\n"
+    owner = "# HELP shared Shared\n# TYPE shared gauge\nshared 2\n# HELP owned Owned\n# TYPE owned gauge\nowned 3\n"
+    assert merge_rendered(worker, owner) == (
+        "# HELP shared Shared\n# TYPE shared gauge\nshared 1\n# HELP owned Owned\n# TYPE owned gauge\nowned 3\n")
@@ -0,0 +1,98 @@
+import asyncio
+import struct
+
+from levitree_rwis_api.vfd import Frenic
+from levitree_rwis_api.vfd.BusScheduler import Priority
+from levitree_rwis_api.vfd.FrenicSimulator import FrenicSimulator
+from levitree_rwis_api.vfd.ModbusGateway import ModbusGateway
+from levitree_rwis_api.vfd.VFDController import VFDController
+from levitree_rwis_api.vfd.VFDTypes import DriveMode
+
+S05 = Frenic.function_code_to_coil("S05")
+S06 = Frenic.function_code_to_coil("S06")
+F03 = Frenic.function_code_to_coil("F03")
+
+
+class GatewayClient:
+    """Minimal Modbus TCP client, one request at a time."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.transaction_id = 0
+
+    async def request(self, unit_id: int, pdu: bytes) -> bytes:
+        self.transaction_id += 1
+        self.writer.write(struct.pack(">HHHB", self.transaction_id, 0, len(pdu) + 1, unit_id) + pdu)
+        transaction_id, _, length, _ = struct.unpack(">HHHB", await self.reader.readexactly(7))
+        assert transaction_id == self.transaction_id
+        return await self.reader.readexactly(length - 1)
+
+
+def run_with_gateway(test):
+    """Runs `test(controller, simulator, client)` with two simulated drives behind a gateway."""
+    async def run():
+        simulator = FrenicSimulator(2, baudrate=0, latency=0.001)
+        controller = VFDController(await simulator.serve_tcp())
+        controller.register_vfd(1, "Drive 1", "d1")
+        controller.register_vfd(2, "Drive 2", "d2")
+        controller.buses["default"].initialize()
+        gateway = ModbusGateway(controller, host="127.0.0.1", port=0)
+        await gateway.start()
+        reader, writer = await asyncio.open_connection("127.0.0.1", gateway.server.sockets[0].getsockname()[1])
+        try:
+            return await test(controller, simulator, GatewayClient(reader, writer))
+        finally:
+            writer.close()
+            await gateway.close()
+            await simulator.close()
+    return asyncio.run(run())
+
+
+def test_read_holding_registers():
+    async def test(controller, simulator, client):
+        return await client.request(2, struct.pack(">BHH", 3, F03, 1))
+
+    assert run_with_gateway(test) == struct.pack(">BBH", 3, 2, 600)
+
+
+def test_exception_responses():
+    async def test(controller, simulator, client):
+        return [await client.request(9, struct.pack(">BHH", 3, F03, 1)),
+                await client.request(1, struct.pack(">BHH", 4, F03, 1)),
+                await client.request(1, struct.pack(">BHH", 3, F03, 0)),
+                # The drive's own exception, the first register is not writable
+                await client.request(1, struct.pack(">BHHB3H", 16, S05 - 1, 3, 6, 1, 2500, 1))]
+
+    assert run_with_gateway(test) == [b"\x83\x0a", b"\x84\x01", b"\x83\x03", b"\x90\x02"]
+
+
+def test_write_multiple_registers_goes_through_the_coalescer():
+    async def test(controller, simulator, client):
+        response = await client.request(1, struct.pack(">BHHB2H", 16, S05, 2, 4, 2500, 1))
+        return response, simulator.devices[1]["S05"], simulator.devices[1]["S06"], controller.write_coalescer.slots[("d1", "S06")].confirmed
+
+    response, frequency_command, run_command, confirmed = run_with_gateway(test)
+    assert response == struct.pack(">BHH", 16, S05, 2)
+    assert (frequency_command, run_command, confirmed) == (2500, 1, 1)
+
+
+def test_gateway_stop_lands_after_queued_commands():
+    async def test(controller, simulator, client):
+        bus = controller.buses["default"]
+        await bus.scheduler.acquire(Priority.POLL)
+        forward = asyncio.create_task(controller.set_drive_mode("d1", DriveMode.FORWARD))
+        await asyncio.sleep(0.01)
+        # Waits in the coalescer behind the forward command
+        reverse = asyncio.create_task(controller.set_drive_mode("d1", DriveMode.REVERSE))
+        await asyncio.sleep(0.01)
+        stop = asyncio.create_task(client.request(1, struct.pack(">BHH", 6, S06, 0)))
+        await asyncio.sleep(0.01)
+        bus.scheduler.release()
+        return await forward, await reverse, await stop, simulator.devices[1]["S06"]
+
+    forward, reverse, response, run_command = run_with_gateway(test)
+    # The reverse command was superseded by the stop
+    assert (forward, reverse) == (DriveMode.FORWARD, DriveMode.STOP)
+    assert response == struct.pack(">BHH", 6, S06, 0)
+    assert run_command == 0
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import pytest
+
+from levitree_rwis_api.vfd.PollScheduler import PollScheduler
+
+
+def test_most_overdue_device_is_polled_first():
+    async def run():
+        scheduler = PollScheduler()
+        for vfd_id in ("a", "b", "c"):
+            scheduler.add(vfd_id, 5, 0.5, 0.01)
+        now = time.monotonic()
+        scheduler.targets["a"].deadline = now - 0.1
+        scheduler.targets["b"].deadline = now - 0.3
+        scheduler.targets["c"].deadline = now + 10
+        return (await scheduler.next_target()).vfd_id
+
+    assert asyncio.run(run()) == "b"
+
+
+def test_deadlines_advance_by_whole_periods():
+    scheduler = PollScheduler()
+    scheduler.add("a", 10, 1, 0.01)
+    target = scheduler.targets["a"]
+    target.deadline = 100.0
+    scheduler.complete(target, 100.05, running=True)
+    # Absolute deadlines, time spent polling does not stretch the period
+    assert target.deadline == pytest.approx(100.1)
+    scheduler.complete(target, 100.12, running=True)
+    assert target.deadline == pytest.approx(100.2)
+    assert target.polls == 2
+    assert target.interval == pytest.approx(0.07)
+
+
+def test_missed_slots_are_skipped():
+    scheduler = PollScheduler()
+    scheduler.add("a", 10, 1, 0.01)
+    target = scheduler.targets["a"]
+    target.deadline = 100.0
+    scheduler.complete(target, 100.55, running=True)
+    assert target.deadline == pytest.approx(100.65)
+
+
+def test_stopped_rate_applies_when_not_running():
+    scheduler = PollScheduler()
+    scheduler.add("a", 10, 0.5, 0.01)
+    target = scheduler.targets["a"]
+    target.deadline = 100.0
+    scheduler.complete(target, 100.0, running=True)
+    scheduler.complete(target, 100.1, running=False)
+    assert target.period == 2.0
+    assert target.deadline == pytest.approx(102.1)
+    # Measuring the achieved rate starts afresh
+    assert target.interval == 0.0 and target.last_start is None
+
+
+def test_expedite_wakes_a_waiting_sweep():
+    async def run():
+        scheduler = PollScheduler()
+        scheduler.add("a", 5, 0.5, 0.01)
+        scheduler.targets["a"].deadline = time.monotonic() + 60
+        waiting = asyncio.create_task(scheduler.next_target())
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        scheduler.expedite("a")
+        return await asyncio.wait_for(waiting, 1)
+
+    assert asyncio.run(run()).vfd_id == "a"
+
+
+def test_estimated_utilization():
+    scheduler = PollScheduler()
+    scheduler.add("a", 5, 0.5, 0.02)
+    scheduler.add("b", 10, 0.5, 0.03)
+    assert scheduler.estimated_utilization() == pytest.approx(0.4)
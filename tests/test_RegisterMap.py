@@ -0,0 +1,51 @@
+from levitree_rwis_api.vfd.RegisterMap import Register, RegisterMap
+
+
+def make_map(**kwargs) -> RegisterMap:
+    return RegisterMap([
+        Register("M09", 0x0809, "output_frequency", 100),
+        Register("M10", 0x080A, "input_power", 100),
+        Register("M11", 0x080B, "output_current", 100),
+        Register("M20", 0x0814, "run_time"),
+        Register("F03", 0x0103, "max_frequency", 10),
+    ], **kwargs)
+
+
+def test_plan_merges_contiguous_registers():
+    plan = make_map().plan(["M09", "M10", "M11"])
+    assert len(plan) == 1
+    assert (plan[0].address, plan[0].count) == (0x0809, 3)
+    assert [offset for offset, _ in plan[0].registers] == [0, 1, 2]
+
+
+def test_plan_bridges_small_gaps_only():
+    # M11 and M20 are 8 registers apart
+    plan = make_map(max_gap=8).plan(["M11", "M20"])
+    assert [(block.address, block.count) for block in plan] == [(0x080B, 10)]
+    plan = make_map(max_gap=7).plan(["M11", "M20"])
+    assert [(block.address, block.count) for block in plan] == [(0x080B, 1), (0x0814, 1)]
+
+
+def test_plan_respects_max_count():
+    plan = make_map(max_count=2).plan(["M09", "M10", "M11"])
+    assert [(block.address, block.count) for block in plan] == [(0x0809, 2), (0x080B, 1)]
+
+
+def test_plan_never_merges_function_code_groups():
+    plan = make_map(max_gap=0x1000, max_count=0x1000).plan(["F03", "M09"])
+    assert [block.address for block in plan] == [0x0103, 0x0809]
+
+
+def test_plan_is_cached_regardless_of_order():
+    register_map = make_map()
+    assert register_map.plan(["M11", "M09"]) is register_map.plan({"M09", "M11"})
+
+
+def test_decode_scales_fields():
+    register_map = make_map()
+    plan = register_map.plan(["M09", "M11", "M20", "F03"])
+    raw = {0x0809: 5000, 0x080B: 1234, 0x0814: 7, 0x0103: 600}
+    results = [[raw.get(block.address + offset, 0) for offset in range(block.count)] for block in plan]
+    values = register_map.decode(plan, results)
+    assert values == {"output_frequency": 50.0, "output_current": 12.34, "run_time": 7, "max_frequency": 60.0}
+    assert isinstance(values["run_time"], int)
@@ -0,0 +1,57 @@
+from levitree_rwis_api.vfd.StateHistory import StateHistory
+
+
+def sample(frequency: float) -> dict:
+    return {"cur_frequency": frequency, "output_current": frequency / 10, "output_voltage": 400,
+            "input_power": 0, "cur_drive_mode": 1}
+
+
+def filled(capacity: int, count: int) -> StateHistory:
+    history = StateHistory(capacity)
+    for second in range(count):
+        history.append(float(second), sample(float(second)))
+    return history
+
+
+def test_empty_range():
+    result = filled(10, 5).query(100, 200, 4, ["cur_frequency"])
+    assert result == {"timestamps": [], "metrics": {"cur_frequency": {"min": [], "max": [], "mean": []}}}
+
+
+def test_buckets_reduce_min_max_mean():
+    result = filled(10, 10).query(0, 10, 2, ["cur_frequency", "output_voltage"])
+    assert result["timestamps"] == [0.0, 5.0]
+    assert result["metrics"]["cur_frequency"] == {"min": [0.0, 5.0], "max": [4.0, 9.0], "mean": [2.0, 7.0]}
+    assert result["metrics"]["output_voltage"]["mean"] == [400.0, 400.0]
+
+
+def test_empty_buckets_are_left_out():
+    history = StateHistory(10)
+    for timestamp in (0.5, 1.5, 8.5):
+        history.append(timestamp, sample(timestamp))
+    result = history.query(0, 10, 5, ["cur_frequency"])
+    assert result["timestamps"] == [0.0, 8.0]
+    assert result["metrics"]["cur_frequency"]["max"] == [1.5, 8.5]
+
+
+def test_range_end_is_exclusive():
+    result = filled(10, 10).query(2, 4, 1, ["cur_frequency"])
+    assert result["metrics"]["cur_frequency"] == {"min": [2.0], "max": [3.0], "mean": [2.5]}
+
+
+def test_wrapped_ring_keeps_newest_samples_in_order():
+    history = filled(8, 20)
+    assert history.size == 8
+    result = history.query(0, 20, 20, ["cur_frequency"])
+    assert result["timestamps"] == [float(second) for second in range(12, 20)]
+    assert result["metrics"]["cur_frequency"]["mean"] == [float(second) for second in range(12, 20)]
+
+
+def test_clock_stepping_back_keeps_samples_ordered():
+    history = StateHistory(10)
+    for timestamp in (10.0, 11.0, 5.0, 12.0):
+        history.append(timestamp, sample(timestamp))
+    result = history.query(10, 13, 3, ["cur_frequency"])
+    assert result["timestamps"] == [10.0, 11.0, 12.0]
+    assert result["metrics"]["cur_frequency"]["max"] == [10.0, 11.0, 12.0]
+    assert result["metrics"]["cur_frequency"]["min"] == [10.0, 5.0, 12.0]
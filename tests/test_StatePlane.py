@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from levitree_rwis_api import StatePlane as StatePlaneModule
+from levitree_rwis_api.StatePlane import HEADER_SIZE, SEQUENCE, StatePlane
+from levitree_rwis_api.vfd.VFDTypes import DriveMode, EventKind, VFDEvent, VFDState
+
+
+@pytest.fixture
+def plane():
+    plane = StatePlane.create(f"lvt_test_{os.getpid()}", vfd_slots=2, sensor_slots=1, event_slots=4)
+    plane.format("epoch001", ["pump"], ["level"])
+    yield plane
+    plane.close()
+    plane.unlink()
+
+
+def test_attach_sees_the_formatted_plane(plane):
+    attached = StatePlane.attach(plane.shm.name)
+    try:
+        assert attached.ready and attached.epoch == "epoch001"
+        assert attached.slot_ids() == (["pump"], ["level"])
+    finally:
+        attached.close()
+
+
+def test_vfd_and_sensor_slots_round_trip(plane):
+    state = VFDState(cur_frequency=42.5, tgt_frequency=50, cur_drive_mode=DriveMode.FORWARD,
+                     tgt_drive_mode=DriveMode.FORWARD, output_voltage=230, alarm_code=17).model_dump()
+    plane.write_vfd(0, "pump", 7, state, 2)
+    plane.write_sensor(0, "level", 3, {"value": None, "raw": 1.25, "timestamp": 100.0, "sample_rate": 10.0,
+                                       "jitter": 0.001, "errors": 1})
+    assert plane.read_vfd(0) == (7, state, 2)
+    assert plane.read_sensor(0) == (3, {"value": None, "raw": 1.25, "timestamp": 100.0, "sample_rate": 10.0,
+                                        "jitter": 0.001, "errors": 1})
+
+
+def test_overwritten_events_are_skipped(plane):
+    for id in range(6):
+        plane.write_event(VFDEvent(id=id, vfd_id="pump", timestamp=id, kind=EventKind.DRIVE_MODE,
+                                   drive_mode=DriveMode.STOP, message=f"Event {id}"))
+    assert plane.event_sequence == 6
+    assert plane.read_event(1) is None
+    assert plane.read_event(5).message == "Event 5"
+    assert plane.read_event(5).drive_mode == DriveMode.STOP
+
+
+def test_torn_payload_is_never_returned(plane, monkeypatch):
+    monkeypatch.setattr(StatePlaneModule, "MAX_READ_ATTEMPTS", 10)
+    plane.write_vfd(0, "pump", 1, VFDState(cur_frequency=10).model_dump(), 0)
+    # Part of a payload with a stable, even sequence number, as a reader on a weakly ordered CPU can see it
+    offset = HEADER_SIZE + SEQUENCE.size + 40
+    plane.buf[offset] ^= 0xFF
+    with pytest.raises(TimeoutError):
+        plane.read_vfd(0)
+
+
+def test_ids_must_fit_their_slots(plane):
+    with pytest.raises(ValueError):
+        plane.format("epoch002", ["a", "b", "c"], [])
+    with pytest.raises(ValueError):
+        plane.format("epoch002", ["x" * 33], [])
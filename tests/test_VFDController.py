@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from levitree_rwis_api.vfd.BusScheduler import Priority
+from levitree_rwis_api.vfd.FrenicSimulator import FrenicSimulator
+from levitree_rwis_api.vfd.VFDController import VFDController
+from levitree_rwis_api.vfd.VFDTypes import DriveMode
+
+
+def run_with_drives(test, devices: int = 2, broadcast: bool = False):
+    """Runs `test(controller, simulator)` against simulated drives d1..dN on one bus, without the polling loop."""
+    async def run():
+        simulator = FrenicSimulator(devices, baudrate=0, latency=0.001)
+        url = await simulator.serve_tcp()
+        controller = VFDController()
+        controller.register_bus("default", url, broadcast=broadcast)
+        for slave_id in range(1, devices + 1):
+            controller.register_vfd(slave_id, f"Drive {slave_id}", f"d{slave_id}")
+        controller.buses["default"].initialize()
+        try:
+            return await test(controller, simulator)
+        finally:
+            await simulator.close()
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("broadcast", [False, True])
+def test_group_stop_lands_after_a_queued_single_command(broadcast: bool):
+    async def test(controller: VFDController, simulator: FrenicSimulator):
+        bus = controller.buses["default"]
+        await bus.scheduler.acquire(Priority.POLL)
+        forward = asyncio.create_task(controller.set_drive_mode("d1", DriveMode.FORWARD))
+        await asyncio.sleep(0.01)
+        # Would overtake the forward command on the bus by priority alone
+        stop = asyncio.create_task(controller.set_group_drive_mode(["d1", "d2"], DriveMode.STOP))
+        await asyncio.sleep(0.01)
+        bus.scheduler.release()
+        return await forward, await stop, [simulator.devices[slave_id]["S06"] for slave_id in (1, 2)]
+
+    forward, stop, run_commands = run_with_drives(test, broadcast=broadcast)
+    assert forward == DriveMode.FORWARD
+    assert not any(result.error for result in stop.values())
+    assert run_commands == [0, 0]
+
+
+def test_group_is_only_broadcast_when_enabled():
+    async def test(controller: VFDController, simulator: FrenicSimulator):
+        results = await controller.set_group_drive_mode(["d1", "d2"], DriveMode.FORWARD)
+        return [result.broadcast for result in results.values()], [simulator.devices[slave_id]["S06"] for slave_id in (1, 2)]
+
+    assert run_with_drives(test) == ([False, False], [1, 1])
+    assert run_with_drives(test, broadcast=True) == ([True, True], [1, 1])
+
+
+def test_group_frequency_is_read_back_per_drive():
+    async def test(controller: VFDController, simulator: FrenicSimulator):
+        results = await controller.set_group_frequency(["d1", "d2"], 12.3449)
+        return results, [simulator.devices[slave_id]["S05"] for slave_id in (1, 2)], controller.vfds["d1"].state.tgt_frequency
+
+    results, frequency_commands, target = run_with_drives(test)
+    assert not any(result.error for result in results.values())
+    assert frequency_commands == [1234, 1234]
+    # The target is what the drives were sent, as for a single drive
+    assert target == 12.34
+
+
+def test_failed_broadcast_is_reported_per_drive():
+    async def test(controller: VFDController, simulator: FrenicSimulator):
+        bus = controller.buses["default"]
+
+        async def broadcast_register(address: int, value: int):
+            raise ConnectionResetError("line dropped")
+        bus.broadcast_register = broadcast_register
+        bus.poller.targets["d1"].deadline = bus.poller.targets["d2"].deadline = float("inf")
+        results = await controller.set_group_drive_mode(["d1", "d2"], DriveMode.FORWARD)
+        return results, [bus.poller.targets[vfd_id].deadline for vfd_id in ("d1", "d2")]
+
+    results, deadlines = run_with_drives(test, broadcast=True)
+    assert set(results) == {"d1", "d2"}
+    for result in results.values():
+        assert result.error and result.broadcast
+        assert result.message == "ConnectionResetError('line dropped'), read back 0"
+    # The drives are still polled right away
+    assert all(deadline != float("inf") for deadline in deadlines)
@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+
+from levitree_rwis_api.vfd.WriteCoalescer import WriteCoalescer
+
+
+def never_abandon(info):
+    return False, 0
+
+
+class Register:
+    """Register writer that records every value written, failing the first `failures` attempts."""
+
+    def __init__(self, failures: int = 0, delay: float = 0.01):
+        self.written = []
+        self.attempts = []
+        self.failures = failures
+        self.delay = delay
+
+    async def __call__(self, value: int):
+        self.attempts.append(value)
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise OSError("no response")
+        self.written.append(value)
+
+
+def test_values_collapse_while_a_write_is_in_flight():
+    async def run():
+        coalescer = WriteCoalescer(never_abandon)
+        register = Register()
+        first = asyncio.create_task(coalescer.write("S05", 1000, register))
+        await asyncio.sleep(0)
+        results = await asyncio.gather(first, *[coalescer.write("S05", value, register) for value in (2000, 3000, 4000)])
+        return results, register, coalescer
+
+    results, register, coalescer = asyncio.run(run())
+    assert register.written == [1000, 4000]
+    assert results == [1000, 4000, 4000, 4000]
+    assert coalescer.coalesced == 2
+
+
+def test_confirmed_value_is_skipped_until_it_expires():
+    async def run():
+        coalescer = WriteCoalescer(never_abandon, confirm_ttl=0.05)
+        register = Register(delay=0)
+        await coalescer.write("S05", 1000, register)
+        await coalescer.write("S05", 1000, register)
+        await coalescer.write("S05", 1000, register, skip_confirmed=False)
+        await asyncio.sleep(0.06)
+        await coalescer.write("S05", 1000, register)
+        return register, coalescer
+
+    register, coalescer = asyncio.run(run())
+    assert register.written == [1000, 1000, 1000]
+    assert coalescer.skipped == 1
+
+
+def test_failed_write_is_retried():
+    async def run():
+        register = Register(failures=2)
+        return await WriteCoalescer(never_abandon).write("S05", 1000, register), register
+
+    result, register = asyncio.run(run())
+    assert result == 1000
+    assert register.attempts == [1000, 1000, 1000]
+
+
+def test_abandoned_write_raises():
+    async def run():
+        coalescer = WriteCoalescer(lambda info: (info.fails >= 2, 0))
+        await coalescer.write("S05", 1000, Register(failures=5))
+
+    with pytest.raises(OSError):
+        asyncio.run(run())
+
+
+def test_failing_write_is_superseded_by_a_newer_value():
+    async def run():
+        coalescer = WriteCoalescer(never_abandon)
+        register = Register(failures=1)
+        first = asyncio.create_task(coalescer.write("S05", 1000, register))
+        await asyncio.sleep(0)
+        return await asyncio.gather(first, coalescer.write("S05", 2000, register)), register
+
+    results, register = asyncio.run(run())
+    assert results == [2000, 2000]
+    assert register.attempts == [1000, 2000]
+
+
+def test_pending_stop_is_never_coalesced_away():
+    async def run():
+        coalescer = WriteCoalescer(never_abandon)
+        register = Register()
+        running = asyncio.create_task(coalescer.write("S06", 1, register))
+        await asyncio.sleep(0)
+        results = await asyncio.gather(running, coalescer.write("S06", 0, register, barrier=True),
+                                       coalescer.write("S06", 1, register), coalescer.write("S06", 2, register))
+        return results, register
+
+    results, register = asyncio.run(run())
+    assert register.written == [1, 0, 2]
+    assert results == [1, 0, 2, 2]
+
+
+def test_failing_stop_is_retried_even_when_superseded():
+    async def run():
+        coalescer = WriteCoalescer(never_abandon)
+        register = Register(failures=2)
+        stop = asyncio.create_task(coalescer.write("S06", 0, register, barrier=True))
+        await asyncio.sleep(0)
+        return await asyncio.gather(stop, coalescer.write("S06", 1, register)), register
+
+    results, register = asyncio.run(run())
+    assert results == [0, 1]
+    assert register.attempts == [0, 0, 0, 1]
+
+
+def test_cancelled_drain_fails_waiting_callers():
+    async def run():
+        coalescer = WriteCoalescer(never_abandon)
+        register = Register(delay=60)
+        waiting = [asyncio.create_task(coalescer.write("S05", value, register)) for value in (1000, 2000)]
+        await asyncio.sleep(0.01)
+        coalescer.slots["S05"].task.cancel()
+        results = await asyncio.wait_for(asyncio.gather(*waiting, return_exceptions=True), 1)
+        return results, coalescer.slots["S05"]
+
+    results, slot = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert slot.task is None and not slot.pending
+
+
+def test_write_many_is_ordered_after_earlier_writes():
+    async def run():
+        coalescer = WriteCoalescer(never_abandon)
+        register = Register()
+        in_flight = asyncio.create_task(coalescer.write("a", 1, register))
+        await asyncio.sleep(0)
+        # Not on the bus yet, superseded by the group write
+        superseded = asyncio.create_task(coalescer.write("a", 2, register))
+        await asyncio.sleep(0)
+        order = []
+
+        async def write_group():
+            order.append(list(register.written))
+            return {"b": OSError("no response")}
+
+        errors = await coalescer.write_many({"a": 0, "b": 0}, write_group)
+        later = await coalescer.write("a", 3, register)
+        return await in_flight, await superseded, errors, order, later, register, coalescer
+
+    in_flight, superseded, errors, order, later, register, coalescer = asyncio.run(run())
+    assert order == [[1]]
+    assert (in_flight, superseded, later) == (1, 0, 3)
+    assert list(errors) == ["b"]
+    assert register.written == [1, 3]
+    assert coalescer.slots["a"].confirmed == 3 and coalescer.slots["b"].confirmed is None